@@ -0,0 +1,70 @@
+"""
+Benchmarks concurrent generation through the sequential llm_model path against the continuous batching engine.
+Reports aggregate tokens/sec and per request latency.
+
+Run from the backend directory:
+    python -m benchmarks.benchmark_batching --requests 8 --max-tokens 128
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List, Dict, Any
+
+from models.llm_model import generate_completion
+
+PROMPTS=[
+    "Explain how a FAISS flat index answers a nearest neighbour query.",
+    "Summarise the benefits of retrieval augmented generation in three bullet points.",
+    "What is the difference between precision and recall?",
+    "Describe k-means clustering to a college student.",
+    "Why do large language models need a context window limit?",
+    "List three ways to reduce latency in a web API.",
+    "What does a sentence embedding represent?",
+    "How does continuous batching improve LLM throughput?",
+]
+
+def _wrap(prompt: str)->str:
+    return f"<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
+
+async def _timed(prompt: str, max_tokens: int, use_batching: bool)->Dict[str, Any]:
+    start=time.perf_counter()
+    response=await generate_completion(_wrap(prompt), max_tokens=max_tokens, temperature=0.0, use_batching=use_batching)
+    return {"latency": time.perf_counter()-start, "tokens": response["usage"]["completion_tokens"]}
+
+async def _run(num_requests: int, max_tokens: int, use_batching: bool)->Dict[str, float]:
+    prompts=[PROMPTS[i%len(PROMPTS)] for i in range(num_requests)]
+    start=time.perf_counter()
+    results: List[Dict[str, Any]]=await asyncio.gather(*[_timed(p, max_tokens, use_batching) for p in prompts])
+    wall=time.perf_counter()-start
+    latencies=sorted(r["latency"] for r in results)
+    total_tokens=sum(r["tokens"] for r in results)
+    return {
+        "wall_seconds": wall,
+        "completion_tokens": total_tokens,
+        "tokens_per_second": total_tokens/wall if wall>0 else 0.0,
+        "latency_p50": statistics.median(latencies),
+        "latency_p95": latencies[min(len(latencies)-1, int(0.95*len(latencies)))],
+        "latency_max": latencies[-1],
+    }
+
+def _print(name: str, stats: Dict[str, float])->None:
+    print(f"{name:<12} {stats['wall_seconds']:>8.2f}s  {stats['completion_tokens']:>6} tok  "
+          f"{stats['tokens_per_second']:>8.2f} tok/s  p50 {stats['latency_p50']:.2f}s  "
+          f"p95 {stats['latency_p95']:.2f}s  max {stats['latency_max']:.2f}s")
+
+async def main()->None:
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=8, help="number of concurrent requests")
+    parser.add_argument("--max-tokens", type=int, default=128)
+    args=parser.parse_args()
+
+    # warm up both paths so model load and context creation are not measured
+    await generate_completion(_wrap("Hi"), max_tokens=4, temperature=0.0, use_batching=False)
+    await generate_completion(_wrap("Hi"), max_tokens=4, temperature=0.0, use_batching=True)
+
+    _print("sequential", await _run(args.requests, args.max_tokens, use_batching=False))
+    _print("batched", await _run(args.requests, args.max_tokens, use_batching=True))
+
+if __name__=="__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""
+Benchmarks image lookups the way the image router used to run them (blocking pymongo calls inside async handlers)
+against the thread pool in database/mongodb_client. Reports lookup latency, throughput, how long the event loop
+was stalled, and full scans with and without the image projection.
+
+Needs a MongoDB server to stand in for the real one, e.g. docker run -p 27017:27017 mongo.
+It seeds a throwaway collection and drops it afterwards. Run from the backend directory:
+    python -m benchmarks.benchmark_mongodb --uri mongodb://localhost:27017 --requests 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import List, Dict, Any, Callable, Awaitable
+
+from pymongo import MongoClient
+
+from core.config import MONGO_MAX_POOL_SIZE, MONGO_EXECUTOR_WORKERS, MONGO_QUERY_TIMEOUT_MS
+from database import mongodb_client
+
+def _seed(collection: Any, num_documents: int)->None:
+    collection.drop()
+    collection.insert_many([
+        {
+            "image_name": f"image_{i}.png",
+            "image_path": f"/data/images/image_{i}.png",
+            "labels": [f"label_{i%17}", f"label_{i%31}"],
+            # stands in for the fields real documents carry that the backend never reads
+            "exif": {"camera": "benchmark", "notes": "x"*512},
+        }
+        for i in range(num_documents)
+    ])
+    collection.create_index("image_name")
+
+async def _loop_stall(stop: asyncio.Event, stalls: List[float])->None:
+    '''
+    Records how late a 1 ms timer fires, a blocked event loop shows up as large values
+    '''
+    while not stop.is_set():
+        start=time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter()-start-0.001)
+
+async def _run(lookup: Callable[[str], Awaitable[Any]], num_documents: int, num_requests: int, concurrency: int)->Dict[str, float]:
+    semaphore=asyncio.Semaphore(concurrency)
+    latencies: List[float]=[]
+
+    async def timed(i: int)->None:
+        async with semaphore:
+            start=time.perf_counter()
+            await lookup(f"image_{(i*7919)%num_documents}.png")
+            latencies.append(time.perf_counter()-start)
+
+    stop=asyncio.Event()
+    stalls: List[float]=[]
+    ticker=asyncio.create_task(_loop_stall(stop, stalls))
+    start=time.perf_counter()
+    await asyncio.gather(*[timed(i) for i in range(num_requests)])
+    wall=time.perf_counter()-start
+    stop.set()
+    await ticker
+
+    latencies.sort()
+    return {
+        "wall_seconds": wall,
+        "requests_per_second": num_requests/wall if wall>0 else 0.0,
+        "latency_p50": statistics.median(latencies),
+        "latency_p95": latencies[min(len(latencies)-1, int(0.95*len(latencies)))],
+        "loop_stall_max": max(stalls, default=0.0),
+    }
+
+def _print(name: str, stats: Dict[str, float])->None:
+    print(f"{name:<10} {stats['wall_seconds']:>7.2f}s  {stats['requests_per_second']:>8.1f} req/s  "
+          f"p50 {stats['latency_p50']*1000:.1f}ms  p95 {stats['latency_p95']*1000:.1f}ms  "
+          f"max loop stall {stats['loop_stall_max']*1000:.1f}ms")
+
+def _time(fn: Callable[[], Any])->float:
+    start=time.perf_counter()
+    fn()
+    return time.perf_counter()-start
+
+async def main()->None:
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--documents", type=int, default=2000, help="documents seeded into the benchmark collection")
+    parser.add_argument("--requests", type=int, default=500, help="image lookups per run")
+    parser.add_argument("--concurrency", type=int, default=50, help="lookups in flight at once")
+    args=parser.parse_args()
+
+    client=MongoClient(args.uri, maxPoolSize=MONGO_MAX_POOL_SIZE, serverSelectionTimeoutMS=5000)
+    collection=client["image_benchmark"][f"images_{os.getpid()}"]
+    print(f"Seeding {args.documents} documents into {collection.full_name}")
+    _seed(collection, args.documents)
+    projection={"_id": 0, **mongodb_client.IMAGE_PROJECTION}
+
+    async def blocking(name: str)->Any:
+        return collection.find_one({"image_name": name})
+
+    async def pooled(name: str)->Any:
+        return await mongodb_client.run_in_executor(collection.find_one, {"image_name": name}, projection, max_time_ms=MONGO_QUERY_TIMEOUT_MS)
+
+    try:
+        print(f"{args.requests} lookups, {args.concurrency} concurrent, pool {MONGO_MAX_POOL_SIZE} connections / {MONGO_EXECUTOR_WORKERS} threads")
+        _print("blocking", await _run(blocking, args.documents, args.requests, args.concurrency))
+        _print("executor", await _run(pooled, args.documents, args.requests, args.concurrency))
+
+        full=_time(lambda: list(collection.find({})))
+        projected=_time(lambda: list(collection.find({}, mongodb_client.IMAGE_PROJECTION)))
+        print(f"full scan {full:.3f}s, projected scan {projected:.3f}s")
+    finally:
+        collection.drop()
+        client.close()
+        await mongodb_client.close_mongodb_connection()
+
+if __name__=="__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+Benchmarks answering RAG questions in another language.
+Compares the fused flow (one generation with the answer language in the prompt) against the two step flow
+(English answer, then translator_service), and reports how many fused answers needed the fallback translation.
+
+The translation cache is disabled so every run translates. Run from the backend directory:
+    python -m benchmarks.benchmark_output_language --language Hindi --max-tokens 256
+"""
+import os
+os.environ["TRANSLATION_CACHE_ENABLED"]="0"
+
+import argparse
+import asyncio
+import time
+from typing import Dict, Any
+
+from models import llm_model
+from models.llm_model import generate_completion
+from services import language_id, translator_service
+from services.rag_service import _build_prompt
+from core.config import RAG_LANGUAGE_MIN_SCRIPT_SHARE
+from benchmarks.benchmark_speculative import RAG_CASES
+
+async def _answer(context: str, question: str, max_tokens: int, output_language: str)->Dict[str, Any]:
+    response=await generate_completion(
+        _build_prompt(context, "", question, output_language), max_tokens=max_tokens, temperature=0.0, endpoint="rag",
+    )
+    return {"text": response["choices"][0]["text"], "completion_tokens": response["usage"]["completion_tokens"]}
+
+async def _two_step(max_tokens: int, language: str)->Dict[str, Any]:
+    total_tokens=0
+    start=time.perf_counter()
+    for context, question in RAG_CASES:
+        answer=await _answer(context, question, max_tokens, "English")
+        total_tokens+=answer["completion_tokens"]
+        await translator_service.translate_text(answer["text"], language)
+    return {"wall_seconds": time.perf_counter()-start, "answer_tokens": total_tokens}
+
+async def _fused(max_tokens: int, language: str)->Dict[str, Any]:
+    total_tokens=0
+    fallbacks=0
+    start=time.perf_counter()
+    for context, question in RAG_CASES:
+        answer=await _answer(context, question, max_tokens, language)
+        total_tokens+=answer["completion_tokens"]
+        share=language_id.language_share(answer["text"], language)
+        if share is not None and share<RAG_LANGUAGE_MIN_SCRIPT_SHARE:
+            fallbacks+=1
+            await translator_service.translate_text(answer["text"], language)
+    return {"wall_seconds": time.perf_counter()-start, "answer_tokens": total_tokens, "fallbacks": fallbacks}
+
+async def main()->None:
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--language", default="Hindi")
+    parser.add_argument("--max-tokens", type=int, default=256)
+    args=parser.parse_args()
+
+    await llm_model.wait_for_llm_model()
+    await generate_completion("Hi", max_tokens=4, temperature=0.0)
+
+    two_step=await _two_step(args.max_tokens, args.language)
+    fused=await _fused(args.max_tokens, args.language)
+
+    cases=len(RAG_CASES)
+    print(f"two step  {two_step['wall_seconds']:>8.2f} s  {two_step['wall_seconds']/cases:>6.2f} s/question  {two_step['answer_tokens']:>6} answer tok")
+    print(f"fused     {fused['wall_seconds']:>8.2f} s  {fused['wall_seconds']/cases:>6.2f} s/question  {fused['answer_tokens']:>6} answer tok  "
+          f"(fallback translations {fused['fallbacks']}/{cases})")
+    if fused["wall_seconds"]>0:
+        print(f"speedup   {two_step['wall_seconds']/fused['wall_seconds']:.2f}x")
+
+if __name__=="__main__":
+    asyncio.run(main())
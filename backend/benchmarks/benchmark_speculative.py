@@ -0,0 +1,146 @@
+"""
+Benchmarks speculative decoding on a fixed set of RAG prompts.
+Reports tokens/sec with and without the configured draft model, and the draft acceptance rate.
+
+With --prompt-eval it instead measures the cost the speculative context puts on the other endpoints: the
+prompt evaluation of a long prompt sent as the evaluator endpoint (not speculative), once in a process with
+LLM_SPECULATIVE_MODE=off and once with the configured mode, which loads the model with logits_all.
+
+Requires LLM_SPECULATIVE_MODE=prompt_lookup (or draft with LLM_DRAFT_MODEL_PATH). Run from the backend directory:
+    LLM_SPECULATIVE_MODE=prompt_lookup python -m benchmarks.benchmark_speculative --max-tokens 256
+    LLM_SPECULATIVE_MODE=prompt_lookup python -m benchmarks.benchmark_speculative --prompt-eval --prompt-tokens 6000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Any
+
+from models import llm_model
+from models.llm_model import generate_completion, get_speculative_stats
+from core.config import LLM_SPECULATIVE_MODE
+from services.rag_service import _build_prompt
+
+RAG_CASES=[
+    (
+        "FAISS is a library for efficient similarity search and clustering of dense vectors. "
+        "An IndexFlatL2 performs exhaustive search using the euclidean distance, comparing the query against every stored vector. "
+        "Because it stores the full vectors, it returns exact results but its search time grows linearly with the number of vectors.",
+        "How does an IndexFlatL2 search work and what does it cost?",
+    ),
+    (
+        "The summarisation pipeline splits a document into chunks of 500 characters with an overlap of 50 characters. "
+        "Each chunk is embedded with all-MiniLM-L6-v2. K-means clustering groups the chunk vectors, and the chunk nearest to each "
+        "centroid is summarised by the LLM. The partial summaries are then collated into a final summary.",
+        "Describe the steps of the summarisation pipeline.",
+    ),
+    (
+        "Images are stored in MongoDB with an image_name, an image_path and a list of labels. "
+        "At startup the label text of every image is embedded and added to a FAISS index. "
+        "When a question is asked, the question is embedded and the three closest images within a distance of 1.4 are returned.",
+        "How are relevant images found for a question?",
+    ),
+    (
+        "The evaluation assistant accepts a context document and a metrics JSON file. "
+        "The context document is chunked and indexed, while the metrics are kept in memory. "
+        "Each question retrieves the three most similar context chunks and combines them with the metrics in one prompt.",
+        "What does the evaluation assistant do with the uploaded files?",
+    ),
+]
+
+async def _run(max_tokens: int, speculative: bool)->Dict[str, Any]:
+    total_tokens=0
+    start=time.perf_counter()
+    for context, question in RAG_CASES:
+        response=await generate_completion(
+            _build_prompt(context, "", question), max_tokens=max_tokens, temperature=0.0,
+            use_batching=False, speculative=speculative,
+        )
+        total_tokens+=response["usage"]["completion_tokens"]
+    wall=time.perf_counter()-start
+    return {"wall_seconds": wall, "completion_tokens": total_tokens, "tokens_per_second": total_tokens/wall if wall>0 else 0.0}
+
+async def _prompt_eval(prompt_tokens: int, repeats: int)->Dict[str, Any]:
+    '''
+    Seconds to the first token of a prompt_tokens long prompt on the evaluator endpoint, which is almost all prompt evaluation
+    '''
+    model=await llm_model.wait_for_llm_model()
+    context=" ".join(case_context for case_context, _ in RAG_CASES)
+    contexts=[context]
+    while len(model.tokenize(" ".join(contexts).encode("utf-8")))<prompt_tokens:
+        contexts.append(context)
+    await generate_completion("Hi", max_tokens=1, temperature=0.0, use_batching=False, endpoint="evaluator")
+
+    seconds=[]
+    for run in range(repeats):
+        # a different first line each run, so the prompt isn't served from the KV cache of the previous one
+        prompt=f"Run {run}.\n"+_build_prompt(" ".join(contexts), "", RAG_CASES[0][1])
+        start=time.perf_counter()
+        await generate_completion(prompt, max_tokens=1, temperature=0.0, use_batching=False, endpoint="evaluator")
+        seconds.append(time.perf_counter()-start)
+    tokens=len(model.tokenize(prompt.encode("utf-8")))
+    average=sum(seconds)/len(seconds)
+    return {"mode": LLM_SPECULATIVE_MODE, "prompt_tokens": tokens, "seconds": average, "tokens_per_second": tokens/average if average>0 else 0.0}
+
+def _prompt_eval_in_process(mode: str, prompt_tokens: int, repeats: int)->Dict[str, Any]:
+    '''
+    The speculative mode is fixed when the model loads, so each mode is measured in its own process
+    '''
+    env=dict(os.environ, LLM_SPECULATIVE_MODE=mode, LLM_BATCHING_ENABLED="0")
+    completed=subprocess.run(
+        [sys.executable, "-m", "benchmarks.benchmark_speculative", "--prompt-eval-child", "--prompt-tokens", str(prompt_tokens), "--repeats", str(repeats)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def _compare_prompt_eval(prompt_tokens: int, repeats: int)->None:
+    if LLM_SPECULATIVE_MODE=="off":
+        print("LLM_SPECULATIVE_MODE is off, set it to prompt_lookup or draft to measure its prompt evaluation cost")
+        return
+    off=_prompt_eval_in_process("off", prompt_tokens, repeats)
+    on=_prompt_eval_in_process(LLM_SPECULATIVE_MODE, prompt_tokens, repeats)
+    for result in (off, on):
+        print(f"evaluator prompt, mode {result['mode']:<13} {result['prompt_tokens']:>6} tok  {result['seconds']:>7.2f} s  {result['tokens_per_second']:>8.2f} tok/s")
+    if off["seconds"]>0:
+        print(f"slowdown with logits_all  {on['seconds']/off['seconds']:.2f}x")
+
+async def main()->None:
+    parser=argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--prompt-eval", action="store_true", help="measure prompt evaluation of a non-speculative endpoint with the mode off and on")
+    parser.add_argument("--prompt-eval-child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--prompt-tokens", type=int, default=6000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args=parser.parse_args()
+
+    if args.prompt_eval:
+        _compare_prompt_eval(args.prompt_tokens, args.repeats)
+        return
+    if args.prompt_eval_child:
+        print(json.dumps(await _prompt_eval(args.prompt_tokens, args.repeats)))
+        return
+
+    await llm_model.wait_for_llm_model()
+    if llm_model.draft_model is None:
+        print("LLM_SPECULATIVE_MODE is off, set it to prompt_lookup or draft to benchmark speculative decoding")
+        return
+
+    await generate_completion("Hi", max_tokens=4, temperature=0.0, use_batching=False, speculative=False)
+
+    baseline=await _run(args.max_tokens, speculative=False)
+    llm_model.draft_model.reset_stats()
+    speculative=await _run(args.max_tokens, speculative=True)
+    acceptance=get_speculative_stats()
+
+    print(f"baseline     {baseline['completion_tokens']:>6} tok  {baseline['tokens_per_second']:>8.2f} tok/s")
+    print(f"speculative  {speculative['completion_tokens']:>6} tok  {speculative['tokens_per_second']:>8.2f} tok/s  "
+          f"({acceptance['mode']}, accepted {acceptance['accepted_tokens']}/{acceptance['drafted_tokens']} drafted tokens, "
+          f"rate {acceptance['acceptance_rate']:.2%})")
+    if baseline["tokens_per_second"]>0:
+        print(f"speedup      {speculative['tokens_per_second']/baseline['tokens_per_second']:.2f}x")
+
+if __name__=="__main__":
+    asyncio.run(main())
@@ -0,0 +1,198 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PERSISTENT_DATA_DIR="persistent_data"
+
+def _env_bool(name: str, default: bool)->bool:
+    '''
+    Reads a boolean flag from the environment, accepting 1/0, true/false, yes/no
+    '''
+    value=os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# --- Answer cache for the RAG chatbot ---
+ANSWER_CACHE_ENABLED=_env_bool("ANSWER_CACHE_ENABLED", True)
+ANSWER_CACHE_SEMANTIC=_env_bool("ANSWER_CACHE_SEMANTIC", False)
+ANSWER_CACHE_SIMILARITY_THRESHOLD=float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", 0.92))
+ANSWER_CACHE_TTL_SECONDS=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 24*60*60))
+ANSWER_CACHE_MAX_ENTRIES=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+ANSWER_CACHE_PATH=os.path.join(PERSISTENT_DATA_DIR, "answer_cache.json")
+
+# --- Prompt packing ---
+# upper bound on prompt tokens, further capped by n_ctx minus the requested max_tokens
+CONTEXT_TOKEN_BUDGET=int(os.getenv("CONTEXT_TOKEN_BUDGET", 6144))
+CONTEXT_SAFETY_MARGIN=int(os.getenv("CONTEXT_SAFETY_MARGIN", 64))
+# share of the evaluator prompt budget the metrics block may occupy before it is truncated
+EVAL_METRICS_TOKEN_SHARE=float(os.getenv("EVAL_METRICS_TOKEN_SHARE", 0.6))
+
+# --- Evaluator metrics retrieval ---
+# metrics files above this size are parsed incrementally with ijson (when installed) instead of json.load
+METRICS_STREAM_THRESHOLD_BYTES=int(os.getenv("METRICS_STREAM_THRESHOLD_BYTES", 20*1024*1024))
+# metric records retrieved per question by embedding similarity, keyword matches are added on top
+METRICS_RETRIEVAL_TOP_K=int(os.getenv("METRICS_RETRIEVAL_TOP_K", 40))
+# records embedded at upload, beyond this very large files are searched by keyword only
+METRICS_MAX_EMBEDDED_RECORDS=int(os.getenv("METRICS_MAX_EMBEDDED_RECORDS", 20000))
+
+# --- Evaluation workspaces ---
+# each workspace keeps its own context index and metrics, persisted here and reloaded on demand
+EVAL_WORKSPACES_DIR=os.path.join(PERSISTENT_DATA_DIR, "eval_workspaces")
+# workspaces kept in memory, least recently used ones are unloaded (not deleted) above this
+EVAL_WORKSPACE_MEMORY_MB=float(os.getenv("EVAL_WORKSPACE_MEMORY_MB", 512))
+
+# --- LLM generation ---
+# continuous batching of concurrent generations in a second llama context, opt in
+LLM_BATCHING_ENABLED=_env_bool("LLM_BATCHING_ENABLED", False)
+LLM_BATCH_MAX_SEQUENCES=int(os.getenv("LLM_BATCH_MAX_SEQUENCES", 4))
+# KV cache size shared by all batched sequences
+LLM_BATCH_N_CTX=int(os.getenv("LLM_BATCH_N_CTX", 16384))
+LLM_BATCH_N_BATCH=int(os.getenv("LLM_BATCH_N_BATCH", 512))
+
+# --- Speculative decoding ---
+# off, prompt_lookup (drafts by matching n-grams of the prompt) or draft (small GGUF model at LLM_DRAFT_MODEL_PATH)
+# any mode other than off loads the main model with logits_all, which allocates an n_ctx x n_vocab logits buffer
+LLM_SPECULATIVE_MODE=os.getenv("LLM_SPECULATIVE_MODE", "off").strip().lower()
+LLM_SPECULATIVE_NUM_PRED_TOKENS=int(os.getenv("LLM_SPECULATIVE_NUM_PRED_TOKENS", 10))
+LLM_DRAFT_MODEL_PATH=os.getenv("LLM_DRAFT_MODEL_PATH")
+# endpoints that decode speculatively, the others decode normally (and can use the batch engine).
+# The logits_all context is shared, so while LLM_SPECULATIVE_MODE isn't off every request on the sequential path
+# (all endpoints unless LLM_BATCHING_ENABLED) computes full vocabulary logits for each prompt token, which slows
+# prompt evaluation of long prompts on the endpoints not listed here as well. The batch engine has its own context
+# and isn't affected. benchmark_speculative --prompt-eval measures this cost
+LLM_SPECULATIVE_ENDPOINTS={e.strip() for e in os.getenv("LLM_SPECULATIVE_ENDPOINTS", "rag").split(",") if e.strip()}
+
+# --- Startup ---
+# run a one token generation after loading so the first real request doesn't pay for it
+LLM_WARMUP=_env_bool("LLM_WARMUP", True)
+# how long a request waits for the LLM to finish loading before failing
+LLM_LOAD_WAIT_SECONDS=float(os.getenv("LLM_LOAD_WAIT_SECONDS", 600))
+
+# --- Summarizer ---
+# map phase generations in flight at once across all summarization requests, keeps room for chat
+SUMMARIZER_MAX_CONCURRENCY=int(os.getenv("SUMMARIZER_MAX_CONCURRENCY", 2))
+# auto, kmeans (scikit-learn), minibatch (scikit-learn MiniBatchKMeans) or faiss
+SUMMARIZER_CLUSTER_BACKEND=os.getenv("SUMMARIZER_CLUSTER_BACKEND", "auto").strip().lower()
+# chunk count above which auto switches from KMeans to FAISS k-means
+SUMMARIZER_LARGE_DOC_THRESHOLD=int(os.getenv("SUMMARIZER_LARGE_DOC_THRESHOLD", 2000))
+# reduce phase: partial summaries are grouped into prompts of at most this many tokens and summarised
+# again, level by level, until what is left fits the final collation prompt
+SUMMARIZER_REDUCE_TOKEN_BUDGET=int(os.getenv("SUMMARIZER_REDUCE_TOKEN_BUDGET", 3072))
+SUMMARIZER_REDUCE_MAX_TOKENS=int(os.getenv("SUMMARIZER_REDUCE_MAX_TOKENS", 300))
+# map and reduce results of unfinished runs, so an interrupted summarization resumes where it stopped
+SUMMARIZER_CHECKPOINT_DIR=os.path.join(PERSISTENT_DATA_DIR, "summary_checkpoints")
+
+# --- Summary cache ---
+# final summaries keyed by document hash and parameters, map summaries keyed by chunk hash so they
+# are reused when the same document is summarised with different parameters
+SUMMARY_CACHE_ENABLED=_env_bool("SUMMARY_CACHE_ENABLED", True)
+SUMMARY_CACHE_MAX_ENTRIES=int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", 200))
+SUMMARY_PARTIALS_MAX_ENTRIES=int(os.getenv("SUMMARY_PARTIALS_MAX_ENTRIES", 20000))
+SUMMARY_CACHE_PATH=os.path.join(PERSISTENT_DATA_DIR, "summary_cache.json")
+SUMMARY_PARTIALS_PATH=os.path.join(PERSISTENT_DATA_DIR, "summary_partials.json")
+
+# --- Summary jobs ---
+# uploaded files, state and results of /summarizer/jobs/, unfinished jobs resume on restart
+SUMMARY_JOBS_DIR=os.path.join(PERSISTENT_DATA_DIR, "summary_jobs")
+# jobs summarised at the same time, the rest wait in the queue
+SUMMARY_JOB_WORKERS=int(os.getenv("SUMMARY_JOB_WORKERS", 1))
+# progress events kept per running job for event streams that connect late, the latest progress is also in the job record
+SUMMARY_JOB_MAX_EVENTS=int(os.getenv("SUMMARY_JOB_MAX_EVENTS", 200))
+
+# --- Image index sync ---
+# seconds between incremental syncs of the image index with MongoDB, 0 only syncs at startup
+IMAGE_SYNC_INTERVAL_SECONDS=float(os.getenv("IMAGE_SYNC_INTERVAL_SECONDS", 60))
+# sync as soon as a change stream reports a change (replica sets only), polling stays as the fallback
+IMAGE_SYNC_USE_CHANGE_STREAM=_env_bool("IMAGE_SYNC_USE_CHANGE_STREAM", True)
+# documents fetched and embedded per batch during a sync
+IMAGE_SYNC_BATCH_SIZE=int(os.getenv("IMAGE_SYNC_BATCH_SIZE", 500))
+# full syncs are skipped while the collection fingerprint is unchanged, but the whole collection is compared at least this often, 0 never forces it
+IMAGE_SYNC_FULL_SCAN_SECONDS=float(os.getenv("IMAGE_SYNC_FULL_SCAN_SECONDS", 3600))
+
+# --- MongoDB client ---
+# connections pymongo keeps open, and worker threads running queries off the event loop
+MONGO_MAX_POOL_SIZE=int(os.getenv("MONGO_MAX_POOL_SIZE", 20))
+MONGO_EXECUTOR_WORKERS=int(os.getenv("MONGO_EXECUTOR_WORKERS", 8))
+# fail fast instead of hanging a request when the server is down or slow
+MONGO_SERVER_SELECTION_TIMEOUT_MS=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS=int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000))
+# server side limit for single image lookups
+MONGO_QUERY_TIMEOUT_MS=int(os.getenv("MONGO_QUERY_TIMEOUT_MS", 2000))
+
+# --- Image metadata cache ---
+# seconds an unknown image name or missing file is remembered before MongoDB and the disk are asked again
+IMAGE_NEGATIVE_CACHE_TTL_SECONDS=float(os.getenv("IMAGE_NEGATIVE_CACHE_TTL_SECONDS", 30))
+# unknown names remembered at most, oldest are forgotten first
+IMAGE_NEGATIVE_CACHE_MAX_ENTRIES=int(os.getenv("IMAGE_NEGATIVE_CACHE_MAX_ENTRIES", 10000))
+# seconds cached file info is served before the file's size and mtime are checked again,
+# index syncs and ingests drop changed entries right away
+IMAGE_FILE_REVALIDATE_SECONDS=float(os.getenv("IMAGE_FILE_REVALIDATE_SECONDS", 5))
+
+# --- Image serving ---
+# browsers keep served images this long, then revalidate with the ETag
+IMAGE_CACHE_MAX_AGE_SECONDS=int(os.getenv("IMAGE_CACHE_MAX_AGE_SECONDS", 7*24*60*60))
+# ?size=thumb variants, pre-generated in the background after each image index sync
+IMAGE_THUMBNAIL_DIR=os.path.join(PERSISTENT_DATA_DIR, "thumbnails")
+IMAGE_THUMBNAIL_SIZE=int(os.getenv("IMAGE_THUMBNAIL_SIZE", 320))
+IMAGE_THUMBNAIL_PREGENERATE=_env_bool("IMAGE_THUMBNAIL_PREGENERATE", True)
+
+# --- Image index persistence ---
+# the image index and its document mapping, reloaded at startup so only documents changed since are embedded
+IMAGE_INDEX_DIR=os.path.join(PERSISTENT_DATA_DIR, "image_index")
+
+# --- Image ingestion ---
+# uploaded images are written here, the stored image_path is absolute
+IMAGE_UPLOAD_DIR=os.path.abspath(os.getenv("IMAGE_UPLOAD_DIR", os.path.join(PERSISTENT_DATA_DIR, "images")))
+# files accepted by one /images/ingest/ request
+IMAGE_INGEST_MAX_FILES=int(os.getenv("IMAGE_INGEST_MAX_FILES", 500))
+# label texts per sentence transformer forward pass when embedding images
+IMAGE_EMBED_BATCH_SIZE=int(os.getenv("IMAGE_EMBED_BATCH_SIZE", 128))
+
+# --- Translation ---
+# translations keyed by text hash, target language and model
+TRANSLATION_CACHE_ENABLED=_env_bool("TRANSLATION_CACHE_ENABLED", True)
+TRANSLATION_CACHE_MAX_ENTRIES=int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", 5000))
+TRANSLATION_CACHE_PATH=os.path.join(PERSISTENT_DATA_DIR, "translation_cache.json")
+# share of letters that must be in the target language's script for text to be returned untranslated
+LANGUAGE_ID_MIN_SCRIPT_SHARE=float(os.getenv("LANGUAGE_ID_MIN_SCRIPT_SHARE", 0.9))
+# longest piece of text translated in one generation, longer texts are split at block and sentence boundaries
+TRANSLATION_SEGMENT_TOKENS=int(os.getenv("TRANSLATION_SEGMENT_TOKENS", 256))
+# output tokens allowed per source token, Indic scripts take several times more tokens than the English source
+TRANSLATION_OUTPUT_TOKEN_RATIO=float(os.getenv("TRANSLATION_OUTPUT_TOKEN_RATIO", 3.0))
+# segments generated at the same time
+TRANSLATION_MAX_CONCURRENCY=int(os.getenv("TRANSLATION_MAX_CONCURRENCY", 4))
+
+# --- RAG answer language ---
+# answers asked for in another language are generated in it directly, an answer that comes back mostly
+# in another script (judged locally, see services/language_id) is translated as a fallback
+RAG_LANGUAGE_FALLBACK_ENABLED=_env_bool("RAG_LANGUAGE_FALLBACK_ENABLED", True)
+# share of letters in the target language's script below which the fallback translation runs,
+# lower than LANGUAGE_ID_MIN_SCRIPT_SHARE since answers keep English names and terms
+RAG_LANGUAGE_MIN_SCRIPT_SHARE=float(os.getenv("RAG_LANGUAGE_MIN_SCRIPT_SHARE", 0.5))
+
+# --- Speech to text ---
+# Whisper model loaded on the first /asr/transcribe/ request (tiny, base, small, medium, large)
+ASR_MODEL_NAME=os.getenv("ASR_MODEL_NAME", "base")
+# recordings waiting for the single transcription worker, further requests are refused with 503
+ASR_QUEUE_MAX_SIZE=int(os.getenv("ASR_QUEUE_MAX_SIZE", 16))
+ASR_MAX_UPLOAD_MB=float(os.getenv("ASR_MAX_UPLOAD_MB", 25))
+# transcripts keyed by audio hash, language and model
+ASR_CACHE_ENABLED=_env_bool("ASR_CACHE_ENABLED", True)
+ASR_CACHE_MAX_ENTRIES=int(os.getenv("ASR_CACHE_MAX_ENTRIES", 2000))
+ASR_CACHE_PATH=os.path.join(PERSISTENT_DATA_DIR, "asr_cache.json")
+# energy based voice activity detection, silence is cut before Whisper sees the recording
+ASR_VAD_ENABLED=_env_bool("ASR_VAD_ENABLED", True)
+ASR_VAD_FRAME_MS=int(os.getenv("ASR_VAD_FRAME_MS", 30))
+# frames this far above the estimated noise floor are speech, frames below ASR_VAD_SILENCE_DBFS are always silence
+ASR_VAD_THRESHOLD_DB=float(os.getenv("ASR_VAD_THRESHOLD_DB", 12))
+ASR_VAD_SILENCE_DBFS=float(os.getenv("ASR_VAD_SILENCE_DBFS", -55))
+# pauses shorter than this stay inside a speech region, bursts shorter than ASR_VAD_MIN_SPEECH_MS are noise
+ASR_VAD_MIN_SILENCE_MS=int(os.getenv("ASR_VAD_MIN_SILENCE_MS", 600))
+ASR_VAD_MIN_SPEECH_MS=int(os.getenv("ASR_VAD_MIN_SPEECH_MS", 200))
+# silence kept around each speech region so word edges aren't clipped
+ASR_VAD_PADDING_MS=int(os.getenv("ASR_VAD_PADDING_MS", 200))
+# speech transcribed per Whisper call, each call streams a partial transcript. Whisper encodes a 30 s window
+# whatever the length, so shorter segments give earlier partial results at a higher total cost
+ASR_SEGMENT_MAX_SECONDS=float(os.getenv("ASR_SEGMENT_MAX_SECONDS", 10))
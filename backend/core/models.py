@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Dict
 
 class ChatRequest(BaseModel):
     """
@@ -7,10 +7,12 @@ class ChatRequest(BaseModel):
     Question: The user's current question or message
     History: A list of tuples consisting of questions and answers representing the chat history
     Max_Tokens: The maximum number of tokens to generate in the response
+    Output_Language: The language the answer is written in, generated directly rather than translated afterwards
     """
     question: str
     history: List[Tuple[str, str]] = []
     max_tokens: int=512
+    output_language: str="English"
 
 class SummarizeRequest(BaseModel):
     """
@@ -27,18 +29,33 @@ class EvaluationRequest(BaseModel):
     question: The user's current question or message for evaluation feedback.
     history: A list of (question, answer) tuples for conversation context
     max_tokens: The maximum number of tokens to generate in the response
+    workspace: Name of the evaluation workspace holding the context and metrics to use
     """
     question: str
     history: str="[]"
     max_tokens: int = 512
+    workspace: str = "default"
+
+class BatchEvaluationRequest(BaseModel):
+    """
+    Pydantic model for the batch evaluation request.
+    questions: The questions to answer, each answered independently without chat history
+    max_tokens: The maximum number of tokens to generate per answer
+    workspace: Name of the evaluation workspace holding the context and metrics to use
+    """
+    questions: List[str]
+    max_tokens: int = 512
+    workspace: str = "default"
 
 class RAGResponse(BaseModel):
     """
     Pydantic model for the RAG response.
     Includes text and image links
+    usage: Prompt token accounting (prompt_tokens, prompt_budget, dropped_tokens, dropped_chunks, dropped_history_turns), empty for cached answers
     """
     answer: str
     image_urls: List[str]=[]
+    usage: Dict[str, int]={}
 
 class TranslateRequest(BaseModel):
     """
@@ -54,4 +71,24 @@ class TranslateResponse(BaseModel):
     Pydantic model for a translation response.
     translated_text: The translated text.
     """
-    translated_text: str
\ No newline at end of file
+    translated_text: str
+class TranscriptionResponse(BaseModel):
+    """
+    Pydantic model for a speech to text response.
+    text: The transcript.
+    language: The spoken language, detected by Whisper unless it was given.
+    duration_seconds: Length of the recording.
+    speech_seconds: Audio left for Whisper after silence was trimmed.
+    segments: Whisper calls the speech was transcribed in.
+    transcribe_seconds: Time decoding, trimming and transcription took, from when the recording was first transcribed for cached results.
+    real_time_factor: transcribe_seconds / duration_seconds, below 1 is faster than real time.
+    cached: Whether the transcript came from the cache.
+    """
+    text: str
+    language: Optional[str]=None
+    duration_seconds: float
+    speech_seconds: float
+    segments: int
+    transcribe_seconds: float
+    real_time_factor: Optional[float]=None
+    cached: bool=False
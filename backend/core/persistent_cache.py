@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+class PersistentLRUCache:
+    """
+    Thread safe LRU cache with optional TTL expiry, persisted to a JSON file on disk.
+    Values must be JSON serialisable.
+    Writes to disk are throttled to once every `save_interval` seconds and run on a background thread,
+    so the caller (usually the event loop) never waits for the file. Call save() on shutdown to flush.
+    """
+    def __init__(self, path: Optional[str], max_entries: int=1000, ttl_seconds: Optional[float]=None, save_interval: float=30.0):
+        self.path=path
+        self.max_entries=max_entries
+        self.ttl_seconds=ttl_seconds if ttl_seconds and ttl_seconds>0 else None
+        self.save_interval=save_interval
+
+        self._entries: "OrderedDict[str, Tuple[float, Any]]"=OrderedDict()
+        self._lock=threading.RLock()
+        # held while the file is written, saves run one at a time so an older snapshot never replaces a newer one
+        self._write_lock=threading.Lock()
+        self._saving=False
+        self._dirty=False
+        self._last_save=time.time()
+
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+
+        self.load()
+
+    def _is_expired(self, created_at: float)->bool:
+        return self.ttl_seconds is not None and time.time()-created_at>self.ttl_seconds
+
+    def get(self, key: str)->Optional[Any]:
+        '''
+        Returns the cached value and marks it as recently used, or None on a miss/expired entry
+        '''
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is None:
+                self.misses+=1
+                return None
+            created_at, value=entry
+            if self._is_expired(created_at):
+                del self._entries[key]
+                self._dirty=True
+                self.misses+=1
+                return None
+            self._entries.move_to_end(key)
+            self.hits+=1
+            return value
+
+    def set(self, key: str, value: Any)->None:
+        '''
+        Inserts or replaces a value, evicting the least recently used entries beyond max_entries
+        '''
+        with self._lock:
+            self._entries[key]=(time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries)>self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions+=1
+            self._dirty=True
+        self._maybe_save()
+
+    def pop(self, key: str)->Optional[Any]:
+        with self._lock:
+            entry=self._entries.pop(key, None)
+            if entry is not None:
+                self._dirty=True
+            return entry[1] if entry else None
+
+    def items(self)->List[Tuple[str, Any]]:
+        '''
+        Returns a snapshot of all live (key, value) pairs without touching recency
+        '''
+        with self._lock:
+            return [(k, v) for k, (created_at, v) in self._entries.items() if not self._is_expired(created_at)]
+
+    def remove_where(self, predicate: Callable[[str, Any], bool])->int:
+        '''
+        Removes every entry for which predicate(key, value) is true, returns number removed
+        '''
+        with self._lock:
+            stale=[k for k, (_, v) in self._entries.items() if predicate(k, v)]
+            for k in stale:
+                del self._entries[k]
+            if stale:
+                self._dirty=True
+        if stale:
+            self._maybe_save()
+        return len(stale)
+
+    def clear(self)->None:
+        with self._lock:
+            self._entries.clear()
+            self._dirty=True
+        self.save()
+
+    def __len__(self)->int:
+        return len(self._entries)
+
+    def stats(self)->Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _maybe_save(self)->None:
+        if self.path is None or time.time()-self._last_save<self.save_interval:
+            return
+        with self._lock:
+            if self._saving:
+                return
+            self._saving=True
+            self._last_save=time.time()
+        threading.Thread(target=self._background_save, name="cache-save", daemon=True).start()
+
+    def _background_save(self)->None:
+        try:
+            self.save()
+        finally:
+            with self._lock:
+                self._saving=False
+
+    def save(self)->None:
+        '''
+        Writes the cache to disk atomically if it changed since the last save, waiting for a background save in progress
+        '''
+        if self.path is None:
+            return
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                payload=[[k, created_at, v] for k, (created_at, v) in self._entries.items() if not self._is_expired(created_at)]
+                self._dirty=False
+                self._last_save=time.time()
+            directory=os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path=f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(tmp_path, self.path)
+            except (OSError, TypeError) as e:
+                print(f"Error saving cache to {self.path}: {e}")
+
+    def load(self)->None:
+        '''
+        Loads previously persisted entries, skipping expired ones
+        '''
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                payload=json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ignoring unreadable cache file {self.path}: {e}")
+            return
+        with self._lock:
+            self._entries.clear()
+            for key, created_at, value in payload[-self.max_entries:]:
+                if not self._is_expired(created_at):
+                    self._entries[key]=(created_at, value)
+        print(f"Loaded {len(self._entries)} cache entries from {self.path}")
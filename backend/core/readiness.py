@@ -0,0 +1,57 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator
+
+PENDING="pending"
+READY="ready"
+FAILED="failed"
+
+_process_started_at=time.time()
+_lock=threading.Lock()
+_components: Dict[str, Dict[str, Any]]={}
+_phase_timings: Dict[str, float]={}
+
+def register_component(name: str)->None:
+    '''
+    Declares a component /readyz has to wait for
+    '''
+    with _lock:
+        _components.setdefault(name, {"state": PENDING, "detail": None})
+
+def set_component_state(name: str, state: str, detail: Any=None)->None:
+    with _lock:
+        _components[name]={"state": state, "detail": detail}
+
+def get_component_state(name: str)->str:
+    with _lock:
+        return _components.get(name, {}).get("state", PENDING)
+
+def record_phase(name: str, seconds: float)->None:
+    with _lock:
+        _phase_timings[name]=round(seconds, 3)
+    print(f"Startup phase '{name}' took {seconds:.2f}s")
+
+@contextmanager
+def timed_phase(name: str)->Iterator[None]:
+    '''
+    Records how long the wrapped startup phase took
+    '''
+    start=time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter()-start)
+
+def is_ready()->bool:
+    with _lock:
+        return bool(_components) and all(c["state"]==READY for c in _components.values())
+
+def get_report()->Dict[str, Any]:
+    with _lock:
+        return {
+            "ready": bool(_components) and all(c["state"]==READY for c in _components.values()),
+            "uptime_seconds": round(time.time()-_process_started_at, 1),
+            "components": {name: dict(c) for name, c in _components.items()},
+            "startup_phase_seconds": dict(_phase_timings),
+        }
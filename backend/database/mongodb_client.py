@@ -1,17 +1,44 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, OperationFailure
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, TypeVar
 import os
 from dotenv import load_dotenv
 
+from core.config import (
+    MONGO_MAX_POOL_SIZE,
+    MONGO_EXECUTOR_WORKERS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_QUERY_TIMEOUT_MS,
+)
+
 load_dotenv()
 
 MONGO_URI=os.getenv("MONGO_URI")
 DB_NAME=os.getenv("MONGO_DB_NAME")
 COLLECTION_NAME=os.getenv("MONGO_COLLECTION_NAME")
 
+# the only image fields the backend reads
+IMAGE_PROJECTION={"image_name": 1, "image_path": 1, "labels": 1}
+
 _mongo_client: Optional[MongoClient] = None
 _mongo_db: Optional[MongoClient] = None
+# pymongo is synchronous, queries run on these threads so they never block the event loop
+_executor: Optional[ThreadPoolExecutor] = None
+
+T=TypeVar("T")
+
+async def run_in_executor(fn: Callable[..., T], *args: Any, **kwargs: Any)->T:
+    '''
+    Runs a blocking pymongo call on the bounded MongoDB thread pool
+    '''
+    global _executor
+    if _executor is None:
+        _executor=ThreadPoolExecutor(max_workers=MONGO_EXECUTOR_WORKERS, thread_name_prefix="mongo")
+    return await asyncio.get_running_loop().run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
 
 async def connect_to_mongodb():
     '''
@@ -20,8 +47,14 @@ async def connect_to_mongodb():
     global _mongo_client, _mongo_db
     if _mongo_client is None:
         try:
-            _mongo_client = MongoClient(MONGO_URI)
-            _mongo_client.admin.command('ismaster')
+            _mongo_client = MongoClient(
+                MONGO_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            )
+            await run_in_executor(_mongo_client.admin.command, 'ping')
             _mongo_db = _mongo_client[DB_NAME]
             print(f"Connected to MongoDB: {MONGO_URI}")
         except (ConnectionFailure, OperationFailure) as e:
@@ -29,23 +62,26 @@ async def connect_to_mongodb():
             _mongo_client=None
             _mongo_db=None
             raise ConnectionFailure(f"Couldnt connect to mongoDB, ensure it is running")
-        
+
         except Exception as e:
             print(f"Error connecting to MongoDB: {e}")
             _mongo_client=None
             _mongo_db=None
             raise Exception(f"Failed to connect to mongoDB {e}")
-        
+
 async def close_mongodb_connection():
     '''
     Closes the MongoDB connection
     '''
-    global _mongo_client, _mongo_db
+    global _mongo_client, _mongo_db, _executor
     if _mongo_client is not None:
         _mongo_client.close()
         _mongo_client=None
         _mongo_db=None
         print("Connection closed")
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor=None
 
 def get_image_collection()->Any:
     '''
@@ -64,7 +100,7 @@ async def get_all_image_metadata()->List[Dict[str, Any]]:
     '''
     try:
         collection = get_image_collection()
-        all_images=list(collection.find({}))
+        all_images=await run_in_executor(lambda: list(collection.find({}, IMAGE_PROJECTION)))
         print(f"Retrived {len(all_images)} images from database")
         return all_images
     except OperationFailure as e:
@@ -73,7 +109,7 @@ async def get_all_image_metadata()->List[Dict[str, Any]]:
     except Exception as e:
         print(f"Error retrieving images from database: {e}")
         return []
-    
+
 async def get_image_details_by_name(image_name: str)->Optional[Dict[str, Any]]:
     '''
     Retrieves image details from the database by image name
@@ -81,8 +117,10 @@ async def get_image_details_by_name(image_name: str)->Optional[Dict[str, Any]]:
     '''
     try:
         collection = get_image_collection()
-        image_details = collection.find_one({"image_name": image_name})
+        image_details = await run_in_executor(
+            collection.find_one, {"image_name": image_name}, {"_id": 0, **IMAGE_PROJECTION}, max_time_ms=MONGO_QUERY_TIMEOUT_MS
+        )
         return image_details
     except Exception as e:
         print(f"Error retrieving image details from database: {e}")
-        return None
\ No newline at end of file
+        return None
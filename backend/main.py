@@ -1,32 +1,80 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse
 import uvicorn
 import os
+import asyncio
 from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from routers import rag_router, summarizer_router, evaluator_router, persistent_rag_router, image_router, translator_router
+from routers import rag_router, summarizer_router, evaluator_router, persistent_rag_router, image_router, translator_router, asr_router
 
-from services import persistent_index, image_indexing_service
+from services import persistent_index, image_indexing_service, image_thumbnails, answer_cache, summary_cache, summary_jobs, translation_cache, asr_service
 from database import mongodb_client
+from models import llm_model
+from models.embedder_model import get_embedder
+from core import readiness
+
+readiness.register_component("permanent_index")
+readiness.register_component("image_index")
+
+async def _load_indexes():
+    """
+    Loads the embedder and the indexes in the background so the API can serve while they load
+    """
+    try:
+        await asyncio.to_thread(get_embedder)
+    except Exception as e:
+        print(f"Error loading embedder: {e}")
+        return
+
+    try:
+        with readiness.timed_phase("permanent_index_load"):
+            loaded=await persistent_index.load_permanent_index()
+        readiness.set_component_state("permanent_index", readiness.READY, "loaded" if loaded else "no index on disk")
+    except Exception as e:
+        print(f"Error loading permanent index: {e}")
+        readiness.set_component_state("permanent_index", readiness.FAILED, str(e))
+
+    try:
+        with readiness.timed_phase("image_index_load"):
+            built=await image_indexing_service.load_and_build_image_index()
+        readiness.set_component_state("image_index", readiness.READY, "built" if built else "no images indexed")
+    except Exception as e:
+        readiness.set_component_state("image_index", readiness.FAILED, str(e))
+
+    # picks up images added, changed or removed in MongoDB after startup, runs until shutdown cancels index_loader
+    await image_indexing_service.run_image_sync_loop()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Context manager for application startup and shut down events
+    The LLM, embedder and indexes load in the background, /readyz reports when they are done
     """
-    print("Application Startup: Attempting to load permanent rag index and loading indices from mongodb")
-    await persistent_index.load_permanent_index()
-
-    await persistent_index.load_permanent_index()
-    await image_indexing_service.load_and_build_image_index()
+    print("Application Startup: Loading LLM, permanent rag index and indices from mongodb in the background")
+    llm_model.start_background_load()
+    index_loader=asyncio.create_task(_load_indexes())
+    summary_jobs.start()
+    image_thumbnails.start()
+    asr_service.start()
 
     print("Application start up complete.")
     yield
     print("Application Shut Down: Attempting to save permanent rag index and closing mongodb connection")
-    await mongodb_client.close_mongodb_connection
+    index_loader.cancel()
+    # waits for the image sync loop to stop its change stream watcher before MongoDB is closed
+    await asyncio.gather(index_loader, return_exceptions=True)
+    await summary_jobs.stop()
+    await image_thumbnails.stop()
+    await asr_service.stop()
+    answer_cache.save()
+    summary_cache.save()
+    translation_cache.save()
+    asr_service.save()
+    await mongodb_client.close_mongodb_connection()
     print("Application shut down finished")
 
 app= FastAPI(
@@ -42,6 +90,7 @@ app.include_router(evaluator_router.router)
 app.include_router(persistent_rag_router.router)
 app.include_router(image_router.router)
 app.include_router(translator_router.router)
+app.include_router(asr_router.router)
 
 @app.get("/", tags=["Root"])
 async def root():
@@ -50,6 +99,22 @@ async def root():
     """
     return {"message": "Welcome to the AI Solution provided by Critical AI!"}
 
+@app.get("/healthz", tags=["Root"])
+async def healthz():
+    """
+    Liveness probe, succeeds as soon as the process is serving requests.
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz", tags=["Root"])
+async def readyz():
+    """
+    Readiness probe, returns 503 until the LLM, embedder and indexes are loaded.
+    Includes per component state and startup phase timings.
+    """
+    report=readiness.get_report()
+    return JSONResponse(status_code=status.HTTP_200_OK if report["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE, content=report)
+
 if __name__ == "__main__":
     port=int(os.getenv("PORT", 8000))
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
\ No newline at end of file
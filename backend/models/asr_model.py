@@ -0,0 +1,42 @@
+import threading
+from typing import Optional, Any
+
+import numpy as np
+
+from core.config import ASR_MODEL_NAME
+
+try:
+    import whisper
+except ImportError:
+    whisper = None
+
+# Whisper resamples every recording to 16 kHz mono
+SAMPLE_RATE=16000
+
+_model: Optional[Any]=None
+_model_lock=threading.Lock()
+
+def get_asr_model()->Any:
+    '''
+    Returns the Whisper model, loading it on first use. Raises RuntimeError when openai-whisper isn't installed
+    '''
+    global _model
+    if whisper is None:
+        raise RuntimeError("openai-whisper is not installed, speech to text is unavailable")
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                print(f"Loading Whisper model '{ASR_MODEL_NAME}'")
+                _model=whisper.load_model(ASR_MODEL_NAME)
+    return _model
+
+def is_asr_model_loaded()->bool:
+    return _model is not None
+
+def load_audio(path: str)->np.ndarray:
+    '''
+    Decodes an audio file of any format ffmpeg reads into float32 samples at SAMPLE_RATE
+    '''
+    if whisper is None:
+        raise RuntimeError("openai-whisper is not installed, speech to text is unavailable")
+    return whisper.load_audio(path, sr=SAMPLE_RATE)
@@ -0,0 +1,335 @@
+import ctypes
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional
+
+import llama_cpp
+import numpy as np
+
+# the kv cache / context functions were renamed across llama.cpp versions
+_kv_seq_rm=getattr(llama_cpp, "llama_kv_self_seq_rm", None) or getattr(llama_cpp, "llama_kv_cache_seq_rm")
+_new_context=getattr(llama_cpp, "llama_init_from_model", None) or getattr(llama_cpp, "llama_new_context_with_model")
+
+PRIORITY_INTERACTIVE=0
+PRIORITY_BACKGROUND=10
+
+class _Sequence:
+    """
+    State of one request while it occupies a sequence slot in the shared KV cache.
+    """
+    def __init__(self, entry: Any, seq_id: int):
+        # the (priority, counter, request) queue entry, a sequence evicted for KV space is queued again with it
+        self.entry=entry
+        request=entry[2]
+        self.request=request
+        self.seq_id=seq_id
+        self.prompt_tokens: List[int]=request["tokens"]
+        self.pending: List[int]=list(request["tokens"])
+        self.n_past=0
+        self.generated: List[int]=[]
+        self.text=b""
+        self.admitted_at=time.perf_counter()
+        self.first_token_at: Optional[float]=None
+
+class BatchedGenerationEngine:
+    """
+    Continuous batching on llama.cpp's low level batch API.
+    Every active request decodes as its own sequence id in one shared KV cache, so a single
+    llama_decode call advances all of them. Requests are admitted as soon as a slot and
+    enough KV space are free, and retired (their KV cells released) as soon as they finish.
+    When llama_decode still finds no KV slot, the newest sequence goes back to the queue instead of failing the batch.
+    Runs on a dedicated worker thread, which also tokenizes prompts, so submit() is cheap and safe to call from any thread.
+    """
+    def __init__(self, llm: llama_cpp.Llama, max_sequences: int=4, n_ctx: int=16384, n_batch: int=512):
+        self.llm=llm
+        self.max_sequences=max_sequences
+        self.n_ctx=n_ctx
+        self.n_batch=n_batch
+        self.n_vocab=llm.n_vocab()
+        self._eos=llm.token_eos()
+        self._vocab=llama_cpp.llama_model_get_vocab(llm.model) if hasattr(llama_cpp, "llama_model_get_vocab") else llm.model
+
+        params=llama_cpp.llama_context_default_params()
+        params.n_ctx=n_ctx
+        params.n_batch=n_batch
+        params.n_ubatch=n_batch
+        params.n_seq_max=max_sequences
+        params.n_threads=llm.context_params.n_threads
+        params.n_threads_batch=llm.context_params.n_threads_batch
+        # without a unified KV cache (kv_unified, off by default where it exists) each sequence only gets its share of the cells
+        self.seq_ctx=n_ctx if getattr(params, "kv_unified", True) else n_ctx//max_sequences
+        self._ctx=_new_context(llm.model, params)
+        if not self._ctx:
+            raise RuntimeError("Failed to create llama context for the batch engine")
+        self._batch=llama_cpp.llama_batch_init(n_batch, 0, max_sequences)
+
+        # submitted requests not tokenized yet, then the tokenized ones waiting for a slot
+        self._incoming: List[Any]=[]
+        self._queue: List[Any]=[]
+        self._counter=itertools.count()
+        self._active: Dict[int, _Sequence]={}
+        self._free_seq_ids=list(range(max_sequences))
+        # lowered after a KV eviction so the evicted sequence isn't admitted straight back, reset when one finishes
+        self._admit_limit=max_sequences
+        self._cond=threading.Condition()
+        self._closed=False
+        self._rng=np.random.default_rng()
+
+        self.total_generated_tokens=0
+        self.total_decode_calls=0
+        self.completed_requests=0
+        self.kv_evictions=0
+
+        self._thread=threading.Thread(target=self._run, name="llm-batch-engine", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, max_tokens: int=512, temperature: float=0.7, top_k: int=40, top_p: float=0.95,
+               stop: Optional[List[str]]=None, priority: int=PRIORITY_INTERACTIVE)->Future:
+        """
+        Queues a completion request, returns a Future resolving to a create_completion style dict.
+        Lower priority values are admitted first.
+        """
+        future: Future=Future()
+        request={
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_k": top_k,
+            "top_p": top_p,
+            "stop": [s.encode('utf-8') for s in (stop or [])],
+            "future": future,
+            "submitted_at": time.perf_counter(),
+        }
+        with self._cond:
+            self._incoming.append((priority, next(self._counter), request))
+            self._cond.notify()
+        return future
+
+    def stats(self)->Dict[str, Any]:
+        with self._cond:
+            return {
+                "active_sequences": len(self._active),
+                "queued_requests": len(self._queue)+len(self._incoming),
+                "max_sequences": self.max_sequences,
+                "completed_requests": self.completed_requests,
+                "generated_tokens": self.total_generated_tokens,
+                "decode_calls": self.total_decode_calls,
+                "kv_evictions": self.kv_evictions,
+            }
+
+    def close(self)->None:
+        with self._cond:
+            self._closed=True
+            self._cond.notify()
+        self._thread.join(timeout=10)
+        llama_cpp.llama_batch_free(self._batch)
+        llama_cpp.llama_free(self._ctx)
+
+    def _tokenize(self, request: Dict[str, Any])->bool:
+        '''
+        Runs on the engine thread outside the lock. False when the request was cancelled or can't fit the batch context
+        '''
+        if request["future"].cancelled():
+            return False
+        tokens=self.llm.tokenize(request.pop("prompt").encode('utf-8'), add_bos=True, special=True)
+        if len(tokens)+request["max_tokens"]>self.seq_ctx:
+            request["future"].set_exception(ValueError(f"Prompt of {len(tokens)} tokens plus max_tokens={request['max_tokens']} exceeds the {self.seq_ctx} tokens of context each batch sequence has"))
+            return False
+        request["tokens"]=tokens
+        return True
+
+    def _reserved_kv(self)->int:
+        return sum(len(s.prompt_tokens)+s.request["max_tokens"] for s in self._active.values())
+
+    def _admit(self)->None:
+        '''
+        Moves queued requests into free sequence slots while the KV cache has room for them
+        '''
+        while self._queue and self._free_seq_ids and len(self._active)<self._admit_limit:
+            _, _, request=self._queue[0]
+            if self._active and self._reserved_kv()+len(request["tokens"])+request["max_tokens"]>self.n_ctx:
+                break
+            entry=heapq.heappop(self._queue)
+            if request["future"].cancelled():
+                continue
+            seq_id=self._free_seq_ids.pop()
+            self._active[seq_id]=_Sequence(entry, seq_id)
+
+    def _fill_batch(self)->List[Any]:
+        '''
+        Fills the llama batch with one token per decoding sequence, then as much prefill as fits.
+        Returns (sequence, batch index) pairs for sequences whose logits are requested.
+        '''
+        n=0
+        wants_logits=[]
+        # sequences already generating need a single token each, schedule them first so prefill never starves them
+        ordered=sorted(self._active.values(), key=lambda s: len(s.pending))
+        for seq in ordered:
+            if n>=self.n_batch:
+                break
+            take=min(len(seq.pending), self.n_batch-n)
+            for j in range(take):
+                self._batch.token[n]=seq.pending[j]
+                self._batch.pos[n]=seq.n_past+j
+                self._batch.n_seq_id[n]=1
+                self._batch.seq_id[n][0]=seq.seq_id
+                self._batch.logits[n]=False
+                n+=1
+            seq.n_past+=take
+            seq.pending=seq.pending[take:]
+            if not seq.pending:
+                self._batch.logits[n-1]=True
+                wants_logits.append((seq, n-1))
+        self._batch.n_tokens=n
+        return wants_logits
+
+    def _sample(self, batch_index: int, request: Dict[str, Any])->int:
+        logits_ptr=llama_cpp.llama_get_logits_ith(self._ctx, batch_index)
+        logits=np.ctypeslib.as_array(ctypes.cast(logits_ptr, ctypes.POINTER(ctypes.c_float)), shape=(self.n_vocab,))
+        temperature=request["temperature"]
+        if temperature<=0:
+            return int(np.argmax(logits))
+
+        top_k=min(request["top_k"], self.n_vocab) if request["top_k"]>0 else self.n_vocab
+        candidates=np.argpartition(logits, -top_k)[-top_k:]
+        scaled=logits[candidates].astype(np.float64)/temperature
+        order=np.argsort(-scaled)
+        candidates, scaled=candidates[order], scaled[order]
+        probs=np.exp(scaled-scaled[0])
+        probs/=probs.sum()
+        cutoff=int(np.searchsorted(np.cumsum(probs), request["top_p"]))+1
+        probs=probs[:cutoff]/probs[:cutoff].sum()
+        return int(candidates[self._rng.choice(len(probs), p=probs)])
+
+    def _is_end_of_generation(self, token: int)->bool:
+        if token==self._eos:
+            return True
+        try:
+            return bool(llama_cpp.llama_token_is_eog(self._vocab, token))
+        except Exception:
+            return False
+
+    def _finish(self, seq: _Sequence, finish_reason: str, text: bytes)->None:
+        _kv_seq_rm(self._ctx, seq.seq_id, -1, -1)
+        del self._active[seq.seq_id]
+        self._free_seq_ids.append(seq.seq_id)
+        self.completed_requests+=1
+        self._admit_limit=self.max_sequences
+
+        now=time.perf_counter()
+        request=seq.request
+        result={
+            "object": "text_completion",
+            "choices": [{"text": text.decode('utf-8', errors='ignore'), "index": 0, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": len(seq.prompt_tokens),
+                "completion_tokens": len(seq.generated),
+                "total_tokens": len(seq.prompt_tokens)+len(seq.generated),
+            },
+            "timings": {
+                "queue_seconds": seq.admitted_at-request["submitted_at"],
+                "first_token_seconds": (seq.first_token_at or now)-request["submitted_at"],
+                "total_seconds": now-request["submitted_at"],
+            },
+        }
+        if not request["future"].done():
+            request["future"].set_result(result)
+
+    def _fail_all(self, error: Exception)->None:
+        for seq in list(self._active.values()):
+            _kv_seq_rm(self._ctx, seq.seq_id, -1, -1)
+            if not seq.request["future"].done():
+                seq.request["future"].set_exception(error)
+            del self._active[seq.seq_id]
+            self._free_seq_ids.append(seq.seq_id)
+
+    def _evict_newest(self, status: int)->None:
+        '''
+        Makes room after llama_decode found no KV slot: the most recently admitted sequence is queued again
+        and starts over once another one finishes. A sequence that doesn't fit on its own fails.
+        '''
+        newest=max(self._active.values(), key=lambda s: s.admitted_at)
+        _kv_seq_rm(self._ctx, newest.seq_id, -1, -1)
+        del self._active[newest.seq_id]
+        self._free_seq_ids.append(newest.seq_id)
+        if not self._active:
+            if not newest.request["future"].done():
+                newest.request["future"].set_exception(RuntimeError(f"llama_decode found no KV space for the request (status {status})"))
+            return
+        self.kv_evictions+=1
+        print(f"Batch engine: no KV slot (status {status}), requeued a sequence, {len(self._active)} still decoding")
+        with self._cond:
+            heapq.heappush(self._queue, newest.entry)
+            self._admit_limit=len(self._active)
+
+    def _step(self)->None:
+        positions={seq.seq_id: (seq.n_past, seq.pending) for seq in self._active.values()}
+        wants_logits=self._fill_batch()
+        status=llama_cpp.llama_decode(self._ctx, self._batch)
+        self.total_decode_calls+=1
+        if status<0:
+            self._fail_all(RuntimeError(f"llama_decode failed with status {status}"))
+            return
+        if status>0:
+            # a warning, 1 means no KV slot: the batch wasn't applied, so every sequence is back where it was
+            for seq in self._active.values():
+                seq.n_past, seq.pending=positions[seq.seq_id]
+            self._evict_newest(status)
+            return
+
+        for seq, batch_index in wants_logits:
+            token=self._sample(batch_index, seq.request)
+            if seq.first_token_at is None:
+                seq.first_token_at=time.perf_counter()
+            if self._is_end_of_generation(token):
+                self._finish(seq, "stop", seq.text)
+                continue
+
+            seq.generated.append(token)
+            self.total_generated_tokens+=1
+            seq.text+=self.llm.detokenize([token])
+            stop_at=min((seq.text.find(s) for s in seq.request["stop"] if s in seq.text), default=-1)
+            if stop_at!=-1:
+                self._finish(seq, "stop", seq.text[:stop_at])
+            elif len(seq.generated)>=seq.request["max_tokens"]:
+                self._finish(seq, "length", seq.text)
+            else:
+                seq.pending=[token]
+
+    def _run(self)->None:
+        while True:
+            with self._cond:
+                while not self._closed and not self._incoming and not self._queue and not self._active:
+                    self._cond.wait()
+                if self._closed:
+                    self._fail_all(RuntimeError("Batch engine shut down"))
+                    for _, _, request in self._queue+self._incoming:
+                        if not request["future"].cancelled():
+                            request["future"].set_exception(RuntimeError("Batch engine shut down"))
+                    self._queue.clear()
+                    self._incoming.clear()
+                    return
+                incoming, self._incoming=self._incoming, []
+            tokenized=[]
+            for entry in incoming:
+                try:
+                    if self._tokenize(entry[2]):
+                        tokenized.append(entry)
+                except Exception as e:
+                    if not entry[2]["future"].cancelled():
+                        entry[2]["future"].set_exception(e)
+            with self._cond:
+                for entry in tokenized:
+                    heapq.heappush(self._queue, entry)
+                self._admit()
+                if not self._active:
+                    continue
+            try:
+                self._step()
+            except Exception as e:
+                print(f"Error in batch engine step: {e}")
+                with self._cond:
+                    self._fail_all(e)
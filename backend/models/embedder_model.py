@@ -0,0 +1,33 @@
+import threading
+from typing import Optional
+
+from sentence_transformers import SentenceTransformer
+
+from core import readiness
+
+EMBEDDER_MODEL_NAME='all-MiniLM-L6-v2'
+
+_embedder: Optional[SentenceTransformer]=None
+_embedder_lock=threading.Lock()
+
+readiness.register_component("embedder")
+
+def get_embedder()->SentenceTransformer:
+    '''
+    Returns the sentence transformer shared by every service, loading it on first use
+    '''
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                try:
+                    with readiness.timed_phase("embedder_load"):
+                        _embedder=SentenceTransformer(EMBEDDER_MODEL_NAME)
+                    readiness.set_component_state("embedder", readiness.READY, EMBEDDER_MODEL_NAME)
+                except Exception as e:
+                    readiness.set_component_state("embedder", readiness.FAILED, str(e))
+                    raise
+    return _embedder
+
+def is_embedder_loaded()->bool:
+    return _embedder is not None
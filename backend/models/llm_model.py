@@ -1,8 +1,21 @@
 import llama_cpp
+import asyncio
+import heapq
+import itertools
 import os
-import sys
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterator
 
 from setup import download_metrics_folder, download_model
+from core.config import (
+    LLM_BATCHING_ENABLED, LLM_BATCH_MAX_SEQUENCES, LLM_BATCH_N_CTX, LLM_BATCH_N_BATCH,
+    LLM_SPECULATIVE_MODE, LLM_SPECULATIVE_NUM_PRED_TOKENS, LLM_DRAFT_MODEL_PATH, LLM_SPECULATIVE_ENDPOINTS,
+    LLM_WARMUP, LLM_LOAD_WAIT_SECONDS,
+)
+from core import readiness
+from models.batch_engine import BatchedGenerationEngine, PRIORITY_INTERACTIVE
+from models.speculative import create_draft_model, AcceptanceTrackingDraftModel
 
 BASE_DIR= os.path.dirname(os.path.abspath(__file__))
 
@@ -10,23 +23,167 @@ models_dir=BASE_DIR
 
 os.makedirs(models_dir, exist_ok=True)
 
-download_metrics_folder()
-download_model()
-
 model_filename="Llama-3.2-8B-Instruct-Q5_K_M.gguf"
 model_path=os.path.join(models_dir, model_filename)
 
-if not os.path.exists(model_path):
-    print(f"ERROR: Model file not found at: {model_path}")
-    print("Please ensure the model has been downloaded correctly into the 'models' directory.")
-    print("Exiting application as the core LLM model is missing.")
-    sys.exit(1)
-
-try:
-    llm_model = llama_cpp.Llama(model_path=model_path, chat_format="llama-2", n_ctx=8192, n_gpu_layers=-1)
-    print(f"LLM model loaded successfully from {model_path}")
-except Exception as e:
-    print(f"ERROR: Failed to load LLM model from {model_path}")
-    print(f"Exception: {e}")
-    print("Exiting application due to model loading failure.")
-    sys.exit(1)
\ No newline at end of file
+# populated by the background loader, use get_llm_model() instead of reading these directly
+llm_model: Optional[llama_cpp.Llama]=None
+draft_model: Optional[AcceptanceTrackingDraftModel]=None
+_load_error: Optional[str]=None
+_load_started=False
+_load_start_lock=threading.Lock()
+_ready_event=threading.Event()
+
+readiness.register_component("llm")
+
+def _load_model(warmup: bool)->None:
+    """
+    Downloads (if needed) and loads the LLM, then optionally runs a one token warm-up generation.
+    Runs on a background thread so the API can bind and serve endpoints that don't need the model.
+    """
+    global llm_model, draft_model, _load_error
+    try:
+        with readiness.timed_phase("metrics_download"):
+            download_metrics_folder()
+        with readiness.timed_phase("model_download"):
+            download_model()
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model file not found at: {model_path}. Please ensure the model has been downloaded correctly into the 'models' directory.")
+
+        with readiness.timed_phase("llm_load"):
+            draft_model=create_draft_model(LLM_SPECULATIVE_MODE, LLM_SPECULATIVE_NUM_PRED_TOKENS, LLM_DRAFT_MODEL_PATH)
+            # passing the draft model at construction sets up the context for verifying drafts (logits_all),
+            # it is then attached per request only for endpoints in LLM_SPECULATIVE_ENDPOINTS
+            model=llama_cpp.Llama(model_path=model_path, chat_format="llama-2", n_ctx=8192, n_gpu_layers=-1, draft_model=draft_model)
+            model.draft_model=None
+        print(f"LLM model loaded successfully from {model_path} (speculative mode: {LLM_SPECULATIVE_MODE})")
+
+        if warmup:
+            with readiness.timed_phase("llm_warmup"):
+                model.create_completion(prompt="Hello", max_tokens=1, temperature=0.0)
+
+        llm_model=model
+        readiness.set_component_state("llm", readiness.READY, model_filename)
+    except Exception as e:
+        _load_error=str(e)
+        print(f"ERROR: Failed to load LLM model from {model_path}")
+        print(f"Exception: {e}")
+        readiness.set_component_state("llm", readiness.FAILED, _load_error)
+    finally:
+        _ready_event.set()
+
+def start_background_load(warmup: bool=LLM_WARMUP)->None:
+    """
+    Starts loading the LLM on a background thread, subsequent calls are no-ops
+    """
+    global _load_started
+    with _load_start_lock:
+        if _load_started:
+            return
+        _load_started=True
+    threading.Thread(target=_load_model, args=(warmup,), name="llm-loader", daemon=True).start()
+
+def is_llm_ready()->bool:
+    return llm_model is not None
+
+def get_llm_model(timeout: Optional[float]=None)->llama_cpp.Llama:
+    """
+    Returns the loaded LLM, starting the load if needed and blocking until it finishes.
+    Raises RuntimeError if loading failed or did not finish within timeout.
+    """
+    start_background_load()
+    if not _ready_event.wait(timeout):
+        raise RuntimeError("LLM model is still loading, please retry shortly.")
+    if llm_model is None:
+        raise RuntimeError(f"LLM model failed to load: {_load_error}")
+    return llm_model
+
+async def wait_for_llm_model()->llama_cpp.Llama:
+    """
+    Awaitable get_llm_model() that does not block the event loop while the model loads
+    """
+    if llm_model is not None:
+        return llm_model
+    return await asyncio.to_thread(get_llm_model, LLM_LOAD_WAIT_SECONDS)
+
+# --- Generation dispatch ---
+class _PriorityLock:
+    """
+    Mutex handed to the waiter with the lowest priority value first (FIFO within a priority),
+    so queued interactive requests overtake background work on the sequential path.
+    """
+    def __init__(self):
+        self._cond=threading.Condition()
+        self._held=False
+        self._waiters: List[Any]=[]
+        self._counter=itertools.count()
+
+    @contextmanager
+    def hold(self, priority: int)->Iterator[None]:
+        with self._cond:
+            entry=(priority, next(self._counter))
+            heapq.heappush(self._waiters, entry)
+            while self._held or self._waiters[0]!=entry:
+                self._cond.wait()
+            heapq.heappop(self._waiters)
+            self._held=True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._held=False
+                self._cond.notify_all()
+
+# llama_cpp.Llama is not thread safe, the sequential path serialises access to llm_model
+_llm_lock=_PriorityLock()
+_engine_lock=threading.Lock()
+_batch_engine: Optional[BatchedGenerationEngine]=None
+
+def get_batch_engine()->BatchedGenerationEngine:
+    global _batch_engine
+    with _engine_lock:
+        if _batch_engine is None:
+            _batch_engine=BatchedGenerationEngine(get_llm_model(), max_sequences=LLM_BATCH_MAX_SEQUENCES, n_ctx=LLM_BATCH_N_CTX, n_batch=LLM_BATCH_N_BATCH)
+            print(f"Batch engine started with {LLM_BATCH_MAX_SEQUENCES} sequences over {LLM_BATCH_N_CTX} context tokens")
+    return _batch_engine
+
+def is_speculative_endpoint(endpoint: Optional[str])->bool:
+    return draft_model is not None and endpoint in LLM_SPECULATIVE_ENDPOINTS
+
+def get_speculative_stats()->Dict[str, Any]:
+    """
+    Drafted/accepted token counters of the configured draft model
+    """
+    if draft_model is None:
+        return {"mode": "off"}
+    return {"mode": LLM_SPECULATIVE_MODE, **draft_model.stats()}
+
+def _sequential_completion(speculative: bool, priority: int, **kwargs)->Dict[str, Any]:
+    with _llm_lock.hold(priority):
+        llm_model.draft_model=draft_model if speculative else None
+        try:
+            return llm_model.create_completion(**kwargs)
+        finally:
+            llm_model.draft_model=None
+
+async def generate_completion(prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]]=None, priority: int=PRIORITY_INTERACTIVE, use_batching: Optional[bool]=None, endpoint: Optional[str]=None, speculative: Optional[bool]=None)->Dict[str, Any]:
+    """
+    Runs a completion off the event loop and returns a create_completion style dict.
+    endpoint names the calling feature (rag, evaluator, summarizer, translator), endpoints listed in
+    LLM_SPECULATIVE_ENDPOINTS decode speculatively through llm_model, speculative overrides that choice.
+    Everything else goes through the continuous batching engine when LLM_BATCHING_ENABLED, otherwise
+    through llm_model one request at a time. Either way lower priority values are served first.
+    """
+    await wait_for_llm_model()
+    if speculative is None:
+        speculative=is_speculative_endpoint(endpoint)
+    speculative=speculative and draft_model is not None
+    if use_batching is None:
+        use_batching=LLM_BATCHING_ENABLED and not speculative
+    if use_batching:
+        # the first call creates the batch context, which takes long enough to stall every other request
+        engine=_batch_engine or await asyncio.to_thread(get_batch_engine)
+        future=engine.submit(prompt, max_tokens=max_tokens, temperature=temperature, stop=stop, priority=priority)
+        return await asyncio.wrap_future(future)
+    return await asyncio.to_thread(_sequential_completion, speculative, priority, prompt=prompt, max_tokens=max_tokens, temperature=temperature, stop=stop)
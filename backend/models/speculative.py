@@ -0,0 +1,111 @@
+import threading
+from typing import Dict, Any, Optional
+
+import llama_cpp
+import numpy as np
+import numpy.typing as npt
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+SPECULATIVE_MODES=("off", "prompt_lookup", "draft")
+
+class GGUFDraftModel(LlamaDraftModel):
+    """
+    Drafts tokens greedily with a small GGUF model that shares the main model's vocabulary
+    (e.g. a 1B model of the same family). Reuses its KV cache across calls for the common prefix.
+    """
+    def __init__(self, model_path: str, num_pred_tokens: int=8, n_ctx: int=8192):
+        self.num_pred_tokens=num_pred_tokens
+        self.llm=llama_cpp.Llama(model_path=model_path, n_ctx=n_ctx, n_gpu_layers=-1, verbose=False)
+
+    def __call__(self, input_ids: npt.NDArray[np.intc], /, **kwargs: Any)->npt.NDArray[np.intc]:
+        llm=self.llm
+        if len(input_ids)+self.num_pred_tokens>llm.n_ctx():
+            return np.array([], dtype=np.intc)
+
+        # rewind to the longest prefix already evaluated, eval() drops the KV cells after n_tokens
+        prefix=0
+        cached=llm.input_ids[:llm.n_tokens]
+        limit=min(len(cached), len(input_ids)-1)
+        while prefix<limit and cached[prefix]==input_ids[prefix]:
+            prefix+=1
+        llm.n_tokens=prefix
+        llm.eval(input_ids[prefix:].tolist())
+
+        drafted=[]
+        for _ in range(self.num_pred_tokens):
+            token=int(np.argmax(self._last_logits()))
+            if token==llm.token_eos():
+                break
+            drafted.append(token)
+            llm.eval([token])
+        return np.array(drafted, dtype=np.intc)
+
+    def _last_logits(self)->npt.NDArray[np.single]:
+        # read straight from the context, Llama.scores is only filled when logits_all is set
+        logits_ptr=llama_cpp.llama_get_logits_ith(self.llm.ctx, -1)
+        return np.ctypeslib.as_array(logits_ptr, shape=(self.llm.n_vocab(),))
+
+class AcceptanceTrackingDraftModel(LlamaDraftModel):
+    """
+    Wraps a draft model and counts how many drafted tokens the main model accepted.
+    Accepted drafts show up as the next tokens of the following call's input_ids.
+    """
+    def __init__(self, inner: LlamaDraftModel):
+        self.inner=inner
+        self._lock=threading.Lock()
+        self._last_input: Optional[npt.NDArray[np.intc]]=None
+        self._last_draft: Optional[npt.NDArray[np.intc]]=None
+        self.drafted_tokens=0
+        self.accepted_tokens=0
+        self.calls=0
+
+    def _count_accepted(self, input_ids: npt.NDArray[np.intc])->None:
+        if self._last_input is None or self._last_draft is None or len(self._last_draft)==0:
+            return
+        start=len(self._last_input)
+        if len(input_ids)<=start or not np.array_equal(input_ids[:start], self._last_input):
+            return
+        verified=input_ids[start:start+len(self._last_draft)]
+        mismatches=np.nonzero(verified!=self._last_draft[:len(verified)])[0]
+        self.accepted_tokens+=int(mismatches[0]) if len(mismatches) else len(verified)
+
+    def __call__(self, input_ids: npt.NDArray[np.intc], /, **kwargs: Any)->npt.NDArray[np.intc]:
+        draft=self.inner(input_ids, **kwargs)
+        with self._lock:
+            self._count_accepted(input_ids)
+            self._last_input=np.array(input_ids, copy=True)
+            self._last_draft=np.array(draft, copy=True)
+            self.drafted_tokens+=len(draft)
+            self.calls+=1
+        return draft
+
+    def reset_stats(self)->None:
+        with self._lock:
+            self.drafted_tokens=0
+            self.accepted_tokens=0
+            self.calls=0
+            self._last_input=None
+            self._last_draft=None
+
+    def stats(self)->Dict[str, Any]:
+        with self._lock:
+            return {
+                "draft_calls": self.calls,
+                "drafted_tokens": self.drafted_tokens,
+                "accepted_tokens": self.accepted_tokens,
+                "acceptance_rate": self.accepted_tokens/self.drafted_tokens if self.drafted_tokens else 0.0,
+            }
+
+def create_draft_model(mode: str, num_pred_tokens: int, draft_model_path: Optional[str]=None, n_ctx: int=8192)->Optional[AcceptanceTrackingDraftModel]:
+    """
+    Builds the draft model for the configured speculative mode, None when speculative decoding is off.
+    """
+    if mode not in SPECULATIVE_MODES:
+        raise ValueError(f"Unknown speculative mode '{mode}', expected one of {SPECULATIVE_MODES}")
+    if mode=="off":
+        return None
+    if mode=="prompt_lookup":
+        return AcceptanceTrackingDraftModel(LlamaPromptLookupDecoding(num_pred_tokens=num_pred_tokens))
+    if not draft_model_path:
+        raise ValueError("LLM_DRAFT_MODEL_PATH must point to a GGUF file when LLM_SPECULATIVE_MODE=draft")
+    return AcceptanceTrackingDraftModel(GGUFDraftModel(draft_model_path, num_pred_tokens=num_pred_tokens, n_ctx=n_ctx))
@@ -0,0 +1,73 @@
+import json
+from typing import Optional
+from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from core.models import TranscriptionResponse
+from services import asr_service
+
+router = APIRouter(
+    prefix="/asr",
+    tags=["Speech to Text"]
+)
+
+@router.post("/transcribe/", response_model=TranscriptionResponse, summary="Transcribe a recorded question")
+async def transcribe_audio(
+    file: UploadFile = File(...),
+    language: Optional[str] = Form(None, description="Spoken language (e.g. en, hi, ta), detected when omitted."),
+):
+    """
+    **Transcribes an audio recording with Whisper.**
+
+    Recordings are queued for a single Whisper worker, the model is loaded on the first request.
+    Silence is trimmed by voice activity detection before transcription.
+    Transcripts are cached by the hash of the audio, so the same recording is only transcribed once.
+    """
+    try:
+        audio = await file.read()
+        result, cached = await asr_service.transcribe(audio, file.filename, language)
+        return TranscriptionResponse(**result, cached=cached)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        print(f"Error transcribing audio: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Transcription failed: {e}")
+    finally:
+        await file.close()
+
+@router.post("/transcribe_stream/", summary="Transcribe a recorded question, streaming partial transcripts as NDJSON")
+async def transcribe_audio_stream(
+    file: UploadFile = File(...),
+    language: Optional[str] = Form(None, description="Spoken language (e.g. en, hi, ta), detected when omitted."),
+):
+    """
+    Trims silence, then transcribes the speech segment by segment. NDJSON lines: `vad` with the recording and speech
+    durations, one `partial` per segment with its `text` and the `transcript` so far, then `done` with the
+    full result and `real_time_factor`, or an `error`.
+    """
+    try:
+        audio = await file.read()
+    finally:
+        await file.close()
+    # validation errors and a full queue are reported with a status code before streaming starts
+    events = asr_service.transcribe_stream(audio, file.filename, language)
+    try:
+        first = await events.__anext__()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    async def stream():
+        yield json.dumps(first, ensure_ascii=False) + "\n"
+        try:
+            async for event in events:
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"stage": "done", "done": True, "error": str(e)}) + "\n"
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/status/", summary="Transcription worker and cache statistics")
+async def asr_status():
+    return asr_service.get_status()
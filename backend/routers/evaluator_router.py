@@ -1,17 +1,19 @@
 # routers/evaluator_router.py
 from fastapi import APIRouter, UploadFile, File, HTTPException, status, Depends
+from fastapi.responses import StreamingResponse
 from typing import List, Tuple
 import os
 import shutil
 import json # Ensure json is imported
 
 # Import Pydantic models from the core directory
-from core.models import EvaluationRequest
+from core.models import EvaluationRequest, BatchEvaluationRequest
 
 # Import evaluator service functions
 from services import evaluator_service
 
 MAX_CHAT_HISTORY_TURNS=5
+MAX_BATCH_QUESTIONS=100
 
 # Create an APIRouter instance for evaluator-related endpoints
 router = APIRouter(
@@ -26,7 +28,8 @@ os.makedirs(TEMP_FILES_DIR, exist_ok=True) # Ensure the directory exists upon st
 @router.post("/upload_eval_files/", summary="Upload context and metrics files for evaluation")
 async def upload_eval_files(
     context_file: UploadFile = File(..., description="Upload a single PDF or JSON document for evaluation context."),
-    metrics_file: UploadFile = File(..., description="Upload the JSON file containing evaluation metrics.")
+    metrics_file: UploadFile = File(..., description="Upload the JSON file containing evaluation metrics."),
+    workspace: str = "default"
 ):
     """
     **Uploads a context file (PDF/JSON) and a metrics JSON file to be used by the evaluation assistant.**
@@ -35,6 +38,7 @@ async def upload_eval_files(
     - The context file's text is extracted and used to build the evaluation context FAISS index.
     - The content of the metrics file is loaded and stored in memory for subsequent chat requests.
     - Temporary files are deleted after processing.
+    - Both are stored in the named `workspace` (persisted on disk), files already embedded for any workspace are reused.
 
     **Supported file types**:
     - `context_file`: `.pdf`, `.json`
@@ -68,12 +72,14 @@ async def upload_eval_files(
         await metrics_file.close() # Close handle for uploaded metrics file
 
         # Process the context file to build its index in the service
-        await evaluator_service.process_eval_context_files([context_filepath])
-        # Store the content of the metrics file in the service's global state
-        await evaluator_service.set_current_metrics_data(metrics_filepath)
+        await evaluator_service.process_eval_context_files([context_filepath], workspace)
+        # Flatten and index the metrics file into the same workspace
+        await evaluator_service.set_current_metrics_data(metrics_filepath, workspace)
 
-        return {"message": "Context and metrics files processed successfully."}
+        return {"message": "Context and metrics files processed successfully.", "workspace": workspace}
 
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
@@ -105,13 +111,13 @@ async def ask_evaluation(
         if len(parsed_history)>MAX_CHAT_HISTORY_TURNS:
             parsed_history=parsed_history[-MAX_CHAT_HISTORY_TURNS:]
 
-        # Call the evaluator service to get feedback
-        feedback = await evaluator_service.get_evaluation_feedback(
+        # Call the evaluator service to get feedback and the prompt token usage
+        return await evaluator_service.get_evaluation_feedback(
             question=request.question,
             history=parsed_history, # Pass the parsed history
-            max_tokens=request.max_tokens
+            max_tokens=request.max_tokens,
+            workspace=request.workspace
         )
-        return {"feedback": feedback}
 
     except json.JSONDecodeError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON format for 'history' field.")
@@ -122,3 +128,51 @@ async def ask_evaluation(
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred during evaluation: {e}")
 
+@router.post("/ask_evaluation_batch/", summary="Ask the evaluation assistant many questions in one pass")
+async def ask_evaluation_batch(request: BatchEvaluationRequest):
+    """
+    Answers a list of questions against one workspace, streamed as newline delimited JSON.
+    One line per answer ({"index", "question", "feedback", "usage"}) in question order,
+    followed by a summary line ({"done": true, ...}). Questions are answered without chat history.
+    """
+    questions = [q for q in request.questions if q.strip()]
+    if not questions:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No questions given.")
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch.")
+
+    answers = evaluator_service.get_batch_evaluation_feedback(questions, request.max_tokens, request.workspace)
+    try:
+        # the first answer is awaited here so missing context/metrics still produce a 400 instead of a broken stream
+        first = await answers.__anext__()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred during evaluation: {e}")
+
+    async def stream():
+        yield json.dumps(first) + "\n"
+        try:
+            async for answer in answers:
+                yield json.dumps(answer) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/workspaces/", summary="List evaluation workspaces")
+async def list_workspaces():
+    """
+    Lists the evaluation workspaces on disk, whether each is loaded and how much memory it uses.
+    """
+    return {"workspaces": evaluator_service.list_workspaces()}
+
+@router.delete("/workspaces/{workspace}", summary="Delete an evaluation workspace")
+async def delete_workspace(workspace: str):
+    try:
+        deleted = evaluator_service.delete_workspace(workspace)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Evaluation workspace '{workspace}' not found.")
+    return {"message": f"Evaluation workspace '{workspace}' deleted."}
@@ -1,68 +1,114 @@
 # routers/image_router.py
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, File, Form, HTTPException, Request, Response, UploadFile, status
 from fastapi.responses import FileResponse
-import os
-import mimetypes
-from typing import Optional
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Any, List, Optional
 
-# Import the MongoDB client to get image paths
-from database import mongodb_client
+from core.config import IMAGE_CACHE_MAX_AGE_SECONDS
+from services import image_metadata_cache, image_thumbnails, image_ingestion_service
 
 router = APIRouter(
     prefix="/images",
     tags=["Image Serving"]
 )
 
+@router.get("/cache/status/", summary="Hit/miss metrics of the image metadata cache")
+async def get_image_cache_status():
+    return image_metadata_cache.get_status()
+
+@router.post("/ingest/", status_code=status.HTTP_201_CREATED, summary="Add images with their labels")
+async def ingest_images(
+    files: List[UploadFile] = File(...),
+    labels: Optional[List[str]] = Form(None, description="One comma separated label list per file, in the same order."),
+):
+    """
+    **Stores uploaded images and makes them searchable without a restart.**
+
+    Files are written to `IMAGE_UPLOAD_DIR`, their metadata is inserted into MongoDB in one batch
+    and their labels are embedded and appended to the live image index.
+
+    **Returns**:
+    - The ingested image names and the time and throughput of each stage (write, insert, embed, index).
+    """
+    parsed_labels = [entry.split(",") for entry in labels] if labels is not None else [[] for _ in files]
+    try:
+        return await image_ingestion_service.ingest_images([(f.filename, f.file) for f in files], parsed_labels)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        print(f"Error ingesting images: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to ingest images: {e}")
+    finally:
+        for f in files:
+            await f.close()
+
+def _validators(image_file: Dict[str, Any])->Dict[str, str]:
+    """
+    ETag, Last-Modified and Cache-Control of a served file, the ETag changes whenever the file does
+    """
+    return {
+        "ETag": f'"{image_file["size"]:x}-{int(image_file["mtime"]*1000):x}"',
+        "Last-Modified": formatdate(image_file["mtime"], usegmt=True),
+        "Cache-Control": f"public, max-age={IMAGE_CACHE_MAX_AGE_SECONDS}",
+    }
+
+def _not_modified(request: Request, headers: Dict[str, str], mtime: float)->bool:
+    """
+    True when the client's cached copy is current. If-None-Match takes precedence over If-Modified-Since
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or headers["ETag"] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
 @router.get("/{image_name}", summary="Serve image files by name")
-async def get_image(image_name: str):
+async def get_image(image_name: str, request: Request, size: Optional[str] = None):
     """
     **Serves an image file from the local file system based on its name.**
     
-    This endpoint retrieves the image path from MongoDB and then streams the file content.
+    This endpoint looks up the image path (cached in memory, MongoDB on a miss) and then streams the file content.
     
     **Parameters**:
     - `image_name` (str): The full name of the image file (e.g., "drone.png", "submarine.jpg").
+    - `size` (str, optional): `thumb` for a downscaled copy, falls back to the original if it can't be made.
+
+    Responses carry an ETag, Last-Modified and Cache-Control, conditional requests get a 304
+    and byte ranges are supported.
     
     **Returns**:
     - `FileResponse`: The image file streamed as an HTTP response.
     - `HTTPException`: If the image is not found in the database, the file does not exist,
                        or the image path is invalid.
     """
-    # 1. Get image details from MongoDB
-    image_doc = await mongodb_client.get_image_details_by_name(image_name)
-
-    if not image_doc:
-        print(f"DEBUG: Image '{image_name}' not found in MongoDB.") # Debug print
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Image '{image_name}' not found in database.")
-
-    image_path = image_doc.get("image_path")
-    if not image_path:
-        print(f"DEBUG: Image path missing for '{image_name}' in database record.") # Debug print
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Image path not found for '{image_name}' in database.")
-    
-    # Sanitize the path to prevent directory traversal attacks
-    # For demonstration, we assume image_path from DB is absolute and trusted for local FS
-    # In production, use os.path.normpath and strict base directory checks
-    
-    # Add a debug print to see the exact path FastAPI is trying to open
-    print(f"DEBUG: Attempting to serve image from path: '{image_path}'")
-
-    if not os.path.isabs(image_path):
-        print(f"WARNING: Image path '{image_path}' is not absolute. This might cause issues.") # Debug print
-        # In a real application, you'd prepend a base directory here if paths are relative
-        # Example: base_image_dir = "/path/to/your/images"
-        # image_path = os.path.join(base_image_dir, image_path)
-        
-    # Ensure path exists and is a file
-    if not os.path.exists(image_path) or not os.path.isfile(image_path):
-        print(f"DEBUG: File does not exist or is not a file at path: '{image_path}'") # Debug print
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Image file not found on server at '{image_path}'.")
+    # Path, size and mime type come from memory, MongoDB and the disk are only consulted on a miss
+    try:
+        image_file = await image_metadata_cache.get_image_file(image_name)
+    except FileNotFoundError as e:
+        print(f"DEBUG: {e}") # Debug print
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        print(f"DEBUG: {e}") # Debug print
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
-    # Determine MIME type for the response
-    mime_type, _ = mimetypes.guess_type(image_path)
-    if mime_type is None:
-        mime_type = "application/octet-stream" # Default if MIME type cannot be guessed
+    if size is not None:
+        if size not in image_thumbnails.SIZES:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown size '{size}', expected one of {list(image_thumbnails.SIZES)}.")
+        thumbnail = await image_thumbnails.get_thumbnail(image_file, size)
+        if thumbnail is not None:
+            image_file = thumbnail
 
-    # Return the file as a FastAPI FileResponse
-    return FileResponse(path=image_path, media_type=mime_type)
+    headers = _validators(image_file)
+    if _not_modified(request, headers, image_file["mtime"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
+    # Return the file as a FastAPI FileResponse, it answers Range requests itself
+    return FileResponse(path=image_file["path"], media_type=image_file["mime"], headers=headers)
@@ -64,7 +64,7 @@ async def delete_permanent_rag_index():
     Use with caution, permanently removes the stored knowledge base
     """
     try:
-        await persistent_index.delete_permanent_index()
+        await persistent_index.delete_permanent_index_files()
         return {"message": "Index deleted successfully"}
     except Exception as e:
         traceback.print_exc()
@@ -58,6 +58,7 @@ async def chat_with_rag(chat_request: ChatRequest):
     - question: str - The question to ask the RAG system.
     - history: List[Tuple[str, str]] - The chat history as a list of tuples (question, answer).
     - max_tokens: int - The maximum number of tokens to generate in the response.
+    - output_language: str - The language to answer in, defaults to English.
     """
     try:
         if len(chat_request.history)>MAX_CHAT_HISTORY_TURNS:
@@ -69,7 +70,8 @@ async def chat_with_rag(chat_request: ChatRequest):
         response_data=await rag_service.ask_model(
             question=chat_request.question,
             history=chat_request.history,
-            max_tokens=chat_request.max_tokens
+            max_tokens=chat_request.max_tokens,
+            output_language=chat_request.output_language
         )
         return response_data
     
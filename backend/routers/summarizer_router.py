@@ -1,11 +1,14 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, status
+from fastapi.responses import StreamingResponse
 from typing import List
+import asyncio
+import json
 import os
 import shutil
 
 from core.models import SummarizeRequest
 
-from services import summarizer_service
+from services import summarizer_service, summary_jobs
 
 router = APIRouter(
     prefix="/summarizer",
@@ -18,7 +21,10 @@ os.makedirs(TEMP_FILES_DIR, exist_ok=True)
 @router.post("/summarize_document/", summary="Upload documents to get collated summary")
 async def summarize_document(file: UploadFile = File(...), 
                              num_clusters: int = 10,
-                             max_tokens: int = 512
+                             max_tokens: int = 512,
+                             stream: bool = False,
+                             mode: str = "abstractive",
+                             polish: bool = False
 ):
     """
     Uploads PDF files to be processed and summarized.
@@ -28,27 +34,137 @@ async def summarize_document(file: UploadFile = File(...),
     - files: A single file to be summarized, must be a PDF.
     - num_clusters: int - The number of clusters for KMeans clustering, default is 10.
     - max_tokens: int - The maximum number of tokens for the summary, default is 512
+    - stream: bool - Stream map and reduce progress as newline delimited JSON events, ending with the summary
+    - mode: str - abstractive (LLM map-reduce, default) or extractive (representative sentences, no LLM calls)
+    - polish: bool - With mode=extractive, let the LLM rewrite the extracted sentences into a fluent summary
     """
     temp_filepath=None
     try:
         file_extension=os.path.splitext(file.filename)[1].lower()
         if file_extension != '.pdf':
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only PDF files are supported.")
+        if mode not in summarizer_service.SUMMARY_MODES:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"mode must be one of {summarizer_service.SUMMARY_MODES}.")
         temp_filepath = os.path.join(TEMP_FILES_DIR, file.filename)
         with open(temp_filepath, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         await file.close()
-        summary=await summarizer_service.generate_document_summary([temp_filepath], num_clusters, max_tokens)
+        if stream:
+            response=StreamingResponse(_stream_summary(temp_filepath, num_clusters, max_tokens, mode, polish), media_type="application/x-ndjson")
+            # the stream removes the file once the summary is done
+            temp_filepath=None
+            return response
+        summary=await summarizer_service.generate_document_summary([temp_filepath], num_clusters, max_tokens, mode=mode, polish=polish)
         return {"summary": summary}
     
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     finally:
-        if temp_filepath and os.path.exists(temp_filepath):
-            try:
-                os.remove(temp_filepath)
-            except OSError as e: # Catch OSError specifically for cleanup issues
-                print(f"Error removing temporary file {temp_filepath}: {e}")
-                # You might want to log this error for debugging or send a notification
\ No newline at end of file
+        _remove_temp_file(temp_filepath)
+
+def _remove_temp_file(temp_filepath):
+    if temp_filepath and os.path.exists(temp_filepath):
+        try:
+            os.remove(temp_filepath)
+        except OSError as e: # Catch OSError specifically for cleanup issues
+            print(f"Error removing temporary file {temp_filepath}: {e}")
+            # You might want to log this error for debugging or send a notification
+
+async def _stream_summary(temp_filepath: str, num_clusters: int, max_tokens: int, mode: str, polish: bool):
+    """
+    Yields progress events of the map and reduce phases as NDJSON lines, then the final summary (or the error)
+    """
+    events: asyncio.Queue=asyncio.Queue()
+    task=asyncio.create_task(summarizer_service.generate_document_summary([temp_filepath], num_clusters, max_tokens, events.put_nowait, mode, polish))
+    try:
+        while not task.done() or not events.empty():
+            getter=asyncio.ensure_future(events.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield json.dumps(getter.result())+"\n"
+            else:
+                getter.cancel()
+        try:
+            yield json.dumps({"stage": "done", "summary": task.result()})+"\n"
+        except Exception as e:
+            yield json.dumps({"stage": "error", "detail": str(e)})+"\n"
+    finally:
+        if not task.done():
+            task.cancel()
+        _remove_temp_file(temp_filepath)
+
+@router.post("/jobs/", summary="Submit documents for a background summarization job", status_code=status.HTTP_202_ACCEPTED)
+async def create_summary_job(files: List[UploadFile] = File(...),
+                             num_clusters: int = 10,
+                             max_tokens: int = 512,
+                             mode: str = "abstractive",
+                             polish: bool = False
+):
+    """
+    Queues a collated summary of all uploaded PDFs and returns immediately with a job id.
+    Poll /summarizer/jobs/{job_id}, follow /summarizer/jobs/{job_id}/events or fetch /summarizer/jobs/{job_id}/result.
+    Jobs run at background priority so chat requests are served first, and resume after a restart.
+    """
+    for file in files:
+        if os.path.splitext(file.filename)[1].lower() != '.pdf':
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Only PDF files are supported, got {file.filename}.")
+    try:
+        job=await summary_jobs.create_job([(file.filename, file.file) for file in files], num_clusters, max_tokens, mode, polish)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    finally:
+        for file in files:
+            await file.close()
+    return job
+
+@router.get("/jobs/", summary="List summarization jobs")
+async def list_summary_jobs():
+    return {"jobs": summary_jobs.list_jobs()}
+
+def _get_job_or_404(job_id: str):
+    job=summary_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Summary job {job_id} not found.")
+    return job
+
+@router.get("/jobs/{job_id}", summary="Status and progress of a summarization job")
+async def get_summary_job(job_id: str):
+    return _get_job_or_404(job_id)
+
+@router.get("/jobs/{job_id}/events", summary="Stream progress of a summarization job")
+async def stream_summary_job(job_id: str):
+    """
+    Newline delimited JSON progress events, replayed from the start of the job and followed until it finishes
+    """
+    _get_job_or_404(job_id)
+
+    async def events():
+        async for event in summary_jobs.stream_events(job_id):
+            yield json.dumps(event)+"\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@router.get("/jobs/{job_id}/result", summary="Summary produced by a finished job")
+async def get_summary_job_result(job_id: str):
+    job=_get_job_or_404(job_id)
+    if job["status"]==summary_jobs.FAILED:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=job["error"])
+    if job["status"]!=summary_jobs.DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job['status']}.")
+    return {"summary": job["result"]}
+
+@router.delete("/jobs/{job_id}", summary="Delete a summarization job and its files")
+async def delete_summary_job(job_id: str):
+    try:
+        deleted=summary_jobs.delete_job(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Summary job {job_id} not found.")
+    return {"message": f"Summary job {job_id} deleted."}
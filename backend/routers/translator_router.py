@@ -1,5 +1,7 @@
 # routers/translator_router.py
+import json
 from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
 from core.models import TranslateRequest, TranslateResponse
 from services import translator_service
 
@@ -22,3 +24,22 @@ async def translate_text_endpoint(request: TranslateRequest):
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Translation failed: {e}")
 
+
+@router.post("/translate_text_stream/", summary="Translate text to a target language, streaming segments as NDJSON")
+async def translate_text_stream_endpoint(request: TranslateRequest):
+    """
+    Translates long texts segment by segment. Each NDJSON line holds the next piece of the translation
+    (`index`, `total`, `text`) in order, the last one `done` with the full `translated_text`.
+    A piece that failed to translate keeps the original text and carries an `error`.
+    """
+    async def stream():
+        try:
+            async for event in translator_service.translate_text_stream(request.text, request.target_language):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"done": True, "error": str(e)}) + "\n"
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/cache/status/", summary="Translation cache and language detection statistics")
+async def translation_cache_status():
+    return translator_service.get_status()
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import re
+import numpy as np
+from typing import List, Tuple, Dict, Any, Optional
+
+from core.config import (
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_SEMANTIC,
+    ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_PATH,
+)
+from core.persistent_cache import PersistentLRUCache
+
+_cache=PersistentLRUCache(ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL_SECONDS)
+
+def _normalise_question(question: str)->str:
+    '''
+    Lowercases, collapses whitespace and strips trailing punctuation so trivially different phrasings share a key
+    '''
+    question=re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+def _hash(value: str)->str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+def _scope_key(history: List[Tuple[str, str]], generations: Dict[str, Optional[str]], max_tokens: int, output_language: str)->str:
+    '''
+    Hash of everything except the question that influences the answer:
+    conversation state, the generation ids of the indexes consulted, the output length and language
+    '''
+    state={"history": [list(turn) for turn in history], "generations": generations, "max_tokens": max_tokens}
+    # English answers keep the key they had before answers could be asked for in other languages
+    if output_language.strip().lower()!="english":
+        state["output_language"]=output_language.strip().lower()
+    return _hash(json.dumps(state, sort_keys=True))
+
+def _normalised_embedding(embedding: Optional[np.ndarray])->Optional[np.ndarray]:
+    if embedding is None:
+        return None
+    vec=np.asarray(embedding, dtype='float32').reshape(-1)
+    norm=np.linalg.norm(vec)
+    return vec/norm if norm>0 else None
+
+def lookup(question: str, history: List[Tuple[str, str]], generations: Dict[str, Optional[str]], max_tokens: int, embedding: Optional[np.ndarray]=None, output_language: str="English")->Optional[Dict[str, Any]]:
+    '''
+    Returns a cached answer payload ({"answer", "image_urls"}) for the question, or None.
+    Tries an exact match on the normalised question first, then, in semantic mode,
+    the closest cached question with the same scope above the cosine threshold.
+    '''
+    if not ANSWER_CACHE_ENABLED:
+        return None
+
+    scope=_scope_key(history, generations, max_tokens, output_language)
+    entry=_cache.get(f"{scope}:{_hash(_normalise_question(question))}")
+    if entry is not None:
+        print("Answer cache: exact hit")
+        return entry
+
+    query_vec=_normalised_embedding(embedding) if ANSWER_CACHE_SEMANTIC else None
+    if query_vec is None:
+        return None
+
+    candidates=[(k, v) for k, v in _cache.items() if v.get("scope")==scope and v.get("embedding")]
+    if not candidates:
+        return None
+    matrix=np.asarray([v["embedding"] for _, v in candidates], dtype='float32')
+    similarities=matrix@query_vec
+    best=int(np.argmax(similarities))
+    if similarities[best]<ANSWER_CACHE_SIMILARITY_THRESHOLD:
+        return None
+
+    print(f"Answer cache: semantic hit (cosine {similarities[best]:.3f})")
+    return _cache.get(candidates[best][0])
+
+def store(question: str, history: List[Tuple[str, str]], generations: Dict[str, Optional[str]], max_tokens: int, answer: str, image_urls: List[str], embedding: Optional[np.ndarray]=None, output_language: str="English")->None:
+    '''
+    Caches an answer under the normalised question and its scope
+    '''
+    if not ANSWER_CACHE_ENABLED:
+        return
+
+    scope=_scope_key(history, generations, max_tokens, output_language)
+    normalised_vec=_normalised_embedding(embedding) if ANSWER_CACHE_SEMANTIC else None
+    _cache.set(f"{scope}:{_hash(_normalise_question(question))}", {
+        "scope": scope,
+        "question": question,
+        "answer": answer,
+        "image_urls": list(image_urls),
+        "generations": generations,
+        "embedding": normalised_vec.round(5).tolist() if normalised_vec is not None else None,
+    })
+
+def invalidate_index(index_name: str, current_generation: Optional[str])->int:
+    '''
+    Drops every cached answer that consulted a previous generation of the given index.
+    Called whenever an index is rebuilt or deleted.
+    '''
+    removed=_cache.remove_where(lambda _, v: v.get("generations", {}).get(index_name)!=current_generation)
+    if removed:
+        print(f"Answer cache: invalidated {removed} entries after '{index_name}' index changed")
+    return removed
+
+def clear()->None:
+    _cache.clear()
+
+def save()->None:
+    _cache.save()
+
+def get_status()->Dict[str, Any]:
+    status=_cache.stats()
+    status.update({"enabled": ANSWER_CACHE_ENABLED, "semantic": ANSWER_CACHE_SEMANTIC})
+    return status
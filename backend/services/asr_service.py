@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+
+import numpy as np
+
+from core.config import (
+    ASR_MODEL_NAME,
+    ASR_QUEUE_MAX_SIZE,
+    ASR_MAX_UPLOAD_MB,
+    ASR_CACHE_ENABLED,
+    ASR_CACHE_MAX_ENTRIES,
+    ASR_CACHE_PATH,
+    ASR_VAD_ENABLED,
+    ASR_SEGMENT_MAX_SECONDS,
+)
+from core.persistent_cache import PersistentLRUCache
+from models.asr_model import SAMPLE_RATE, get_asr_model, is_asr_model_loaded, load_audio
+from services import vad
+
+_cache=PersistentLRUCache(ASR_CACHE_PATH, max_entries=ASR_CACHE_MAX_ENTRIES)
+_queue: Optional[asyncio.Queue]=None
+_worker_task: Optional[asyncio.Task]=None
+# transcriptions queued or running by cache key, identical recordings sent twice share one
+_in_flight: Dict[str, Dict[str, Any]]={}
+_transcribed=0
+_audio_seconds=0.0
+_speech_seconds=0.0
+_transcribe_seconds=0.0
+
+def _key(audio_hash: str, language: Optional[str])->str:
+    # trimming changes what Whisper hears, so transcripts with and without it are kept apart
+    return f"{ASR_MODEL_NAME}:{'vad' if ASR_VAD_ENABLED else 'full'}:{(language or 'auto').strip().lower()}:{audio_hash}"
+
+def _decode(audio: bytes, suffix: str)->np.ndarray:
+    '''
+    Runs on a worker thread. The recording is decoded by ffmpeg, which reads from a file
+    '''
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        tmp_file.write(audio)
+        tmp_path=tmp_file.name
+    try:
+        return load_audio(tmp_path)
+    finally:
+        os.unlink(tmp_path)
+
+def _segments(samples: np.ndarray)->List[np.ndarray]:
+    '''
+    Speech of the recording in pieces of at most ASR_SEGMENT_MAX_SECONDS, the silence between regions cut out
+    '''
+    max_samples=int(ASR_SEGMENT_MAX_SECONDS*SAMPLE_RATE)
+    if not ASR_VAD_ENABLED:
+        return [samples[i:i+max_samples] for i in range(0, len(samples), max_samples)]
+    regions=vad.speech_regions(samples, SAMPLE_RATE, ASR_SEGMENT_MAX_SECONDS)
+    return [np.concatenate([samples[start:end] for start, end in group]) for group in vad.pack_regions(regions, max_samples)]
+
+def _transcribe_segment(samples: np.ndarray, language: Optional[str], prompt: Optional[str])->Dict[str, Any]:
+    '''
+    Runs on a worker thread. The transcript so far is the prompt, so words split across segments keep their context
+    '''
+    return get_asr_model().transcribe(samples, language=language, initial_prompt=prompt or None)
+
+def _publish(job: Dict[str, Any], event: Dict[str, Any])->None:
+    job["events"].append(event)
+    for subscriber in job["subscribers"]:
+        subscriber.put_nowait(event)
+
+async def _run(job: Dict[str, Any])->None:
+    global _transcribed, _audio_seconds, _speech_seconds, _transcribe_seconds
+    start=time.perf_counter()
+    samples=await asyncio.to_thread(_decode, job["audio"], job["suffix"])
+    segments=await asyncio.to_thread(_segments, samples)
+    duration=len(samples)/SAMPLE_RATE
+    speech=sum(len(segment) for segment in segments)/SAMPLE_RATE
+    _publish(job, {"stage": "vad", "duration_seconds": round(duration, 2), "speech_seconds": round(speech, 2), "segments": len(segments)})
+
+    language=job["language"]
+    texts: List[str]=[]
+    for index, segment in enumerate(segments):
+        result=await asyncio.to_thread(_transcribe_segment, segment, language, " ".join(texts))
+        # the language detected on the first segment is kept, later segments skip detection
+        language=language or result.get("language")
+        text=result.get("text", "").strip()
+        if text:
+            texts.append(text)
+        _publish(job, {"stage": "partial", "index": index, "total": len(segments), "text": text, "transcript": " ".join(texts)})
+
+    seconds=time.perf_counter()-start
+    _transcribed+=1
+    _audio_seconds+=duration
+    _speech_seconds+=speech
+    _transcribe_seconds+=seconds
+    result={
+        "text": " ".join(texts),
+        "language": language,
+        "duration_seconds": round(duration, 2),
+        "speech_seconds": round(speech, 2),
+        "segments": len(segments),
+        "transcribe_seconds": round(seconds, 3),
+        "real_time_factor": round(seconds/duration, 3) if duration>0 else None,
+    }
+    if ASR_CACHE_ENABLED and result["text"]:
+        _cache.set(job["key"], result)
+    _publish(job, {"stage": "done", "done": True, **result, "cached": False})
+
+async def _worker()->None:
+    while True:
+        job=await _queue.get()
+        try:
+            await _run(job)
+        except asyncio.CancelledError:
+            _publish(job, {"stage": "done", "done": True, "error": "The server is shutting down"})
+            raise
+        except Exception as e:
+            print(f"Error transcribing audio: {e}")
+            _publish(job, {"stage": "done", "done": True, "error": str(e)})
+        finally:
+            _in_flight.pop(job["key"], None)
+            _queue.task_done()
+
+def _validate(audio: bytes)->None:
+    if not audio:
+        raise ValueError("The uploaded audio is empty.")
+    if len(audio)>ASR_MAX_UPLOAD_MB*1024*1024:
+        raise ValueError(f"Audio files are limited to {ASR_MAX_UPLOAD_MB:g} MB.")
+    if _queue is None:
+        raise RuntimeError("The transcription worker is not running")
+
+async def transcribe_stream(audio: bytes, filename: Optional[str]=None, language: Optional[str]=None)->AsyncIterator[Dict[str, Any]]:
+    '''
+    input: the recording, its file name (for the container format) and optionally its language, detected otherwise
+    Yields {"stage": "vad"} with the duration and speech kept after voice activity trimming, one {"stage": "partial"}
+    per transcribed segment with its text and the transcript so far, then {"stage": "done", "done": True} with the
+    full result and the real-time factor, or an "error". Recordings are transcribed one at a time by a single
+    Whisper worker. Raises ValueError for empty or oversized uploads and RuntimeError when the queue is full or the worker isn't running.
+    '''
+    _validate(audio)
+    key=_key(hashlib.sha256(audio).hexdigest(), language)
+    if ASR_CACHE_ENABLED:
+        cached=_cache.get(key)
+        if cached is not None:
+            yield {"stage": "done", "done": True, **cached, "cached": True}
+            return
+
+    job=_in_flight.get(key)
+    if job is None:
+        if _queue.full():
+            raise RuntimeError(f"{_queue.qsize()} recordings are already waiting to be transcribed, try again shortly")
+        job={"key": key, "audio": audio, "suffix": os.path.splitext(filename or "")[1] or ".wav", "language": language, "events": [], "subscribers": []}
+        _in_flight[key]=job
+        _queue.put_nowait(job)
+
+    # a request joining a running transcription first receives what was already published
+    subscriber: asyncio.Queue=asyncio.Queue()
+    for event in job["events"]:
+        subscriber.put_nowait(event)
+    job["subscribers"].append(subscriber)
+    try:
+        while True:
+            event=await subscriber.get()
+            yield event
+            if event.get("done"):
+                return
+    finally:
+        # a client that disconnects doesn't stop the transcription others may be waiting for
+        job["subscribers"].remove(subscriber)
+
+async def transcribe(audio: bytes, filename: Optional[str]=None, language: Optional[str]=None)->Tuple[Dict[str, Any], bool]:
+    '''
+    Like transcribe_stream, waiting for the full result
+    output: ({"text", "language", "duration_seconds", "speech_seconds", "segments", "transcribe_seconds", "real_time_factor"}, whether it came from the cache)
+    '''
+    async for event in transcribe_stream(audio, filename, language):
+        if event.get("done"):
+            if "error" in event:
+                raise Exception(event["error"])
+            result={k: v for k, v in event.items() if k not in ("stage", "done", "cached")}
+            return result, event["cached"]
+    raise RuntimeError("The transcription ended without a result")
+
+def start()->None:
+    '''
+    Starts the transcription worker, called from the app lifespan. The model itself loads on the first request
+    '''
+    global _queue, _worker_task
+    if _queue is not None:
+        return
+    _queue=asyncio.Queue(maxsize=max(1, ASR_QUEUE_MAX_SIZE))
+    _worker_task=asyncio.create_task(_worker())
+
+async def stop()->None:
+    global _queue, _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()
+        await asyncio.gather(_worker_task, return_exceptions=True)
+    _worker_task=None
+    _queue=None
+    for job in _in_flight.values():
+        _publish(job, {"stage": "done", "done": True, "error": "The server is shutting down"})
+    _in_flight.clear()
+
+def save()->None:
+    _cache.save()
+
+def get_status()->Dict[str, Any]:
+    return {
+        "model": ASR_MODEL_NAME,
+        "model_loaded": is_asr_model_loaded(),
+        "vad_enabled": ASR_VAD_ENABLED,
+        "queued": _queue.qsize() if _queue is not None else 0,
+        "transcribed": _transcribed,
+        "audio_seconds": round(_audio_seconds, 2),
+        "speech_seconds": round(_speech_seconds, 2),
+        "real_time_factor": round(_transcribe_seconds/_audio_seconds, 3) if _audio_seconds>0 else None,
+        "cache": {"enabled": ASR_CACHE_ENABLED, **_cache.stats()},
+    }
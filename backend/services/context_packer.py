@@ -0,0 +1,117 @@
+from typing import List, Tuple, Dict, Any, Optional
+
+from models.llm_model import get_llm_model, is_llm_ready
+from core.config import CONTEXT_TOKEN_BUDGET, CONTEXT_SAFETY_MARGIN
+
+# tokens added around each chunk/turn by the separators used when joining them into the prompt
+SEPARATOR_TOKENS=2
+
+def count_tokens(text: str)->int:
+    '''
+    Counts tokens with the llama tokenizer, exactly as the prompt will be evaluated
+    '''
+    if not text:
+        return 0
+    return len(get_llm_model().tokenize(text.encode('utf-8'), add_bos=False, special=True))
+
+def count_tokens_if_ready(texts: List[str])->Dict[int, int]:
+    '''
+    Token counts of texts by position, computed at ingest.
+    Empty while the LLM is still loading, pack_context then counts the retrieved chunks on demand.
+    '''
+    if not is_llm_ready():
+        return {}
+    return {i: count_tokens(text) for i, text in enumerate(texts)}
+
+def truncate_to_tokens(text: str, max_tokens: int)->str:
+    '''
+    Cuts text down to at most max_tokens llama tokens
+    '''
+    if max_tokens<=0:
+        return ""
+    llm=get_llm_model()
+    tokens=llm.tokenize(text.encode('utf-8'), add_bos=False, special=True)
+    if len(tokens)<=max_tokens:
+        return text
+    return llm.detokenize(tokens[:max_tokens]).decode('utf-8', errors='ignore')
+
+def prompt_budget(max_tokens: int)->int:
+    '''
+    Number of prompt tokens available once room for the generated answer is reserved
+    '''
+    return max(0, min(CONTEXT_TOKEN_BUDGET, get_llm_model().n_ctx()-max_tokens-CONTEXT_SAFETY_MARGIN))
+
+def format_history_turn(question: str, answer: str)->str:
+    return f"Q: {question}\nA: {answer}\n\n"
+
+def pack_context(
+    budget: int,
+    fixed_tokens: int,
+    scored_chunks: List[Tuple[str, float, Optional[int]]],
+    history: List[Tuple[str, str]],
+)->Dict[str, Any]:
+    '''
+    Fits retrieved chunks and chat history into a prompt token budget.
+
+    fixed_tokens: tokens of the prompt template with empty context and history (instructions + question)
+    scored_chunks: (text, distance, token_count) tuples, lower distance is better. token_count may be None
+    history: (question, answer) turns, oldest first
+
+    History is given up first, oldest turns before newer ones, then chunks are admitted in score order
+    while they fit. If not even the best chunk fits it is truncated to the remaining space.
+    Space left over by dropped chunks is handed back to the most recent dropped turns.
+    '''
+    chunks=sorted(scored_chunks, key=lambda c: c[1])
+    chunk_tokens=[(tokens if tokens is not None else count_tokens(text))+SEPARATOR_TOKENS for text, _, tokens in chunks]
+    history_tokens=[count_tokens(format_history_turn(q, a)) for q, a in history]
+
+    available=budget-fixed_tokens
+    kept_history=list(history)
+    kept_history_tokens=list(history_tokens)
+    while kept_history and sum(chunk_tokens)+sum(kept_history_tokens)>available:
+        kept_history.pop(0)
+        kept_history_tokens.pop(0)
+
+    remaining=available-sum(kept_history_tokens)
+    kept_chunks=[]
+    used_chunk_tokens=0
+    dropped_tokens=sum(history_tokens)-sum(kept_history_tokens)
+    for (text, _, _), tokens in zip(chunks, chunk_tokens):
+        if used_chunk_tokens+tokens<=remaining:
+            kept_chunks.append(text)
+            used_chunk_tokens+=tokens
+        elif not kept_chunks and remaining>SEPARATOR_TOKENS:
+            kept_chunks.append(truncate_to_tokens(text, remaining-SEPARATOR_TOKENS))
+            used_chunk_tokens=remaining
+            dropped_tokens+=tokens-remaining
+        else:
+            dropped_tokens+=tokens
+
+    # give space left by dropped chunks back to the most recent of the dropped turns
+    first_kept=len(history)-len(kept_history)
+    while first_kept>0 and history_tokens[first_kept-1]<=available-used_chunk_tokens-sum(kept_history_tokens):
+        first_kept-=1
+        kept_history.insert(0, history[first_kept])
+        kept_history_tokens.insert(0, history_tokens[first_kept])
+        dropped_tokens-=history_tokens[first_kept]
+
+    return {
+        "chunks": kept_chunks,
+        "history": kept_history,
+        "estimated_prompt_tokens": fixed_tokens+used_chunk_tokens+sum(kept_history_tokens),
+        "dropped_tokens": dropped_tokens,
+        "dropped_chunks": len(chunks)-len(kept_chunks),
+        "dropped_history_turns": len(history)-len(kept_history),
+    }
+
+def usage_report(final_prompt: str, packed: Dict[str, Any], budget: int)->Dict[str, int]:
+    '''
+    Summarises prompt usage for the API response, using the exact token count of the final prompt
+    '''
+    return {
+        "prompt_tokens": count_tokens(final_prompt),
+        "prompt_budget": budget,
+        "dropped_tokens": packed["dropped_tokens"],
+        "dropped_chunks": packed["dropped_chunks"],
+        "dropped_history_turns": packed["dropped_history_turns"],
+    }
@@ -0,0 +1,241 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Any, Optional
+
+import faiss
+import numpy as np
+
+from core.config import EVAL_WORKSPACES_DIR, EVAL_WORKSPACE_MEMORY_MB
+from models.embedder_model import get_embedder
+from services.metrics_index import MetricsIndex
+
+DEFAULT_WORKSPACE = "default"
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class EvaluationWorkspace:
+    """
+    Context index and metrics of one evaluation, so analysts working on different runs don't overwrite each other.
+    The content hashes of the uploaded files let another upload of the same file reuse the embeddings.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.context_index: Optional[faiss.IndexFlatL2] = None
+        self.id_to_text: Dict[int, str] = {}
+        self.id_to_tokens: Dict[int, int] = {}
+        self.context_hash: Optional[str] = None
+        self.metrics_index: Optional[MetricsIndex] = None
+        self.metrics_hash: Optional[str] = None
+        self.updated_at = time.time()
+
+    @property
+    def directory(self) -> str:
+        return os.path.join(EVAL_WORKSPACES_DIR, self.name)
+
+    def set_context(self, chunks: List[str], vectors: np.ndarray, token_counts: Dict[int, int], content_hash: str) -> None:
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(np.asarray(vectors, dtype='float32'))
+        self.context_index = index
+        self.id_to_text = {i: text for i, text in enumerate(chunks)}
+        self.id_to_tokens = token_counts
+        self.context_hash = content_hash
+        self.updated_at = time.time()
+
+    def copy_context_from(self, other: "EvaluationWorkspace") -> None:
+        # flat indexes are never modified in place once built, sharing them is safe
+        self.context_index = other.context_index
+        self.id_to_text = other.id_to_text
+        self.id_to_tokens = other.id_to_tokens
+        self.context_hash = other.context_hash
+        self.updated_at = time.time()
+
+    def set_metrics(self, metrics_index: MetricsIndex, content_hash: str) -> None:
+        self.metrics_index = metrics_index
+        self.metrics_hash = content_hash
+        self.updated_at = time.time()
+
+    def search_context(self, query: str, top_k: int = 3) -> List[Tuple[str, float, Optional[int]]]:
+        """
+        Returns (text, l2 distance, token count) tuples of the context chunks closest to the query
+        """
+        if self.context_index is None:
+            raise ValueError(f"Evaluation context not loaded in workspace '{self.name}'. Please upload context documents first.")
+        query_vec = get_embedder().encode([query]).astype('float32')
+        D, I = self.context_index.search(query_vec, k=top_k)
+        return [(self.id_to_text[i], float(d), self.id_to_tokens.get(i)) for i, d in zip(I[0], D[0]) if i != -1]
+
+    def search_context_batch(self, query_vecs: np.ndarray, top_k: int = 3) -> List[List[Tuple[str, float, Optional[int]]]]:
+        """
+        search_context for many already embedded queries with a single FAISS search
+        """
+        if self.context_index is None:
+            raise ValueError(f"Evaluation context not loaded in workspace '{self.name}'. Please upload context documents first.")
+        D, I = self.context_index.search(np.asarray(query_vecs, dtype='float32'), k=top_k)
+        return [[(self.id_to_text[i], float(d), self.id_to_tokens.get(i)) for i, d in zip(ids, dists) if i != -1] for ids, dists in zip(I, D)]
+
+    def memory_bytes(self) -> int:
+        size = sum(len(text) for text in self.id_to_text.values())
+        if self.context_index is not None:
+            size += self.context_index.ntotal * self.context_index.d * 4
+        if self.metrics_index is not None:
+            size += self.metrics_index.memory_bytes()
+        return size
+
+    def meta(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "context_hash": self.context_hash,
+            "metrics_hash": self.metrics_hash,
+            "context_chunks": len(self.id_to_text),
+            "metrics_records": len(self.metrics_index) if self.metrics_index is not None else 0,
+            "updated_at": self.updated_at,
+        }
+
+    def save(self) -> None:
+        """
+        Writes the workspace to EVAL_WORKSPACES_DIR/<name>/, meta.json last so a partial write is never loaded
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if self.context_index is not None:
+            faiss.write_index(self.context_index, os.path.join(self.directory, "context.faiss"))
+            with open(os.path.join(self.directory, "context_chunks.json"), 'w', encoding='utf-8') as f:
+                json.dump({"chunks": [self.id_to_text[i] for i in range(len(self.id_to_text))], "tokens": self.id_to_tokens}, f, ensure_ascii=False)
+        if self.metrics_index is not None:
+            self.metrics_index.save(os.path.join(self.directory, "metrics"))
+        tmp_path = os.path.join(self.directory, "meta.json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta(), f)
+        os.replace(tmp_path, os.path.join(self.directory, "meta.json"))
+
+    @classmethod
+    def load(cls, name: str) -> "EvaluationWorkspace":
+        workspace = cls(name)
+        with open(os.path.join(workspace.directory, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        workspace.updated_at = meta.get("updated_at", time.time())
+        if meta.get("context_hash"):
+            workspace.context_index = faiss.read_index(os.path.join(workspace.directory, "context.faiss"))
+            with open(os.path.join(workspace.directory, "context_chunks.json"), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            workspace.id_to_text = {i: text for i, text in enumerate(data["chunks"])}
+            workspace.id_to_tokens = {int(i): tokens for i, tokens in data.get("tokens", {}).items()}
+            workspace.context_hash = meta["context_hash"]
+        if meta.get("metrics_hash"):
+            workspace.metrics_index = MetricsIndex.load(os.path.join(workspace.directory, "metrics"))
+            workspace.metrics_hash = meta["metrics_hash"]
+        return workspace
+
+# workspaces held in memory, least recently used first
+_loaded: "OrderedDict[str, EvaluationWorkspace]" = OrderedDict()
+_lock = threading.RLock()
+
+def validate_name(name: str) -> str:
+    if not _NAME_PATTERN.match(name or ""):
+        raise ValueError("Workspace names may only contain letters, digits, '-' and '_' (at most 64 characters).")
+    return name
+
+def _meta_path(name: str) -> str:
+    return os.path.join(EVAL_WORKSPACES_DIR, name, "meta.json")
+
+def _enforce_memory_budget(keep: str) -> None:
+    '''
+    Unloads least recently used workspaces until the loaded ones fit EVAL_WORKSPACE_MEMORY_MB.
+    They stay on disk and are reloaded when used again.
+    '''
+    budget = EVAL_WORKSPACE_MEMORY_MB * 1024 * 1024
+    total = sum(w.memory_bytes() for w in _loaded.values())
+    for name in list(_loaded.keys()):
+        if total <= budget:
+            break
+        if name == keep:
+            continue
+        total -= _loaded.pop(name).memory_bytes()
+        print(f"Evaluation workspace '{name}' unloaded to stay within {EVAL_WORKSPACE_MEMORY_MB:.0f} MB")
+
+def get_workspace(name: str, create: bool = False) -> EvaluationWorkspace:
+    """
+    Returns the workspace from memory, loading it from disk if needed.
+    Creates an empty one when create is set, otherwise raises ValueError for unknown names.
+    """
+    validate_name(name)
+    with _lock:
+        workspace = _load(name, create)
+        _enforce_memory_budget(keep=name)
+        return workspace
+
+def _load(name: str, create: bool = False) -> EvaluationWorkspace:
+    workspace = _loaded.get(name)
+    if workspace is None:
+        if os.path.exists(_meta_path(name)):
+            start = time.perf_counter()
+            workspace = EvaluationWorkspace.load(name)
+            print(f"Evaluation workspace '{name}' loaded from disk in {time.perf_counter()-start:.2f}s")
+        elif create:
+            workspace = EvaluationWorkspace(name)
+        else:
+            raise ValueError(f"Evaluation workspace '{name}' does not exist. Please upload context and metrics files first.")
+        _loaded[name] = workspace
+    _loaded.move_to_end(name)
+    return workspace
+
+def save_workspace(workspace: EvaluationWorkspace) -> None:
+    with _lock:
+        workspace.save()
+        _enforce_memory_budget(keep=workspace.name)
+
+def _all_names() -> List[str]:
+    on_disk = [name for name in os.listdir(EVAL_WORKSPACES_DIR) if os.path.exists(_meta_path(name))] if os.path.isdir(EVAL_WORKSPACES_DIR) else []
+    return sorted(set(on_disk) | set(_loaded.keys()))
+
+def find_by_hash(field: str, content_hash: str) -> Optional[EvaluationWorkspace]:
+    '''
+    A workspace whose context_hash/metrics_hash matches, so an identical upload can reuse its embeddings.
+    The memory budget isn't enforced here, loading the match could otherwise unload the workspace being uploaded to;
+    it is enforced again when that workspace is saved.
+    '''
+    with _lock:
+        for workspace in _loaded.values():
+            if getattr(workspace, field) == content_hash:
+                return workspace
+        for name in _all_names():
+            if name in _loaded:
+                continue
+            try:
+                with open(_meta_path(name), 'r', encoding='utf-8') as f:
+                    if json.load(f).get(field) == content_hash:
+                        return _load(name)
+            except (OSError, ValueError):
+                continue
+    return None
+
+def list_workspaces() -> List[Dict[str, Any]]:
+    with _lock:
+        result = []
+        for name in _all_names():
+            if name in _loaded:
+                meta = _loaded[name].meta()
+                meta.update({"loaded": True, "memory_mb": round(_loaded[name].memory_bytes() / (1024 * 1024), 2)})
+            else:
+                try:
+                    with open(_meta_path(name), 'r', encoding='utf-8') as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                meta["loaded"] = False
+            result.append(meta)
+        return result
+
+def delete_workspace(name: str) -> bool:
+    validate_name(name)
+    with _lock:
+        existed = _loaded.pop(name, None) is not None
+        directory = os.path.join(EVAL_WORKSPACES_DIR, name)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+            existed = True
+        return existed
@@ -1,23 +1,25 @@
 # services/evaluator_service.py
 import pymupdf
+import asyncio
+import hashlib
+import time
 import json
 import os
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Any, AsyncIterator
 
 # Import the actual LLM model from the models directory
-from models.llm_model import llm_model
+from models.llm_model import generate_completion, wait_for_llm_model
+from models.embedder_model import get_embedder
+from services import context_packer
+from services.metrics_index import MetricsIndex
+from services import eval_workspaces
+from services.eval_workspaces import DEFAULT_WORKSPACE
+from core.config import EVAL_METRICS_TOKEN_SHARE
 
-# Global variables for the RAG-like component within the evaluator
-# These will store the index for evaluation context documents
-_eval_context_index: Optional[faiss.IndexFlatL2] = None
-_eval_context_id_to_text: Dict[int, str] = {}
-_embedder = SentenceTransformer('all-MiniLM-L6-v2')
-
-# NEW: Global variable to store the loaded metrics data
-_current_metrics_data: Optional[Dict] = None
+# The context index and metrics index (metrics flattened into key-path records, only the records relevant
+# to a question go into its prompt) live in named workspaces, see services/eval_workspaces.py
 
 def _extract_json_information(filepath: str) -> dict:
     """
@@ -44,7 +46,7 @@ def _embed_text(text: str) -> Tuple[List[str], np.ndarray]:
     Returns chunks and their corresponding embeddings.
     """
     chunks = _split_into_chunks(text)
-    vectors = _embedder.encode(chunks)
+    vectors = get_embedder().encode(chunks)
     return chunks, vectors
 
 def _extract_text_from_pdf(filepath: str) -> str:
@@ -57,33 +59,30 @@ def _extract_text_from_pdf(filepath: str) -> str:
         full_text += page.get_text()
     return full_text
 
-def _create_faiss_index_for_eval_context(vectors: np.ndarray, chunks: List[str]):
+def _files_hash(filepaths: List[str]) -> str:
     """
-    Creates and populates a FAISS index for evaluation context documents.
+    Content hash of the given files, identical uploads share their embeddings across workspaces.
     """
-    global _eval_context_index
-    global _eval_context_id_to_text
-    dimension = vectors.shape[1]
-    _eval_context_index = faiss.IndexFlatL2(dimension)
-    _eval_context_index.reset()
-    _eval_context_index.add(np.array(vectors).astype('float32'))
-    _eval_context_id_to_text = {i: text for i, text in enumerate(chunks)}
+    digest = hashlib.sha256()
+    for path in filepaths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
 
-def _search_eval_context_chunks(query: str, top_k: int = 3) -> List[str]:
+def _search_eval_context_chunks(query: str, top_k: int = 3, workspace: str = DEFAULT_WORKSPACE) -> List[str]:
     """
-    Searches the evaluation context FAISS index for the top_k most similar chunks to the query.
+    Searches the evaluation context FAISS index of the workspace for the top_k most similar chunks to the query.
     """
-    if _eval_context_index is None:
-        raise ValueError("Evaluation context index has not been created. Please upload evaluation context documents first.")
-    query_vec = _embedder.encode([query]).astype('float32')
-    D, I = _eval_context_index.search(query_vec, k=top_k)
-    return [_eval_context_id_to_text[i] for i in I[0]]
+    return [text for text, _, _ in eval_workspaces.get_workspace(workspace).search_context(query, top_k)]
 
-async def process_eval_context_files(filepaths: List[str]) -> None:
+def _search_eval_context_chunks_with_scores(query: str, top_k: int = 3, workspace: str = DEFAULT_WORKSPACE) -> List[Tuple[str, float, Optional[int]]]:
     """
-    Public function to process evaluation context documents for text extraction and embedding,
-    then creates the FAISS index. This is called by the new upload endpoint.
+    Same as _search_eval_context_chunks, but returns (text, l2 distance, token count) tuples for prompt packing.
     """
+    return eval_workspaces.get_workspace(workspace).search_context(query, top_k)
+
+def _extract_and_embed(filepaths: List[str]) -> Tuple[List[str], np.ndarray]:
     all_chunks = []
     all_vectors = []
     for path in filepaths:
@@ -101,55 +100,60 @@ async def process_eval_context_files(filepaths: List[str]) -> None:
             all_chunks.extend(chunks)
             all_vectors.append(vectors)
 
-    if all_vectors:
-        combined_vectors = np.vstack(all_vectors)
-        _create_faiss_index_for_eval_context(combined_vectors, all_chunks)
-    else:
+    if not all_vectors:
         raise ValueError('No text extracted from the provided evaluation context files.')
+    return all_chunks, np.vstack(all_vectors)
 
-async def set_current_metrics_data(filepath: str) -> None:
+async def process_eval_context_files(filepaths: List[str], workspace: str = DEFAULT_WORKSPACE) -> None:
     """
-    NEW PUBLIC FUNCTION: Loads the metrics JSON file and stores its content globally.
+    Public function to process evaluation context documents for text extraction and embedding,
+    then creates the FAISS index of the workspace. This is called by the upload endpoint.
+    Files already embedded for any workspace are reused instead of being embedded again.
     """
-    global _current_metrics_data
-    try:
-        _current_metrics_data = _extract_json_information(filepath)
-    except FileNotFoundError as e:
-        raise ValueError(f"Metrics JSON file not found: {filepath}. {e}")
-    except json.JSONDecodeError:
-        raise ValueError(f"Could not decode metrics JSON file at {filepath}. It might be malformed.")
-
+    target = eval_workspaces.get_workspace(workspace, create=True)
+    content_hash = await asyncio.to_thread(_files_hash, filepaths)
+    if target.context_hash == content_hash:
+        return
+    source = await asyncio.to_thread(eval_workspaces.find_by_hash, "context_hash", content_hash)
+    if source is not None:
+        print(f"Evaluator - reusing context embeddings of workspace '{source.name}'")
+        target.copy_context_from(source)
+    else:
+        chunks, vectors = await asyncio.to_thread(_extract_and_embed, filepaths)
+        target.set_context(chunks, vectors, context_packer.count_tokens_if_ready(chunks), content_hash)
+    await asyncio.to_thread(eval_workspaces.save_workspace, target)
 
-async def get_evaluation_feedback(
-    question: str,
-    history: List[Tuple[str, str]],
-    max_tokens: int
-) -> str:
+async def set_current_metrics_data(filepath: str, workspace: str = DEFAULT_WORKSPACE) -> None:
     """
-    Generates evaluation feedback using the LLM, integrating context from already processed documents
-    and globally stored metrics data.
+    Flattens and indexes the metrics JSON file into the workspace.
     """
-    # Check if metrics data has been loaded
-    if _current_metrics_data is None:
-        raise ValueError("Metrics data not loaded. Please upload the metrics JSON file first.")
-
-    # Check if context index has been created
-    if _eval_context_index is None:
-        raise ValueError("Evaluation context not loaded. Please upload context documents first.")
+    target = eval_workspaces.get_workspace(workspace, create=True)
+    try:
+        content_hash = await asyncio.to_thread(_files_hash, [filepath])
+    except FileNotFoundError as e:
+        raise ValueError(f"Metrics JSON file not found: {filepath}. {e}")
+    if target.metrics_hash == content_hash:
+        return
+    source = await asyncio.to_thread(eval_workspaces.find_by_hash, "metrics_hash", content_hash)
+    if source is not None:
+        print(f"Evaluator - reusing metrics index of workspace '{source.name}'")
+        target.set_metrics(source.metrics_index, content_hash)
+    else:
+        target.set_metrics(await asyncio.to_thread(MetricsIndex.from_file, filepath), content_hash)
+    await asyncio.to_thread(eval_workspaces.save_workspace, target)
 
-    # Step 1: Retrieve context from the RAG index based on the question
-    context = "\n\n".join(_search_eval_context_chunks(question))
+def list_workspaces() -> List[Dict[str, Any]]:
+    return eval_workspaces.list_workspaces()
 
-    # Step 2: Use the globally stored metrics data
-    metrics = _current_metrics_data
+def delete_workspace(workspace: str) -> bool:
+    return eval_workspaces.delete_workspace(workspace)
 
-    # Step 3: Format chat history for the LLM prompt
-    chat_history_str = ""
-    for q, a in history:
-        chat_history_str += f"Q: {q}\nA: {a}\n\n"
 
-    # Step 4: Construct the final prompt for the LLM
-    final_prompt = f"""<|im_start|>system
+def _build_eval_prompt(metrics: str, context: str, chat_history_str: str, question: str) -> str:
+    """
+    Constructs the final evaluator prompt for the LLM.
+    """
+    return f"""<|im_start|>system
 You are a helpful assistant in a document Q&A app set up, where the task is to generate evaluation feedback. Consider the metrics to contain information on the conducted evaluation. Use the added context, to enhance the answers created from the metrics. If the answer is not present in the context, print "Insufficient context" and nothing else. Structure your response in markdown, using bullet points or headings if appropriate. Ensure that if there is no relevant information, you provide "Insufficient context" and nothing else at all. <|im_end|>
 {chat_history_str}
 <|im_start|>user
@@ -165,16 +169,115 @@ Question:
 {question}<|im_end|>
 <|im_start|>assistant
 """
+
+async def get_evaluation_feedback(
+    question: str,
+    history: List[Tuple[str, str]],
+    max_tokens: int,
+    workspace: str = DEFAULT_WORKSPACE
+) -> Dict[str, Any]:
+    """
+    Generates evaluation feedback using the LLM, integrating context from already processed documents
+    and the metrics data of the workspace.
+    Returns the feedback together with a prompt token usage report.
+    """
+    ws = await asyncio.to_thread(eval_workspaces.get_workspace, workspace)
+
+    # Check if metrics data has been loaded
+    if ws.metrics_index is None:
+        raise ValueError("Metrics data not loaded. Please upload the metrics JSON file first.")
+
+    # Check if context index has been created
+    if ws.context_index is None:
+        raise ValueError("Evaluation context not loaded. Please upload context documents first.")
+
+    await wait_for_llm_model()
+    budget = context_packer.prompt_budget(max_tokens)
+
+    # Step 1: Retrieve the metric subtrees relevant to the question, within their share of the budget
+    template_tokens = context_packer.count_tokens(_build_eval_prompt("", "", "", question))
+    metrics_budget = int((budget - template_tokens) * EVAL_METRICS_TOKEN_SHARE)
+    metrics, metrics_usage = await asyncio.to_thread(ws.metrics_index.retrieve, question, metrics_budget)
+    print(f"Evaluator - {metrics_usage['metrics_records']} of {metrics_usage['metrics_records_total']} metric records in the prompt ({metrics_usage['metrics_tokens']} tokens)")
+
+    # Step 2: Retrieve context from the RAG index and pack it with the chat history into the remaining budget
+    scored_chunks = ws.search_context(question)
+    fixed_tokens = context_packer.count_tokens(_build_eval_prompt(metrics, "", "", question))
+    packed = context_packer.pack_context(budget, fixed_tokens, scored_chunks, history)
+
+    context = "\n\n".join(packed["chunks"])
+    chat_history_str = "".join(context_packer.format_history_turn(q, a) for q, a in packed["history"])
+
+    # Step 3: Construct the final prompt for the LLM
+    final_prompt = _build_eval_prompt(metrics, context, chat_history_str, question)
+    usage = context_packer.usage_report(final_prompt, packed, budget)
+    usage.update(metrics_usage)
     temp = 0.7
 
-    # Step 5: Call the LLM to get a completion
-    response = llm_model.create_completion(
+    # Step 4: Call the LLM to get a completion
+    response = await generate_completion(
         prompt=final_prompt,
         temperature=temp,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        endpoint="evaluator"
     )
 
     assistant_reply = response['choices'][0]['text']
     assistant_reply = assistant_reply.replace("[/INST]", "").strip()
-    return assistant_reply
+    return {"feedback": assistant_reply, "usage": usage}
+
+async def get_batch_evaluation_feedback(
+    questions: List[str],
+    max_tokens: int,
+    workspace: str = DEFAULT_WORKSPACE
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Answers many questions about one workspace, yielding each answer as soon as it is generated.
+    The questions are embedded in one call and searched in one batched FAISS search per index.
+    All prompts share the system prompt, instructions and one metrics block retrieved for the whole batch,
+    and are generated one after another on the sequential path, so llama.cpp keeps that common prefix
+    in its KV cache and only evaluates each question's context and question.
+    """
+    ws = await asyncio.to_thread(eval_workspaces.get_workspace, workspace)
+    if ws.metrics_index is None:
+        raise ValueError("Metrics data not loaded. Please upload the metrics JSON file first.")
+    if ws.context_index is None:
+        raise ValueError("Evaluation context not loaded. Please upload context documents first.")
+
+    await wait_for_llm_model()
+    budget = context_packer.prompt_budget(max_tokens)
+    start = time.perf_counter()
+
+    # One embedding call for every question, raw vectors for the L2 context index, normalised ones for metrics
+    query_vecs = np.asarray(await asyncio.to_thread(get_embedder().encode, questions), dtype='float32')
+    normalised_vecs = query_vecs / np.maximum(np.linalg.norm(query_vecs, axis=1, keepdims=True), 1e-12)
+    scored_chunks = await asyncio.to_thread(ws.search_context_batch, query_vecs)
+
+    # A single metrics block relevant to the whole batch keeps the prompt prefix identical across questions
+    longest_template = max((_build_eval_prompt("", "", "", q) for q in questions), key=len)
+    metrics_budget = int((budget - context_packer.count_tokens(longest_template)) * EVAL_METRICS_TOKEN_SHARE)
+    metrics, metrics_usage = await asyncio.to_thread(ws.metrics_index.retrieve_many, questions, metrics_budget, normalised_vecs)
+    retrieval_seconds = time.perf_counter() - start
+    print(f"Evaluator batch - {len(questions)} questions, {metrics_usage['metrics_records']} metric records shared ({metrics_usage['metrics_tokens']} tokens), retrieval took {retrieval_seconds:.2f}s")
+
+    prompt_tokens = 0
+    for index, question in enumerate(questions):
+        fixed_tokens = context_packer.count_tokens(_build_eval_prompt(metrics, "", "", question))
+        packed = context_packer.pack_context(budget, fixed_tokens, scored_chunks[index], [])
+        final_prompt = _build_eval_prompt(metrics, "\n\n".join(packed["chunks"]), "", question)
+        usage = context_packer.usage_report(final_prompt, packed, budget)
+        usage.update(metrics_usage)
+
+        # the sequential path keeps the llama KV cache of the previous prompt, the batching engine does not
+        response = await generate_completion(
+            prompt=final_prompt,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            endpoint="evaluator",
+            use_batching=False
+        )
+        prompt_tokens += usage["prompt_tokens"]
+        assistant_reply = response['choices'][0]['text'].replace("[/INST]", "").strip()
+        yield {"index": index, "question": question, "feedback": assistant_reply, "usage": usage}
 
+    yield {"done": True, "questions": len(questions), "prompt_tokens": prompt_tokens, "retrieval_seconds": round(retrieval_seconds, 3), "total_seconds": round(time.perf_counter() - start, 3)}
@@ -1,21 +1,47 @@
-from sentence_transformers import SentenceTransformer
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
 import faiss
 import numpy as np
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Optional, Set, AsyncIterator
 import traceback
 
 from database import mongodb_client
+from models.embedder_model import get_embedder, is_embedder_loaded, EMBEDDER_MODEL_NAME
+from services import answer_cache, image_metadata_cache, image_thumbnails
+from core.config import (
+    IMAGE_SYNC_INTERVAL_SECONDS,
+    IMAGE_SYNC_USE_CHANGE_STREAM,
+    IMAGE_SYNC_BATCH_SIZE,
+    IMAGE_SYNC_FULL_SCAN_SECONDS,
+    IMAGE_INDEX_DIR,
+    IMAGE_EMBED_BATCH_SIZE,
+)
 
-_image_index: Optional[faiss.IndexFlatL2]=None
+# vectors are stored under stable int64 ids so single documents can be removed or replaced
+_image_index: Optional[faiss.IndexIDMap2]=None
 _image_id_to_metadata: Dict[int, Dict[str, Any]]={}
-_embedder: Optional[SentenceTransformer]=None
+# str(mongo _id) -> index id, and the text each document was embedded from to skip unchanged documents
+_doc_key_to_id: Dict[str, int]={}
+_doc_key_to_text: Dict[str, str]={}
+_next_id=0
+_generation: Optional[str]=None
+_last_sync: Dict[str, Any]={}
+# fingerprint of the collection at the last full sync, a full sync that finds the same one has nothing to do
+_fingerprint: Optional[str]=None
+_last_full_scan=0.0
+_dbhash_supported=True
+_sync_lock=asyncio.Lock()
 
-EMBEDDER_MODEL_NAME='all-MiniLM-L6-v2'
+# change stream operations that name the document they touched, any other (drop, rename, invalidate) needs a full sync
+_DOCUMENT_OPERATIONS=("insert", "update", "replace", "delete")
 
-def _initialise_embedder():
-    global _embedder
-    if _embedder is None:
-        _embedder = SentenceTransformer(EMBEDDER_MODEL_NAME)
+IMAGE_INDEX_PATH=os.path.join(IMAGE_INDEX_DIR, "index.faiss")
+IMAGE_STATE_PATH=os.path.join(IMAGE_INDEX_DIR, "state.json")
 
 def _prepare_image_text_for_embedding(image_doc: Dict[str, Any])->str:
     '''
@@ -26,74 +52,448 @@ def _prepare_image_text_for_embedding(image_doc: Dict[str, Any])->str:
 
     return f"Image of {image_name}. Labels: {labels}." if labels else f"Image of {image_name}."
 
-async def load_and_build_image_index()->bool:
+def _reset_index()->None:
+    global _image_index, _image_id_to_metadata, _doc_key_to_id, _doc_key_to_text, _next_id, _fingerprint
+    _image_index=None
+    _image_id_to_metadata={}
+    _doc_key_to_id={}
+    _doc_key_to_text={}
+    _next_id=0
+    _fingerprint=None
+
+def _collection_fingerprint(collection: Any)->Optional[str]:
     '''
-    Connects to MongoDB, fetches image metadata, and builds an in-memory FAISS index for semantic image search
+    Runs on the MongoDB thread pool. A summary of the collection read without transferring its documents.
+    dbHash is computed by the server over every field. Without the privilege for it, the document count,
+    highest _id and latest updated_at are used, which miss edits that don't set updated_at; the change stream
+    or the full scan every IMAGE_SYNC_FULL_SCAN_SECONDS finds those. None when neither can be read.
     '''
-    global _image_index, _image_id_to_metadata, _embedder
-    if _embedder is None:
-        _initialise_embedder()
+    global _dbhash_supported
+    if _dbhash_supported:
+        try:
+            result=collection.database.command("dbHash", collections=[collection.name])
+            return f"md5:{result['collections'].get(collection.name, '')}"
+        except Exception as e:
+            print(f"Image index sync: dbHash unavailable ({e}), fingerprinting by count and latest document")
+            _dbhash_supported=False
+    try:
+        count=collection.estimated_document_count()
+        last=collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        latest=collection.find_one({"updated_at": {"$exists": True}}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    except Exception as e:
+        print(f"Image index sync: could not fingerprint the collection ({e})")
+        return None
+    return f"stats:{count}:{last['_id'] if last else None}:{latest['updated_at'] if latest else None}"
 
-    print(f"Image indexing")
+def _read_batch(cursor: Any)->List[Dict[str, Any]]:
+    return list(itertools.islice(cursor, IMAGE_SYNC_BATCH_SIZE))
 
+async def _document_batches(collection: Any, ids: Optional[List[Any]])->AsyncIterator[List[Dict[str, Any]]]:
+    '''
+    Reads the documents to compare with the index, IMAGE_SYNC_BATCH_SIZE at a time and only the projected
+    fields: the given _ids (reported by the change stream), or every document when ids is None
+    '''
+    if ids is not None:
+        for start in range(0, len(ids), IMAGE_SYNC_BATCH_SIZE):
+            query={"_id": {"$in": ids[start:start+IMAGE_SYNC_BATCH_SIZE]}}
+            yield await mongodb_client.run_in_executor(lambda: list(collection.find(query, mongodb_client.IMAGE_PROJECTION)))
+        return
+    cursor=collection.find({}, mongodb_client.IMAGE_PROJECTION).batch_size(IMAGE_SYNC_BATCH_SIZE)
     try:
-        await mongodb_client.connect_to_mongodb()
-        all_images_docs=await mongodb_client.get_all_image_metadata()
-        if not all_images_docs:
-            print("No images in database")
-            _image_index=None
-            _image_id_to_metadata={}
-            return False
-        
-        texts_to_embed: List[str]=[]
-        metadata_list: List[Dict[str, Any]]=[]
-
-        for doc in all_images_docs:
-            if "image_name" in doc and "image_path" in doc:
-                texts_to_embed.append(_prepare_image_text_for_embedding(doc))   
-                metadata_list.append({
-                    "image_name": doc["image_name"],
-                    "image_path": doc["image_path"],
-                    "labels": doc.get("labels", [])
-                })
+        while True:
+            batch=await mongodb_client.run_in_executor(_read_batch, cursor)
+            if not batch:
+                return
+            yield batch
+    finally:
+        await mongodb_client.run_in_executor(cursor.close)
+
+def _save_state()->None:
+    '''
+    Runs on a worker thread while the sync lock is held. Writes the index, then the state describing it,
+    each atomically. The state records ntotal so an index and state from different syncs are never combined.
+    '''
+    if _image_index is None:
+        return
+    state={
+        "embedder": EMBEDDER_MODEL_NAME,
+        "generation": _generation,
+        "next_id": _next_id,
+        "ntotal": _image_index.ntotal,
+        "fingerprint": _fingerprint,
+        "documents": {key: [index_id, _doc_key_to_text[key]] for key, index_id in _doc_key_to_id.items()},
+        "metadata": {str(index_id): metadata for index_id, metadata in _image_id_to_metadata.items()},
+    }
+    try:
+        os.makedirs(IMAGE_INDEX_DIR, exist_ok=True)
+        faiss.write_index(_image_index, f"{IMAGE_INDEX_PATH}.tmp")
+        os.replace(f"{IMAGE_INDEX_PATH}.tmp", IMAGE_INDEX_PATH)
+        with open(f"{IMAGE_STATE_PATH}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(f"{IMAGE_STATE_PATH}.tmp", IMAGE_STATE_PATH)
+    except (OSError, TypeError, ValueError, RuntimeError) as e:
+        print(f"Could not save the image index: {e}")
+
+def _load_state()->Optional[Dict[str, Any]]:
+    '''
+    Runs on a worker thread. Reads the index saved by _save_state, None when there is none or it can't be used
+    '''
+    if not os.path.exists(IMAGE_STATE_PATH) or not os.path.exists(IMAGE_INDEX_PATH):
+        return None
+    try:
+        with open(IMAGE_STATE_PATH, 'r', encoding='utf-8') as f:
+            state=json.load(f)
+        if state.get("embedder")!=EMBEDDER_MODEL_NAME:
+            print(f"Saved image index was built with {state.get('embedder')}, rebuilding with {EMBEDDER_MODEL_NAME}")
+            return None
+        index=faiss.read_index(IMAGE_INDEX_PATH)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Could not load the saved image index: {e}")
+        return None
+    if index.ntotal!=state.get("ntotal"):
+        print("Saved image index and its state don't match, rebuilding")
+        return None
+    state["index"]=index
+    return state
+
+def _restore(state: Dict[str, Any])->None:
+    global _image_index, _image_id_to_metadata, _doc_key_to_id, _doc_key_to_text, _next_id, _generation, _fingerprint
+    _image_index=state["index"]
+    _image_id_to_metadata={int(index_id): metadata for index_id, metadata in state["metadata"].items()}
+    _doc_key_to_id={key: index_id for key, (index_id, _) in state["documents"].items()}
+    _doc_key_to_text={key: text for key, (_, text) in state["documents"].items()}
+    _next_id=state["next_id"]
+    _generation=state["generation"]
+    _fingerprint=state.get("fingerprint")
+    answer_cache.invalidate_index("images", _generation)
+    image_metadata_cache.set_known_images({m["image_name"]: m["image_path"] for m in _image_id_to_metadata.values()})
+    image_thumbnails.schedule(m["image_path"] for m in _image_id_to_metadata.values())
+
+def _embed_changes(docs: Dict[str, Dict[str, Any]])->Tuple[List[Tuple[str, Dict[str, Any], str, Optional[np.ndarray]]], List[str]]:
+    '''
+    Runs on a worker thread while the sync lock is held, so the index doesn't change underneath it.
+    Compares each document with what was indexed for its _id and embeds only the documents whose text
+    changed, so label edits are found whether or not the document has an updated_at.
+    output: (doc key, metadata, text, embedding or None when only metadata changed) upserts, removed keys
+    '''
+    upserts=[]
+    removed=[]
+    to_embed: List[int]=[]
+    for key, doc in docs.items():
+        if "image_name" not in doc or "image_path" not in doc:
+            print(f"Skipping image {key} due to missing metadata")
+            if key in _doc_key_to_id:
+                removed.append(key)
+            continue
+        text=_prepare_image_text_for_embedding(doc)
+        metadata={"image_name": doc["image_name"], "image_path": doc["image_path"], "labels": doc.get("labels", [])}
+        if _doc_key_to_text.get(key)!=text:
+            to_embed.append(len(upserts))
+        elif _image_id_to_metadata.get(_doc_key_to_id.get(key))==metadata:
+            continue
+        upserts.append((key, metadata, text, None))
+
+    for start in range(0, len(to_embed), IMAGE_SYNC_BATCH_SIZE):
+        batch=to_embed[start:start+IMAGE_SYNC_BATCH_SIZE]
+        embeddings=get_embedder().encode([upserts[i][2] for i in batch], batch_size=IMAGE_EMBED_BATCH_SIZE).astype('float32')
+        for i, embedding in zip(batch, embeddings):
+            key, metadata, text, _=upserts[i]
+            upserts[i]=(key, metadata, text, embedding)
+    return upserts, removed
+
+def _apply_changes(upserts: List[Tuple[str, Dict[str, Any], str, Optional[np.ndarray]]], removed: List[str])->Tuple[int, int, int]:
+    '''
+    Applies the changes of one batch to the index. Runs on the event loop without awaiting,
+    so searches never see a half applied batch.
+    output: number of added, updated (re-embedded or new metadata) and removed documents
+    '''
+    global _image_index, _next_id
+    embedded=[(key, metadata, text, embedding) for key, metadata, text, embedding in upserts if embedding is not None]
+
+    stale_ids=[_doc_key_to_id[key] for key in removed if key in _doc_key_to_id]
+    stale_ids+=[_doc_key_to_id[key] for key, _, _, _ in embedded if key in _doc_key_to_id]
+    if stale_ids and _image_index is not None:
+        _image_index.remove_ids(np.array(stale_ids, dtype='int64'))
+    for key in removed:
+        index_id=_doc_key_to_id.pop(key, None)
+        _doc_key_to_text.pop(key, None)
+        _image_id_to_metadata.pop(index_id, None)
+
+    added=0
+    if embedded:
+        vectors=np.vstack([embedding for _, _, _, embedding in embedded])
+        if _image_index is None:
+            _image_index=faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+        ids=[]
+        for key, metadata, text, _ in embedded:
+            if key in _doc_key_to_id:
+                _image_id_to_metadata.pop(_doc_key_to_id[key], None)
             else:
-                print(f"Skipping image {doc['id']} due to missing metadata")
+                added+=1
+            _doc_key_to_id[key]=_next_id
+            _doc_key_to_text[key]=text
+            _image_id_to_metadata[_next_id]=metadata
+            ids.append(_next_id)
+            _next_id+=1
+        _image_index.add_with_ids(vectors, np.array(ids, dtype='int64'))
 
-        if not texts_to_embed:
-            print("No images to index")
-            _image_index=None
-            _image_id_to_metadata={}
-            return False
+    # same text, only metadata such as the path changed
+    metadata_only=0
+    for key, metadata, _, embedding in upserts:
+        if embedding is None and key in _doc_key_to_id:
+            _image_id_to_metadata[_doc_key_to_id[key]]=metadata
+            metadata_only+=1
 
-        print(f" Image indexing: Embedding {len(texts_to_embed)}")
-        embeddings=_embedder.encode(texts_to_embed).astype('float32')
+    return added, len(embedded)-added+metadata_only, len([key for key in removed if key not in _doc_key_to_id])
+
+def _publish_changes()->None:
+    '''
+    Starts a new generation after the index changed and passes the change on to the image serving caches
+    '''
+    global _generation
+    _generation=uuid.uuid4().hex
+    answer_cache.invalidate_index("images", _generation)
+    image_metadata_cache.set_known_images({m["image_name"]: m["image_path"] for m in _image_id_to_metadata.values()})
+
+async def sync_image_index(collection: Optional[Any]=None, ids: Optional[List[Any]]=None, skip_unchanged: bool=False)->Dict[str, Any]:
+    '''
+    Brings the image index up to date with the collection, embedding only new or changed documents
+    and removing deleted ones. With ids only those documents are re-read (the change stream reports them),
+    otherwise the whole collection is compared with the index, one batch at a time, so memory holds a
+    batch and the keys seen rather than the collection. With skip_unchanged a full sync whose collection
+    fingerprint matches the last one reads nothing. collection defaults to the configured
+    MongoDB collection (any pymongo compatible collection works, e.g. mongomock for tests).
+    '''
+    global _last_sync, _fingerprint, _last_full_scan
+    async with _sync_lock:
+        if collection is None:
+            collection=mongodb_client.get_image_collection()
+        start=time.perf_counter()
+        fingerprint=None
+        if ids is None:
+            fingerprint=await mongodb_client.run_in_executor(_collection_fingerprint, collection)
+            if skip_unchanged and fingerprint is not None and fingerprint==_fingerprint and _generation is not None:
+                _last_sync={"mode": "unchanged", "documents_read": 0, "added": 0, "updated": 0, "removed": 0,
+                            "seconds": round(time.perf_counter()-start, 3), "finished_at": time.time()}
+                return dict(_last_sync)
 
-        dimension=embeddings.shape[1]
-        _image_index=faiss.IndexFlatL2(dimension)
-        _image_index.add(embeddings)
+        read=added=updated=deleted=0
+        seen: Set[str]=set()
+        batches=_document_batches(collection, ids)
+        try:
+            async for batch in batches:
+                docs={str(doc["_id"]): doc for doc in batch}
+                read+=len(docs)
+                seen.update(docs)
+                upserts, removed=await asyncio.to_thread(_embed_changes, docs)
+                batch_added, batch_updated, batch_deleted=_apply_changes(upserts, removed)
+                added, updated, deleted=added+batch_added, updated+batch_updated, deleted+batch_deleted
+                image_thumbnails.schedule(metadata["image_path"] for _, metadata, _, _ in upserts)
 
-        _image_id_to_metadata={i: metadata_list[i] for i in range(len(metadata_list))}
+            # deletions are only known once every document was seen
+            if ids is None:
+                removed=[key for key in _doc_key_to_id if key not in seen]
+            else:
+                removed=[str(_id) for _id in ids if str(_id) not in seen and str(_id) in _doc_key_to_id]
+            deleted+=_apply_changes([], removed)[2]
+        except BaseException:
+            if added or updated or deleted:
+                # the batches applied so far are already searchable
+                _publish_changes()
+            raise
+        finally:
+            # closes the cursor of a sync that failed part way
+            await batches.aclose()
+
+        changed=bool(added or updated or deleted or _generation is None)
+        if changed:
+            _publish_changes()
+        previous_fingerprint=_fingerprint
+        if ids is None:
+            _fingerprint=fingerprint
+            _last_full_scan=time.monotonic()
+        else:
+            # the last full sync's fingerprint no longer describes what is indexed
+            _fingerprint=None
+        if changed or _fingerprint!=previous_fingerprint:
+            await asyncio.to_thread(_save_state)
+        _last_sync={
+            "mode": "full" if ids is None else "changes",
+            "documents_read": read,
+            "added": added,
+            "updated": updated,
+            "removed": deleted,
+            "seconds": round(time.perf_counter()-start, 3),
+            "finished_at": time.time(),
+        }
+        if added or updated or deleted:
+            print(f"Image index sync: +{added} ~{updated} -{deleted} in {_last_sync['seconds']}s, {len(_doc_key_to_id)} images indexed")
+        return dict(_last_sync)
+
+async def add_documents(collection: Any, docs: List[Dict[str, Any]])->Dict[str, float]:
+    '''
+    Embeds documents that were just inserted into collection and appends them to the live index, without a sync.
+    output: seconds spent embedding and updating the index
+    '''
+    async with _sync_lock:
+        start=time.perf_counter()
+        # the next sync reads these documents again and finds them unchanged
+        upserts, removed=await asyncio.to_thread(_embed_changes, {str(doc["_id"]): doc for doc in docs})
+        embed_seconds=time.perf_counter()-start
+
+        start=time.perf_counter()
+        added, updated, deleted=_apply_changes(upserts, removed)
+        if added or updated or deleted:
+            _publish_changes()
+            image_thumbnails.schedule(metadata["image_path"] for _, metadata, _, _ in upserts)
+            await asyncio.to_thread(_save_state)
+        print(f"Image index: appended {added} ingested images, {len(_doc_key_to_id)} images indexed")
+        return {"embed_seconds": embed_seconds, "index_seconds": time.perf_counter()-start}
+
+async def load_and_build_image_index()->bool:
+    '''
+    Connects to MongoDB and loads the FAISS index for semantic image search saved by the last run,
+    then compares it with the collection so only documents changed since are embedded. When the collection
+    fingerprint is the one saved with the index nothing is read. Without a saved index everything is
+    embedded. Later changes are picked up by run_image_sync_loop().
+    output: whether any image was indexed. Raises when MongoDB can't be reached or the index can't be built.
+    '''
+    print(f"Image indexing")
+
+    try:
+        await mongodb_client.connect_to_mongodb()
+        collection=mongodb_client.get_image_collection()
+        start=time.perf_counter()
+        async with _sync_lock:
+            _reset_index()
+            state=await asyncio.to_thread(_load_state)
+            if state is not None:
+                _restore(state)
+        if state is not None:
+            print(f"Image index loaded from disk in {time.perf_counter()-start:.2f}s, syncing changes")
+        await sync_image_index(collection, skip_unchanged=True)
+        if not _doc_key_to_id:
+            print("No images to index")
+            return False
         return True
 
     except Exception as e:
         print(f"Error indexing images: {e}")
         traceback.print_exc()
-        _image_index=None
-        _image_id_to_metadata={}
-        return False
-    
+        _reset_index()
+        raise
+
+def _watch_changes(collection: Any, loop: asyncio.AbstractEventLoop, wake: asyncio.Event, stop: threading.Event, changes: Dict[str, Any], lock: threading.Lock)->None:
+    '''
+    Follows the change stream and records the _id of every inserted, updated, replaced or deleted document
+    in changes["ids"] for the sync loop. Change streams need a replica set, on a standalone server this
+    returns straight away and the loop keeps polling.
+    '''
+    def notify()->None:
+        if not stop.is_set():
+            loop.call_soon_threadsafe(wake.set)
+
+    try:
+        with collection.watch(max_await_time_ms=1000) as stream:
+            print("Image index sync: following the MongoDB change stream")
+            # changes made before the stream opened are caught up with one full sync
+            with lock:
+                changes["active"]=True
+                changes["full"]=True
+            notify()
+            while not stop.is_set():
+                change=stream.try_next()
+                if change is None:
+                    continue
+                with lock:
+                    if change.get("operationType") in _DOCUMENT_OPERATIONS and "documentKey" in change:
+                        _id=change["documentKey"]["_id"]
+                        changes["ids"][str(_id)]=_id
+                    else:
+                        changes["full"]=True
+                notify()
+    except Exception as e:
+        print(f"Image index sync: change stream unavailable ({e}), polling every {IMAGE_SYNC_INTERVAL_SECONDS:.0f}s")
+    finally:
+        with lock:
+            was_active=changes["active"]
+            changes["active"]=False
+            changes["full"]=True
+        if was_active:
+            notify()
+
+async def run_image_sync_loop(collection: Optional[Any]=None)->None:
+    '''
+    Keeps the image index in sync until cancelled. While the change stream is open only the documents it
+    reports are re-read. Otherwise the collection fingerprint is checked every IMAGE_SYNC_INTERVAL_SECONDS and
+    the collection compared with the index when it changed, or at least every IMAGE_SYNC_FULL_SCAN_SECONDS
+    '''
+    if collection is None:
+        try:
+            collection=mongodb_client.get_image_collection()
+        except RuntimeError as e:
+            print(f"Image index sync disabled: {e}")
+            return
+
+    wake=asyncio.Event()
+    stop=threading.Event()
+    lock=threading.Lock()
+    changes: Dict[str, Any]={"ids": {}, "full": False, "active": False}
+    watcher: Optional[threading.Thread]=None
+    if IMAGE_SYNC_USE_CHANGE_STREAM:
+        watcher=threading.Thread(target=_watch_changes, args=(collection, asyncio.get_running_loop(), wake, stop, changes, lock), name="image-change-stream", daemon=True)
+        watcher.start()
+    elif IMAGE_SYNC_INTERVAL_SECONDS<=0:
+        return
+
+    try:
+        while True:
+            # asyncio.wait rather than wait_for, which can swallow the shutdown cancel when wake is set at the same moment
+            waiter=asyncio.ensure_future(wake.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=IMAGE_SYNC_INTERVAL_SECONDS if IMAGE_SYNC_INTERVAL_SECONDS>0 else None)
+            finally:
+                waiter.cancel()
+            wake.clear()
+            with lock:
+                full=changes["full"] or not changes["active"]
+                ids=list(changes["ids"].values())
+                changes["ids"]={}
+                changes["full"]=False
+            if not full and not ids:
+                continue
+            skip_unchanged=IMAGE_SYNC_FULL_SCAN_SECONDS<=0 or time.monotonic()-_last_full_scan<IMAGE_SYNC_FULL_SCAN_SECONDS
+            try:
+                await sync_image_index(collection, ids=None if full else ids, skip_unchanged=skip_unchanged)
+            except Exception as e:
+                print(f"Error syncing image index: {e}")
+                # the reported ids are gone from changes, compare everything on the next pass
+                with lock:
+                    changes["full"]=True
+    finally:
+        stop.set()
+        if watcher is not None:
+            # the watcher checks stop at least every second, it is gone before the MongoDB client is closed
+            await asyncio.to_thread(watcher.join, 5)
+
+def get_generation()->Optional[str]:
+    '''
+    Changes whenever a sync changes the indexed images, cached answers from older generations are dropped
+    '''
+    return _generation
+
 async def search_image_semantic(query_text: str, top_k: int=3)->List[Dict[str, Any]]:
     """
     Performs semantic search on image metadata index
     """
-    global _image_index, _image_id_to_metadata, _embedder
+    global _image_index, _image_id_to_metadata
 
-    if _image_index is None or _embedder is None:
+    if _image_index is None or _image_index.ntotal==0 or not is_embedder_loaded():
         print("Image index not initialized")
         return []
-    
+
     try:
-        query_vec=_embedder.encode([query_text]).astype('float32')
+        query_vec=get_embedder().encode([query_text]).astype('float32')
         D, I=_image_index.search(query_vec, k=top_k)
 
         relevant_images_metadata=[]
@@ -109,12 +509,12 @@ async def search_image_semantic(query_text: str, top_k: int=3)->List[Dict[str, A
 
         print(f"Image Indexing: Found {len(relevant_images_metadata)} relevant images for query")
         return relevant_images_metadata
-    
+
     except Exception as e:
         print(f"Error searching images: {e}")
         traceback.print_exc()
         return []
-    
+
 async def get_image_index_status()-> Dict[str, Any]:
     """
     Returns the status of the image index
@@ -124,5 +524,6 @@ async def get_image_index_status()-> Dict[str, Any]:
     return {
         "is_image_index_loaded": is_loaded,
         "num_indexed_images": num_indexed_images,
-        "embedder_status": "Loaded" if _embedder else "Not Loaded"
+        "embedder_status": "Loaded" if is_embedder_loaded() else "Not Loaded",
+        "last_sync": dict(_last_sync),
     }
@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Dict, Any, BinaryIO, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from core.config import IMAGE_UPLOAD_DIR, IMAGE_INGEST_MAX_FILES
+from database import mongodb_client
+from services import image_indexing_service, image_metadata_cache
+
+# only ingested documents carry content_hash, older records are left out of the unique indexes
+_INGESTED={"content_hash": {"$exists": True}}
+_indexes_ready=False
+
+def _stage(seconds: float, items: int, total_bytes: int=0)->Dict[str, float]:
+    stage={"seconds": round(seconds, 4), "items_per_second": round(items/seconds, 2) if seconds>0 else None}
+    if total_bytes:
+        stage["mb_per_second"]=round(total_bytes/(1024*1024)/seconds, 2) if seconds>0 else None
+    return stage
+
+def _validate(files: List[Tuple[str, BinaryIO]], labels: List[List[str]])->List[str]:
+    '''
+    output: the image names, raises ValueError for anything the collection shouldn't receive
+    '''
+    if not files:
+        raise ValueError("No image files were uploaded.")
+    if len(files)>IMAGE_INGEST_MAX_FILES:
+        raise ValueError(f"At most {IMAGE_INGEST_MAX_FILES} images can be ingested per request.")
+    if len(labels)!=len(files):
+        raise ValueError(f"Got labels for {len(labels)} images but {len(files)} files, send one labels entry per file.")
+    names=[os.path.basename(filename or "") for filename, _ in files]
+    for name in names:
+        mime_type, _=mimetypes.guess_type(name)
+        if not name or mime_type is None or not mime_type.startswith("image/"):
+            raise ValueError(f"'{name}' is not an image file name.")
+    duplicates=sorted({name for name in names if names.count(name)>1})
+    if duplicates:
+        raise ValueError(f"Image names must be unique, repeated: {duplicates}")
+    return names
+
+def _ensure_indexes(collection: Any)->None:
+    '''
+    Runs on a MongoDB worker thread. The unique indexes make the duplicate checks hold for concurrent ingests
+    '''
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    try:
+        collection.create_index("content_hash", unique=True, partialFilterExpression=_INGESTED)
+        collection.create_index("image_name", unique=True, partialFilterExpression=_INGESTED)
+        _indexes_ready=True
+    except OperationFailure as e:
+        print(f"Error creating image ingest indexes: {e}")
+
+def _write_files(files: List[Tuple[str, BinaryIO]], names: List[str])->Tuple[List[str], List[str], int]:
+    '''
+    Writes each upload under a new unique name, never over an existing file
+    output: the file paths, the sha256 of each file's content and the total bytes written
+    '''
+    os.makedirs(IMAGE_UPLOAD_DIR, exist_ok=True)
+    paths=[]
+    hashes=[]
+    total_bytes=0
+    try:
+        for (_, fileobj), name in zip(files, names):
+            path=os.path.join(IMAGE_UPLOAD_DIR, f"{uuid.uuid4().hex}_{name}")
+            digest=hashlib.sha256()
+            with open(path, "xb") as buffer:
+                paths.append(path)
+                for chunk in iter(lambda: fileobj.read(1<<20), b""):
+                    digest.update(chunk)
+                    buffer.write(chunk)
+                    total_bytes+=len(chunk)
+            hashes.append(digest.hexdigest())
+    except OSError:
+        _remove_files(paths)
+        raise
+    return paths, hashes, total_bytes
+
+def _is_duplicate(error: Exception)->bool:
+    if isinstance(error, DuplicateKeyError):
+        return True
+    return any(write_error.get("code")==11000 for write_error in error.details.get("writeErrors", []))
+
+def _remove_files(paths: List[str])->None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+async def ingest_images(files: List[Tuple[str, BinaryIO]], labels: List[List[str]])->Dict[str, Any]:
+    '''
+    input: (filename, binary file object) pairs and the labels of each image, in the same order
+    output: the ingested image names and the time and throughput of every stage
+    Writes the files to IMAGE_UPLOAD_DIR, inserts their metadata with one insert_many and appends
+    them to the live image index. Raises ValueError for invalid uploads, or names or content already in the collection.
+    '''
+    names=_validate(files, labels)
+    collection=mongodb_client.get_image_collection()
+    existing=await mongodb_client.run_in_executor(
+        lambda: sorted(doc["image_name"] for doc in collection.find({"image_name": {"$in": names}}, {"image_name": 1}))
+    )
+    if existing:
+        raise ValueError(f"Images already exist: {existing}")
+
+    start=time.perf_counter()
+    paths, hashes, total_bytes=await asyncio.to_thread(_write_files, files, names)
+    write_seconds=time.perf_counter()-start
+
+    repeated=sorted(name for name, content_hash in zip(names, hashes) if hashes.count(content_hash)>1)
+    if repeated:
+        _remove_files(paths)
+        raise ValueError(f"Images with the same content were uploaded more than once: {repeated}")
+    try:
+        await mongodb_client.run_in_executor(_ensure_indexes, collection)
+        same_content=await mongodb_client.run_in_executor(
+            lambda: sorted(doc["image_name"] for doc in collection.find({"content_hash": {"$in": hashes}}, {"image_name": 1}))
+        )
+    except Exception:
+        _remove_files(paths)
+        raise
+    if same_content:
+        _remove_files(paths)
+        raise ValueError(f"Images with the same content already exist: {same_content}")
+
+    # naive UTC, the form pymongo returns stored dates in
+    now=datetime.now(timezone.utc).replace(tzinfo=None)
+    docs=[
+        {
+            "image_name": name,
+            "image_path": path,
+            "labels": [label.strip() for label in image_labels if label.strip()],
+            "content_hash": content_hash,
+            "updated_at": now,
+        }
+        for name, path, content_hash, image_labels in zip(names, paths, hashes, labels)
+    ]
+    start=time.perf_counter()
+    try:
+        # insert_many sets _id on each document
+        await mongodb_client.run_in_executor(collection.insert_many, docs, ordered=True)
+    except (BulkWriteError, DuplicateKeyError) as e:
+        # a concurrent ingest inserted the same name or content after the checks above,
+        # the documents inserted before the conflict are taken back out with their files
+        await mongodb_client.run_in_executor(collection.delete_many, {"_id": {"$in": [doc["_id"] for doc in docs]}})
+        _remove_files(paths)
+        if not _is_duplicate(e):
+            raise
+        raise ValueError("Images with the same name or content were ingested at the same time, nothing was added.")
+    except Exception:
+        _remove_files(paths)
+        raise
+    insert_seconds=time.perf_counter()-start
+
+    for name in names:
+        image_metadata_cache.invalidate(name)
+    timings=await image_indexing_service.add_documents(collection, docs)
+    print(f"Ingested {len(docs)} images ({total_bytes} bytes)")
+    return {
+        "ingested": names,
+        "stages": {
+            "write": _stage(write_seconds, len(docs), total_bytes),
+            "insert": _stage(insert_seconds, len(docs)),
+            "embed": _stage(timings["embed_seconds"], len(docs)),
+            "index": _stage(timings["index_seconds"], len(docs)),
+        },
+    }
@@ -0,0 +1,124 @@
+import asyncio
+import mimetypes
+import os
+import time
+from typing import Dict, Any, Optional
+
+from core.config import IMAGE_NEGATIVE_CACHE_TTL_SECONDS, IMAGE_NEGATIVE_CACHE_MAX_ENTRIES, IMAGE_FILE_REVALIDATE_SECONDS
+from database import mongodb_client
+
+# image_name -> image_path of every indexed image, replaced by each image index sync
+_known_paths: Dict[str, str]={}
+# image_name -> {"path", "size", "mtime", "mime"} of files served at least once
+_files: Dict[str, Dict[str, Any]]={}
+# image_name -> when its file info was last checked against the file
+_checked_at: Dict[str, float]={}
+# image_name -> (expires at, error), lookups that failed recently are not repeated until they expire
+_missing: Dict[str, tuple]={}
+_stats={"hits": 0, "misses": 0, "negative_hits": 0, "stale": 0}
+
+def set_known_images(paths: Dict[str, str])->None:
+    '''
+    Called by the image index sync with image_name -> image_path of every indexed image.
+    Cached file info is dropped for images that were removed or moved, and names that appeared are no longer negative.
+    '''
+    global _known_paths
+    _known_paths=dict(paths)
+    for name in list(_files):
+        if _known_paths.get(name)!=_files[name]["path"]:
+            del _files[name]
+            _checked_at.pop(name, None)
+    for name in list(_missing):
+        if name in _known_paths:
+            del _missing[name]
+
+def invalidate(image_name: str)->None:
+    _files.pop(image_name, None)
+    _checked_at.pop(image_name, None)
+    _missing.pop(image_name, None)
+
+def _remember_missing(image_name: str, error: Exception)->None:
+    _missing.pop(image_name, None)
+    _missing[image_name]=(time.monotonic()+IMAGE_NEGATIVE_CACHE_TTL_SECONDS, error)
+    while len(_missing)>IMAGE_NEGATIVE_CACHE_MAX_ENTRIES:
+        del _missing[next(iter(_missing))]
+
+def _stat(image_path: str)->Dict[str, Any]:
+    if not os.path.isabs(image_path):
+        print(f"WARNING: Image path '{image_path}' is not absolute. This might cause issues.")
+    try:
+        st=os.stat(image_path)
+    except OSError:
+        st=None
+    if st is None or not os.path.isfile(image_path):
+        raise FileNotFoundError(f"Image file not found on server at '{image_path}'.")
+    mime_type, _=mimetypes.guess_type(image_path)
+    return {"path": image_path, "size": st.st_size, "mtime": st.st_mtime, "mime": mime_type or "application/octet-stream"}
+
+def _is_current(info: Dict[str, Any])->bool:
+    '''
+    Runs on a worker thread. A file replaced at the same path no longer matches the cached size and mtime
+    '''
+    try:
+        st=os.stat(info["path"])
+    except OSError:
+        return False
+    return st.st_size==info["size"] and st.st_mtime==info["mtime"]
+
+async def get_image_file(image_name: str)->Dict[str, Any]:
+    '''
+    input: image name
+    output: {"path", "size", "mtime", "mime"} of the image file
+    Raises FileNotFoundError when the image is unknown or its file is missing, ValueError when its record has no path.
+    Cached file info is checked against the file's current size and mtime at most every IMAGE_FILE_REVALIDATE_SECONDS,
+    MongoDB is only asked about names the image index doesn't know.
+    '''
+    info=_files.get(image_name)
+    if info is not None:
+        now=time.monotonic()
+        if now-_checked_at.get(image_name, 0.0)<IMAGE_FILE_REVALIDATE_SECONDS:
+            _stats["hits"]+=1
+            return info
+        if await asyncio.to_thread(_is_current, info):
+            _checked_at[image_name]=now
+            _stats["hits"]+=1
+            return info
+        _stats["stale"]+=1
+        invalidate(image_name)
+
+    missing=_missing.get(image_name)
+    if missing is not None:
+        if missing[0]>time.monotonic():
+            _stats["negative_hits"]+=1
+            # a new exception each time, re-raising the stored one would grow its traceback on every hit
+            raise type(missing[1])(str(missing[1]))
+        del _missing[image_name]
+
+    _stats["misses"]+=1
+    try:
+        image_path=_known_paths.get(image_name)
+        if image_path is None:
+            image_doc=await mongodb_client.get_image_details_by_name(image_name)
+            if not image_doc:
+                raise FileNotFoundError(f"Image '{image_name}' not found in database.")
+            image_path=image_doc.get("image_path")
+            if not image_path:
+                raise ValueError(f"Image path not found for '{image_name}' in database.")
+        info=await asyncio.to_thread(_stat, image_path)
+    except (FileNotFoundError, ValueError) as e:
+        _remember_missing(image_name, e)
+        raise
+
+    _files[image_name]=info
+    _checked_at[image_name]=time.monotonic()
+    return info
+
+def get_status()->Dict[str, Any]:
+    lookups=_stats["hits"]+_stats["misses"]+_stats["negative_hits"]
+    return {
+        **_stats,
+        "hit_rate": round((_stats["hits"]+_stats["negative_hits"])/lookups, 4) if lookups else 0.0,
+        "known_images": len(_known_paths),
+        "cached_files": len(_files),
+        "negative_entries": len(_missing),
+    }
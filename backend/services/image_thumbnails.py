@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import os
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+from core.config import IMAGE_THUMBNAIL_DIR, IMAGE_THUMBNAIL_SIZE, IMAGE_THUMBNAIL_PREGENERATE
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# images that can't be thumbnailed (unreadable, corrupt, oversized, bad EXIF) are served as they are
+_RENDER_ERRORS=(OSError, ValueError)+((Image.DecompressionBombError,) if Image is not None else ())
+
+# ?size= variants, longest side in pixels
+SIZES={"thumb": IMAGE_THUMBNAIL_SIZE}
+
+# (source path, size) -> (thumbnail mtime, thumbnail file info), so serving a ready thumbnail needs no disk access
+_ready: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]]={}
+_queue: Optional[asyncio.Queue]=None
+_worker_task: Optional[asyncio.Task]=None
+
+def _thumbnail_path(source_path: str, size: str)->str:
+    name=hashlib.sha1(source_path.encode('utf-8')).hexdigest()
+    return os.path.join(IMAGE_THUMBNAIL_DIR, f"{name}_{size}")
+
+def _render(source_path: str, size: str)->Optional[Dict[str, Any]]:
+    '''
+    Runs on a worker thread. Writes the thumbnail unless an up to date one is on disk.
+    output: file info of the thumbnail, None when the source can't be read as an image
+    '''
+    source_mtime=os.stat(source_path).st_mtime
+    base=_thumbnail_path(source_path, size)
+    for ext, mime in ((".jpg", "image/jpeg"), (".png", "image/png")):
+        path=base+ext
+        if os.path.exists(path) and os.path.getmtime(path)>=source_mtime:
+            st=os.stat(path)
+            return {"path": path, "size": st.st_size, "mtime": st.st_mtime, "mime": mime}
+
+    try:
+        with Image.open(source_path) as img:
+            img.thumbnail((SIZES[size], SIZES[size]))
+            keep_alpha=img.mode in ("RGBA", "LA", "P")
+            ext, mime, fmt=(".png", "image/png", "PNG") if keep_alpha else (".jpg", "image/jpeg", "JPEG")
+            os.makedirs(IMAGE_THUMBNAIL_DIR, exist_ok=True)
+            path=base+ext
+            tmp_path=f"{path}.tmp"
+            if keep_alpha:
+                img.save(tmp_path, fmt, optimize=True)
+            else:
+                img.convert("RGB").save(tmp_path, fmt, quality=85, optimize=True)
+            os.replace(tmp_path, path)
+    except _RENDER_ERRORS as e:
+        print(f"Could not create thumbnail of '{source_path}': {e}")
+        return None
+    st=os.stat(path)
+    return {"path": path, "size": st.st_size, "mtime": st.st_mtime, "mime": mime}
+
+async def _ensure(source_path: str, source_mtime: Optional[float], size: str)->Optional[Dict[str, Any]]:
+    '''
+    Thumbnail of the source, from memory when source_mtime shows it is still current, otherwise checked on disk and rendered if needed
+    '''
+    ready=_ready.get((source_path, size))
+    if ready is not None and source_mtime is not None and ready[0]>=source_mtime:
+        return ready[1]
+    try:
+        thumbnail=await asyncio.to_thread(_render, source_path, size)
+    except _RENDER_ERRORS as e:
+        print(f"Could not create thumbnail of '{source_path}': {e}")
+        return None
+    if thumbnail is not None:
+        _ready[(source_path, size)]=(thumbnail["mtime"], thumbnail)
+    return thumbnail
+
+async def get_thumbnail(image_file: Dict[str, Any], size: str)->Optional[Dict[str, Any]]:
+    '''
+    input: file info of the original image (see image_metadata_cache) and a key of SIZES
+    output: file info of the thumbnail, rendered now if the background worker hasn't got to it yet.
+    None when Pillow isn't installed or the image can't be decoded, callers then serve the original.
+    '''
+    if Image is None:
+        return None
+    return await _ensure(image_file["path"], image_file["mtime"], size)
+
+async def _worker()->None:
+    while True:
+        source_path=await _queue.get()
+        try:
+            for size in SIZES:
+                await _ensure(source_path, None, size)
+        except Exception as e:
+            print(f"Error pre-generating thumbnail of '{source_path}': {e}")
+        finally:
+            _queue.task_done()
+
+def schedule(source_paths: Iterable[str])->None:
+    '''
+    Queues images for thumbnail generation, called after each image index sync
+    '''
+    if _queue is None:
+        return
+    for source_path in source_paths:
+        _queue.put_nowait(source_path)
+
+def start()->None:
+    '''
+    Starts the background thumbnail worker, called from the app lifespan
+    '''
+    global _queue, _worker_task
+    if _queue is not None or not IMAGE_THUMBNAIL_PREGENERATE:
+        return
+    if Image is None:
+        print("Pillow is not installed, images are served without thumbnails")
+        return
+    _queue=asyncio.Queue()
+    _worker_task=asyncio.create_task(_worker())
+
+async def stop()->None:
+    global _queue, _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()
+        await asyncio.gather(_worker_task, return_exceptions=True)
+    _worker_task=None
+    _queue=None
@@ -0,0 +1,70 @@
+import re
+import unicodedata
+from typing import Dict, Optional
+
+from core.config import LANGUAGE_ID_MIN_SCRIPT_SHARE
+
+# writing system of each language that can be recognised locally, by the Unicode name prefix of its letters.
+# Only languages that are the usual one for their script are listed, text in a script shared by
+# several listed languages (e.g. Latin) needs an extra check, see _looks_english
+LANGUAGE_SCRIPTS={
+    "english": "LATIN",
+    "hindi": "DEVANAGARI",
+    "tamil": "TAMIL",
+    "telugu": "TELUGU",
+    "kannada": "KANNADA",
+    "malayalam": "MALAYALAM",
+    "gujarati": "GUJARATI",
+    "punjabi": "GURMUKHI",
+    "bengali": "BENGALI",
+}
+
+# frequent English function words, Latin script text that contains none of them is probably another language
+_ENGLISH_WORDS={
+    "the", "a", "an", "and", "or", "of", "to", "in", "is", "are", "was", "were", "be", "it", "that", "this",
+    "for", "on", "with", "as", "by", "at", "from", "not", "can", "will", "has", "have", "there", "which",
+}
+
+def _script(char: str)->Optional[str]:
+    try:
+        return unicodedata.name(char).split(" ")[0]
+    except ValueError:
+        return None
+
+def script_shares(text: str)->Dict[str, float]:
+    '''
+    Share of the letters in text written in each script, digits, punctuation and markup are ignored
+    '''
+    counts: Dict[str, int]={}
+    for char in text:
+        if char.isalpha():
+            script=_script(char)
+            if script:
+                counts[script]=counts.get(script, 0)+1
+    total=sum(counts.values())
+    return {script: count/total for script, count in counts.items()} if total else {}
+
+def _looks_english(text: str)->bool:
+    words=re.findall(r"[a-z]+", text.lower())
+    if not words:
+        return False
+    return sum(word in _ENGLISH_WORDS for word in words)/len(words)>=0.1
+
+def language_share(text: str, language: str)->Optional[float]:
+    '''
+    Share of the letters in text written in the script of language, None when the language can't be recognised locally
+    '''
+    script=LANGUAGE_SCRIPTS.get(language.strip().lower())
+    if script is None:
+        return None
+    return script_shares(text).get(script, 0.0)
+
+def is_in_language(text: str, language: str, min_share: float=LANGUAGE_ID_MIN_SCRIPT_SHARE)->bool:
+    '''
+    True when text is already written in language, judged from its script (and common words for English) so it costs microseconds.
+    False when unsure (unknown language, mixed scripts or no letters), the caller then translates.
+    '''
+    share=language_share(text, language)
+    if share is None or share<min_share:
+        return False
+    return _looks_english(text) if LANGUAGE_SCRIPTS[language.strip().lower()]=="LATIN" else True
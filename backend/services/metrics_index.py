@@ -0,0 +1,269 @@
+import json
+import os
+import re
+from collections import defaultdict
+from typing import List, Dict, Tuple, Any, Optional, Iterator
+
+import faiss
+import numpy as np
+
+from models.embedder_model import get_embedder
+from services import context_packer
+from core.config import METRICS_STREAM_THRESHOLD_BYTES, METRICS_RETRIEVAL_TOP_K, METRICS_MAX_EMBEDDED_RECORDS
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# values shown for a list of numbers/strings before it is cut short
+SCALAR_LIST_PREVIEW = 20
+# added to a record's cosine score for every question keyword found in its path or value
+KEYWORD_WEIGHT = 0.2
+# very common keywords (e.g. "score") would otherwise pull in thousands of records
+KEYWORD_MAX_POSTINGS = 500
+# subtrees with more records than this are never sent whole, only their matching records
+MAX_SUBTREE_RECORDS = 200
+
+_STOPWORDS = {
+    "the", "a", "an", "of", "on", "in", "for", "to", "and", "or", "is", "are", "was", "were", "what", "which",
+    "how", "does", "did", "do", "with", "by", "at", "from", "this", "that", "it", "its", "be", "as", "me", "about",
+}
+
+def _keywords(text: str) -> List[str]:
+    """
+    Lowercase word tokens of a key path or question, camelCase and snake_case split into words.
+    """
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text).lower()
+    return [w for w in re.findall(r"[a-z0-9]+", text) if w not in _STOPWORDS and (len(w) > 1 or w.isdigit())]
+
+def _format_scalar(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+def _format_scalar_list(values: List[Any], count: int) -> str:
+    preview = ", ".join(_format_scalar(v) for v in values[:SCALAR_LIST_PREVIEW])
+    return f"[{preview}]" if count <= SCALAR_LIST_PREVIEW else f"[{preview}, ... ({count} values)]"
+
+def _join(path: str, key: str) -> str:
+    return f"{path}.{key}" if path else key
+
+def _flatten(obj: Any, path: str = "") -> Iterator[Tuple[str, str]]:
+    """
+    Yields (key path, value) records for every leaf of a parsed JSON document.
+    Lists of plain values become a single record, lists of objects are indexed as path[i].
+    """
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            yield from _flatten(value, _join(path, str(key)))
+    elif isinstance(obj, list):
+        scalars = [v for v in obj if not isinstance(v, (dict, list))]
+        for i, value in enumerate(obj):
+            if isinstance(value, (dict, list)):
+                yield from _flatten(value, f"{path}[{i}]")
+        if scalars:
+            yield path, _format_scalar_list(scalars, len(scalars))
+    else:
+        yield path, _format_scalar(obj)
+
+def _flatten_stream(fileobj) -> Iterator[Tuple[str, str]]:
+    """
+    Same records as _flatten, produced from ijson parse events so the document is never held in memory.
+    """
+    stack: List[Dict[str, Any]] = []
+
+    def child_path() -> str:
+        top = stack[-1]
+        if top["type"] == "map":
+            return _join(top["path"], top["key"])
+        path = f"{top['path']}[{top['index']}]"
+        top["index"] += 1
+        return path
+
+    for _, event, value in ijson.parse(fileobj, use_float=True):
+        if event in ("start_map", "start_array"):
+            path = child_path() if stack else ""
+            stack.append({"type": "map" if event == "start_map" else "array", "path": path, "key": None, "index": 0, "scalars": [], "count": 0})
+        elif event == "map_key":
+            stack[-1]["key"] = str(value)
+        elif event == "end_map":
+            stack.pop()
+        elif event == "end_array":
+            entry = stack.pop()
+            if entry["count"]:
+                yield entry["path"], _format_scalar_list(entry["scalars"], entry["count"])
+        elif not stack:
+            yield "", _format_scalar(value)
+        elif stack[-1]["type"] == "map":
+            yield child_path(), _format_scalar(value)
+        else:
+            top = stack[-1]
+            top["index"] += 1
+            top["count"] += 1
+            if len(top["scalars"]) < SCALAR_LIST_PREVIEW:
+                top["scalars"].append(value)
+
+def _parent(path: str) -> str:
+    """
+    Key path of the object holding a record, "" for top level keys
+    """
+    cut = max(path.rfind("."), path.rfind("["))
+    return path[:cut] if cut > 0 else ""
+
+class MetricsIndex:
+    """
+    Evaluation metrics flattened into key-path records, searchable by embedding similarity and by keyword.
+    retrieve() returns only the metric subtrees relevant to a question, within a token budget.
+    """
+    def __init__(self, records: List[Tuple[str, str]], full_text: Optional[str] = None, index: Optional[faiss.Index] = None):
+        if not records:
+            raise ValueError("The metrics JSON file contains no values.")
+        self.paths = [path for path, _ in records]
+        self.values = [value for _, value in records]
+        # compact JSON of small files, sent whole when it fits the budget
+        self.full_text = full_text
+
+        self._children: Dict[str, List[int]] = defaultdict(list)
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for i, (path, value) in enumerate(records):
+            self._children[_parent(path)].append(i)
+            for word in set(_keywords(path) + _keywords(value[:200])):
+                self._postings[word].append(i)
+
+        if index is None:
+            embedded = [f"{path.replace('.', ' ').replace('_', ' ')}: {value[:200]}" for path, value in records[:METRICS_MAX_EMBEDDED_RECORDS]]
+            vectors = np.asarray(get_embedder().encode(embedded, batch_size=256, normalize_embeddings=True), dtype='float32')
+            index = faiss.IndexFlatIP(vectors.shape[1])
+            index.add(vectors)
+        self._index = index
+
+    @classmethod
+    def from_file(cls, filepath: str) -> "MetricsIndex":
+        """
+        Parses and indexes a metrics JSON file. Files above METRICS_STREAM_THRESHOLD_BYTES are
+        parsed incrementally when ijson is installed.
+        """
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"Metrics JSON file not found at: {filepath}")
+        size = os.path.getsize(filepath)
+        if size > METRICS_STREAM_THRESHOLD_BYTES and ijson is not None:
+            try:
+                with open(filepath, 'rb') as f:
+                    records = list(_flatten_stream(f))
+            except ijson.JSONError as e:
+                raise ValueError(f"Could not decode metrics JSON file at {filepath}. It might be malformed. {e}")
+            index = cls(records)
+        else:
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except json.JSONDecodeError:
+                raise ValueError(f"Could not decode metrics JSON file at {filepath}. It might be malformed.")
+            index = cls(list(_flatten(data)), json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+        print(f"Metrics index built with {len(index)} records from {size} bytes")
+        return index
+
+    def save(self, directory: str) -> None:
+        """
+        Writes the records and their embedding index to directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "records.json"), 'w', encoding='utf-8') as f:
+            json.dump({"paths": self.paths, "values": self.values, "full_text": self.full_text}, f, ensure_ascii=False)
+        faiss.write_index(self._index, os.path.join(directory, "index.faiss"))
+
+    @classmethod
+    def load(cls, directory: str) -> "MetricsIndex":
+        """
+        Restores an index written by save() without embedding the records again
+        """
+        with open(os.path.join(directory, "records.json"), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index = faiss.read_index(os.path.join(directory, "index.faiss"))
+        return cls(list(zip(data["paths"], data["values"])), data.get("full_text"), index)
+
+    def memory_bytes(self) -> int:
+        """
+        Rough size of the records and vectors held in memory
+        """
+        text_bytes = sum(len(p) + len(v) for p, v in zip(self.paths, self.values)) + len(self.full_text or "")
+        return text_bytes + self._index.ntotal * self._index.d * 4
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _score(self, questions: List[str], query_vecs: Optional[np.ndarray] = None) -> Dict[int, float]:
+        """
+        Cosine similarity of the top records to each question, plus a bonus per matching keyword.
+        Several questions are searched in one batch, a record keeps its best score over all of them.
+        query_vecs are the normalised question embeddings when the caller already has them.
+        """
+        if query_vecs is None:
+            query_vecs = get_embedder().encode(questions, normalize_embeddings=True)
+        query_vecs = np.asarray(query_vecs, dtype='float32').reshape(len(questions), -1)
+        similarities, ids = self._index.search(query_vecs, min(METRICS_RETRIEVAL_TOP_K, self._index.ntotal))
+
+        scores: Dict[int, float] = {}
+        for q, question in enumerate(questions):
+            question_scores: Dict[int, float] = {int(i): float(similarity) for i, similarity in zip(ids[q], similarities[q]) if i != -1}
+            for word in set(_keywords(question)):
+                postings = self._postings.get(word, [])
+                if len(postings) > KEYWORD_MAX_POSTINGS:
+                    continue
+                for i in postings:
+                    question_scores[i] = question_scores.get(i, 0.0) + KEYWORD_WEIGHT
+            for i, score in question_scores.items():
+                scores[i] = max(scores.get(i, score), score)
+        return scores
+
+    def render(self, record_ids: List[int]) -> str:
+        """
+        Formats records grouped under their parent key path, in document order
+        """
+        groups: Dict[str, List[int]] = defaultdict(list)
+        for i in sorted(record_ids):
+            groups[_parent(self.paths[i])].append(i)
+        blocks = []
+        for parent, ids in groups.items():
+            lines = [f"  {self.paths[i][len(parent):].lstrip('.') or parent} = {self.values[i]}" for i in ids]
+            blocks.append(f"{parent or '(root)'}:\n" + "\n".join(lines))
+        return "\n".join(blocks)
+
+    def retrieve(self, question: str, token_budget: int) -> Tuple[str, Dict[str, int]]:
+        """
+        input: question and the number of prompt tokens the metrics may use
+        output: metrics text for the prompt and a usage report
+        """
+        return self.retrieve_many([question], token_budget)
+
+    def retrieve_many(self, questions: List[str], token_budget: int, query_vecs: Optional[np.ndarray] = None) -> Tuple[str, Dict[str, int]]:
+        """
+        input: questions, the number of prompt tokens the metrics may use and optionally the normalised question embeddings
+        output: one metrics text relevant to all of the questions and a usage report
+        Small files are sent whole when they fit. Otherwise the subtrees (records sharing a parent path) of
+        the best matching records are added, best first, each whole if it fits, else only its matching records.
+        """
+        if self.full_text is not None:
+            full_tokens = context_packer.count_tokens(self.full_text)
+            if full_tokens <= token_budget:
+                return self.full_text, {"metrics_tokens": full_tokens, "metrics_records": len(self), "metrics_records_total": len(self)}
+
+        scores = self._score(questions, query_vecs)
+        by_parent: Dict[str, List[int]] = defaultdict(list)
+        for i in scores:
+            by_parent[_parent(self.paths[i])].append(i)
+        ranked = sorted(by_parent.items(), key=lambda item: -max(scores[i] for i in item[1]))
+
+        selected: List[int] = []
+        used = 0
+        for parent, matched in ranked:
+            children = self._children[parent]
+            candidates = [children, matched] if len(children) <= MAX_SUBTREE_RECORDS else [matched]
+            for candidate in candidates:
+                tokens = context_packer.count_tokens(self.render(candidate)) + context_packer.SEPARATOR_TOKENS
+                if used + tokens <= token_budget:
+                    selected.extend(candidate)
+                    used += tokens
+                    break
+
+        text = self.render(selected)
+        return text, {"metrics_tokens": context_packer.count_tokens(text), "metrics_records": len(selected), "metrics_records_total": len(self)}
@@ -2,21 +2,28 @@ import pymupdf
 import json
 import os
 import shutil
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 import traceback
+import uuid
 from typing import List, Dict, Tuple, Optional
 
+from services import answer_cache, context_packer
+from models.embedder_model import get_embedder
+
 PERSISTENT_INDEX_DIR="persistent_data"
 PERSISTENT_FAISS_INDEX_PATH=os.path.join(PERSISTENT_INDEX_DIR, "permanent_rag_index.faiss")
 PERSISTENT_TEXT_MAP_PATH=os.path.join(PERSISTENT_INDEX_DIR, "permanent_rag_index.json")
+PERSISTENT_META_PATH=os.path.join(PERSISTENT_INDEX_DIR, "permanent_rag_index.meta.json")
 
 os.makedirs(PERSISTENT_INDEX_DIR, exist_ok=True)
 
 _permanent_index: Optional[faiss.IndexFlatL2]=None
 _permanent_id_to_text: Dict[int, str]={}
-_embedder=SentenceTransformer('all-MiniLM-L6-v2')
+# llama token count of each chunk, computed at ingest and saved with the index metadata
+_permanent_id_to_tokens: Dict[int, int]={}
+# changes every time the index is rebuilt or deleted, used to invalidate cached answers
+_permanent_generation: Optional[str]=None
 
 def _split_into_chunks(text, chunk_size=500, overlap=50):
     '''
@@ -37,7 +44,7 @@ def _embed_text(text:str)->Tuple[List[str],np.ndarray]:
     '''
 
     chunks=_split_into_chunks(text)
-    vectors=_embedder.encode(chunks)
+    vectors=get_embedder().encode(chunks)
     return chunks, vectors
 
 def _extract_text_from_pdf(filepath: str)-> str:
@@ -81,19 +88,49 @@ async def save_permanent_index() -> None:
     with open(PERSISTENT_TEXT_MAP_PATH, 'w', encoding='utf-8') as f:
         serializable_id_to_text={str(k): v for k, v in _permanent_id_to_text.items()}
         json.dump(serializable_id_to_text, f, ensure_ascii=False, separators=(',', ':'))
+    with open(PERSISTENT_META_PATH, 'w', encoding='utf-8') as f:
+        json.dump({
+            "generation": _permanent_generation,
+            "token_counts": {str(k): v for k, v in _permanent_id_to_tokens.items()},
+        }, f)
     print(f"Permanent FAISS index saved to {PERSISTENT_FAISS_INDEX_PATH}")
     print(f"Permanent text map saved to {PERSISTENT_TEXT_MAP_PATH}")
 
+def _load_metadata()->Tuple[str, Dict[int, int]]:
+    '''
+    reads the generation id and chunk token counts saved alongside the index.
+    older indexes without metadata fall back to the index file's mtime, token counts are then computed on demand
+    '''
+    if os.path.exists(PERSISTENT_META_PATH):
+        try:
+            with open(PERSISTENT_META_PATH, 'r', encoding='utf-8') as f:
+                meta=json.load(f)
+            if meta.get("generation"):
+                return meta["generation"], {int(k): v for k, v in meta.get("token_counts", {}).items()}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Could not read permanent index metadata: {e}")
+    return f"mtime-{int(os.path.getmtime(PERSISTENT_FAISS_INDEX_PATH))}", {}
+
+def get_generation()->Optional[str]:
+    '''
+    returns the generation id of the currently loaded permanent index, None if there is no index
+    '''
+    return _permanent_generation
+
 async def load_permanent_index() -> bool:
-    global _permanent_index, _permanent_id_to_text
+    global _permanent_index, _permanent_id_to_text, _permanent_id_to_tokens, _permanent_generation
     if os.path.exists(PERSISTENT_FAISS_INDEX_PATH) and os.path.exists(PERSISTENT_TEXT_MAP_PATH):
         _permanent_index = faiss.read_index(PERSISTENT_FAISS_INDEX_PATH)
         with open(PERSISTENT_TEXT_MAP_PATH, 'r', encoding='utf-8') as f:
             loaded_map_str_keys=json.load(f)
             _permanent_id_to_text={int(k): v for k, v in loaded_map_str_keys.items()}
-            print("Persistent faiss index loaded from disk")
-            return True
+        _permanent_generation, _permanent_id_to_tokens=_load_metadata()
+        answer_cache.invalidate_index("permanent", _permanent_generation)
+        print("Persistent faiss index loaded from disk")
+        return True
     else:
+        _permanent_generation=None
+        answer_cache.invalidate_index("permanent", None)
         print("No persistent index to load. ")
         return False
     
@@ -101,7 +138,7 @@ async def delete_permanent_index_files()->None:
     '''
     deletes the persistent index files and clears in memory index.
     '''
-    global _permanent_index, _permanent_id_to_text
+    global _permanent_index, _permanent_id_to_text, _permanent_id_to_tokens, _permanent_generation
     if os.path.exists(PERSISTENT_FAISS_INDEX_PATH):
         os.remove(PERSISTENT_FAISS_INDEX_PATH)
         print(f"Deleted persistent faiss index file {PERSISTENT_FAISS_INDEX_PATH}")
@@ -110,15 +147,21 @@ async def delete_permanent_index_files()->None:
         os.remove(PERSISTENT_TEXT_MAP_PATH)
         print(f"Deleted persistent text map file {PERSISTENT_TEXT_MAP_PATH}")
 
+    if os.path.exists(PERSISTENT_META_PATH):
+        os.remove(PERSISTENT_META_PATH)
+
     _permanent_id_to_text={}
+    _permanent_id_to_tokens={}
     _permanent_index=None
+    _permanent_generation=None
+    answer_cache.invalidate_index("permanent", None)
     print("Permanent index cleared from memory")
 
 async def process_files_to_build_permanent_index(filepaths: List[str])->None:
     '''
     processes a list of file paths to build the permanent index
     '''
-    global _permanent_index, _permanent_id_to_text
+    global _permanent_index, _permanent_id_to_text, _permanent_id_to_tokens, _permanent_generation
 
     all_chunks=[]
     all_vectors=[]
@@ -152,8 +195,11 @@ async def process_files_to_build_permanent_index(filepaths: List[str])->None:
     _permanent_index.add(combined_vectors)
 
     _permanent_id_to_text={i: text for i, text in enumerate(all_chunks)}
+    _permanent_id_to_tokens=context_packer.count_tokens_if_ready(all_chunks)
+    _permanent_generation=uuid.uuid4().hex
 
     await save_permanent_index()
+    answer_cache.invalidate_index("permanent", _permanent_generation)
 
     print(f"Permanent index built and saved with {len(all_chunks)} chunks.")
 
@@ -162,11 +208,26 @@ async def get_permanent_chunks(query: str, top_k: int=5)->List[str]:
     returns the top k chunks of text that match the query
     '''
     global _permanent_index, _permanent_id_to_text
-    query_vec=_embedder.encode([query]).astype('float32')
+    query_vec=get_embedder().encode([query]).astype('float32')
     D, I = _permanent_index.search(query_vec, k=top_k)
     valid_indices=[i for i in I[0] if i!=-1 and i<len(_permanent_id_to_text)]
     return [_permanent_id_to_text[i] for i in valid_indices]
 
+async def get_permanent_chunks_with_scores(query: str, top_k: int=5)->List[Tuple[str, float, Optional[int]]]:
+    '''
+    returns the top k matching chunks as (text, l2 distance, token count) tuples, empty if there is no index
+    '''
+    if _permanent_index is None:
+        return []
+    query_vec=get_embedder().encode([query]).astype('float32')
+    D, I = _permanent_index.search(query_vec, k=top_k)
+    results=[]
+    for i, distance in zip(I[0], D[0]):
+        if i==-1 or i>=len(_permanent_id_to_text):
+            continue
+        results.append((_permanent_id_to_text[i], float(distance), _permanent_id_to_tokens.get(i)))
+    return results
+
 async def get_permanent_index_status()->Dict:
     '''
     Returns status of permanent index (loaded, file existence, chunk count)
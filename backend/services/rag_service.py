@@ -1,20 +1,75 @@
 import pymupdf
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 import traceback
 from typing import List, Tuple, Dict, Optional
 import os
+import uuid
 
-from models.llm_model import llm_model
-from services import persistent_index, image_indexing_service
+from models.llm_model import generate_completion, wait_for_llm_model
+from models.embedder_model import get_embedder
+from services import persistent_index, image_indexing_service, answer_cache, context_packer, language_id, translator_service
 from core.models import RAGResponse
-
-model=llm_model
-_embedder=SentenceTransformer('all-MiniLM-L6-v2')
+from core.config import ANSWER_CACHE_SEMANTIC, RAG_LANGUAGE_FALLBACK_ENABLED, RAG_LANGUAGE_MIN_SCRIPT_SHARE
 
 _index: Optional[faiss.IndexFlatL2]=None
 _id_to_text: Dict[int, str]={}
+# llama token count of each chunk, computed once at ingest for prompt packing
+_id_to_tokens: Dict[int, int]={}
+# changes every time the session index is rebuilt, used to invalidate cached answers
+_index_generation: Optional[str]=None
+
+# answers that don't come from the model, in every language language_id recognises,
+# so a question asked in one of them never needs the fallback translation to say there is no answer
+_NO_ANSWER_MESSAGES: Dict[str, Dict[str, str]]={
+    "english": {
+        "insufficient_context": "Insufficient context",
+        "no_information": "Sorry, I couldn't find any relevant information.",
+        "no_text": "Sorry, I couldn't find any relevant text.",
+    },
+    "hindi": {
+        "insufficient_context": "पर्याप्त संदर्भ नहीं है",
+        "no_information": "क्षमा करें, मुझे कोई प्रासंगिक जानकारी नहीं मिली।",
+        "no_text": "क्षमा करें, मुझे कोई प्रासंगिक पाठ नहीं मिला।",
+    },
+    "tamil": {
+        "insufficient_context": "போதுமான சூழல் இல்லை",
+        "no_information": "மன்னிக்கவும், தொடர்புடைய தகவல் எதுவும் கிடைக்கவில்லை.",
+        "no_text": "மன்னிக்கவும், தொடர்புடைய உரை எதுவும் கிடைக்கவில்லை.",
+    },
+    "telugu": {
+        "insufficient_context": "తగినంత సందర్భం లేదు",
+        "no_information": "క్షమించండి, సంబంధిత సమాచారం ఏదీ దొరకలేదు.",
+        "no_text": "క్షమించండి, సంబంధిత పాఠ్యం ఏదీ దొరకలేదు.",
+    },
+    "kannada": {
+        "insufficient_context": "ಸಾಕಷ್ಟು ಸಂದರ್ಭವಿಲ್ಲ",
+        "no_information": "ಕ್ಷಮಿಸಿ, ಯಾವುದೇ ಸಂಬಂಧಿತ ಮಾಹಿತಿ ಸಿಗಲಿಲ್ಲ.",
+        "no_text": "ಕ್ಷಮಿಸಿ, ಯಾವುದೇ ಸಂಬಂಧಿತ ಪಠ್ಯ ಸಿಗಲಿಲ್ಲ.",
+    },
+    "malayalam": {
+        "insufficient_context": "മതിയായ സന്ദർഭം ഇല്ല",
+        "no_information": "ക്ഷമിക്കണം, പ്രസക്തമായ വിവരങ്ങളൊന്നും കണ്ടെത്താനായില്ല.",
+        "no_text": "ക്ഷമിക്കണം, പ്രസക്തമായ വാചകമൊന്നും കണ്ടെത്താനായില്ല.",
+    },
+    "gujarati": {
+        "insufficient_context": "પૂરતો સંદર્ભ નથી",
+        "no_information": "માફ કરશો, મને કોઈ સંબંધિત માહિતી મળી નથી.",
+        "no_text": "માફ કરશો, મને કોઈ સંબંધિત લખાણ મળ્યું નથી.",
+    },
+    "punjabi": {
+        "insufficient_context": "ਲੋੜੀਂਦਾ ਸੰਦਰਭ ਨਹੀਂ ਹੈ",
+        "no_information": "ਮਾਫ਼ ਕਰਨਾ, ਮੈਨੂੰ ਕੋਈ ਸੰਬੰਧਿਤ ਜਾਣਕਾਰੀ ਨਹੀਂ ਮਿਲੀ।",
+        "no_text": "ਮਾਫ਼ ਕਰਨਾ, ਮੈਨੂੰ ਕੋਈ ਸੰਬੰਧਿਤ ਲਿਖਤ ਨਹੀਂ ਮਿਲੀ।",
+    },
+    "bengali": {
+        "insufficient_context": "পর্যাপ্ত প্রসঙ্গ নেই",
+        "no_information": "দুঃখিত, কোনো প্রাসঙ্গিক তথ্য পাওয়া যায়নি।",
+        "no_text": "দুঃখিত, কোনো প্রাসঙ্গিক লেখা পাওয়া যায়নি।",
+    },
+}
+# any of these strings, in any language, to the kind of message it is
+_NO_ANSWER_KINDS={message.lower(): kind for messages in _NO_ANSWER_MESSAGES.values() for kind, message in messages.items()}
 
 
 def _split_into_chunks(text, chunk_size=500, overlap=50):
@@ -36,7 +91,7 @@ def _embed_text(text:str)->Tuple[List[str],np.ndarray]:
     '''
 
     chunks=_split_into_chunks(text)
-    vectors=_embedder.encode(chunks)
+    vectors=get_embedder().encode(chunks)
     return chunks, vectors
 
 def _extract_text_from_pdf(filepath: str)-> str:
@@ -57,21 +112,25 @@ def _create_index(vectors, chunks):
     '''
     global _index
     global _id_to_text
+    global _id_to_tokens
+    global _index_generation
     dimension=vectors.shape[1]
     _index=faiss.IndexFlatL2(dimension)
     _index.reset()
     _index.add(np.array(vectors).astype('float32'))
     _id_to_text={i:text for i,text in enumerate(chunks)}
+    _id_to_tokens=context_packer.count_tokens_if_ready(chunks)
+    _index_generation=uuid.uuid4().hex
+    answer_cache.invalidate_index("session", _index_generation)
 
-def _search_chunks(query, top_k=3):
+def _search_chunks_with_scores(query, top_k=3)->List[Tuple[str, float, Optional[int]]]:
     '''
     input: query in the form of a string
-    output: top_k most similar chunks
+    output: top_k most similar chunks as (text, l2 distance, token count) tuples
     '''
-    query_vec=_embedder.encode([query]).astype('float32')
+    query_vec=get_embedder().encode([query]).astype('float32')
     D, I = _index.search(query_vec, k=top_k)
-    valid_indices=[i for i in I[0] if i!=-1 and i<len(_id_to_text)]
-    return [_id_to_text[i] for i in valid_indices]
+    return [(_id_to_text[i], float(d), _id_to_tokens.get(i)) for i, d in zip(I[0], D[0]) if i!=-1 and i<len(_id_to_text)]
 
 async def process_files_for_rag(filepaths: list[str])-> None:
     '''
@@ -102,26 +161,101 @@ async def process_files_for_rag(filepaths: list[str])-> None:
     else:
         raise ValueError('No text extracted')
     
-async def ask_model(question: str, history: list[tuple[str, str]], max_tokens: int)->RAGResponse:
+def _no_answer_message(kind: str, output_language: str)->str:
+    '''
+    A fixed no-answer message in output_language, in English for languages without a translation
+    '''
+    return _NO_ANSWER_MESSAGES.get(output_language.strip().lower(), _NO_ANSWER_MESSAGES["english"])[kind]
+
+def _language_instruction(output_language: str)->str:
+    if output_language.strip().lower()=="english":
+        return ""
+    return (f"Write the whole response in {output_language}, whatever the language of the context and the question. "
+            "Keep names, numbers, code and technical terms as they are.")
+
+def _build_prompt(final_context_str: str, chat_history: str, question: str, output_language: str="English")->str:
+    '''
+    input: packed context, formatted chat history, the question and the language to answer in
+    output: the final prompt sent to the llm
+    '''
+    return f"""<|im_start|>system
+    ###instruction###
+    Act as a helpful assistant in a document Q&A app.
+    Assume the reader is college-educated, but not an expert.
+    Answer the question with a clear and concise response. The question will be enclosed in ("").
+    Use only the given context to answer the question. The context will be enclosed in (''').
+    The output should be a structured response in markdown, using bullet points or headings if appropriate, and should answer the question.
+    Be concise in your responses.
+    If the answer is not present in the context, print "{_no_answer_message("insufficient_context", output_language)}" and nothing else.
+    If the user is not asking a question, but telling you their opinion or is giving feedback, acknowledge it, and prompt them to ask their next question. 
+    Answer only questions relevant to the context.
+    {_language_instruction(output_language)}
+    {chat_history}
+    <|im_end|>
+    <|im_start|>user
+
+    ###user question details###
+    Use the following context to answer the question.
+
+    Context:
+    '''{final_context_str}'''
+
+    Question:
+    ""{question}""<|im_end|>
+    <|im_start|>assistant
+
+    ###response###
+    """
+
+async def _ensure_language(answer: str, output_language: str)->str:
+    '''
+    Translates an answer that didn't come back in output_language. Languages language_id can't recognise are trusted to the model.
+    A no-answer message in another language is swapped for its output_language version instead of being translated.
     '''
-    input: question as a string, and history of previous questions and answers, and max tokens to decide output length
+    if output_language.strip().lower()=="english":
+        return answer
+    kind=_NO_ANSWER_KINDS.get(answer.strip().strip('"').strip().lower())
+    if kind is not None:
+        return _no_answer_message(kind, output_language)
+    if not RAG_LANGUAGE_FALLBACK_ENABLED:
+        return answer
+    share=language_id.language_share(answer, output_language)
+    if share is None or share>=RAG_LANGUAGE_MIN_SCRIPT_SHARE:
+        return answer
+    print(f"RAG Chat - Answer is {share:.0%} {output_language} script, translating it")
+    try:
+        return await translator_service.translate_text(answer, output_language)
+    except Exception as e:
+        print(f"RAG Chat - Fallback translation failed, returning the answer as generated: {e}")
+        return answer
+
+async def ask_model(question: str, history: list[tuple[str, str]], max_tokens: int, output_language: str="English")->RAGResponse:
+    '''
+    input: question as a string, and history of previous questions and answers, max tokens to decide output length,
+    and the language the answer is generated in
     output: answer as a string
     '''
-    all_context_chunks=[]
-    session_chunks=[]
+    generations={"session": _index_generation, "permanent": persistent_index.get_generation(), "images": image_indexing_service.get_generation()}
+    question_vec=get_embedder().encode([question]) if ANSWER_CACHE_SEMANTIC else None
+    cached=answer_cache.lookup(question, history, generations, max_tokens, embedding=question_vec, output_language=output_language)
+    if cached is not None:
+        return RAGResponse(answer=cached["answer"], image_urls=cached["image_urls"])
+
+    scored_chunks=[]
     if _index is not None:
         try:
-            session_chunks=_search_chunks(question, top_k=5)
-            all_context_chunks.extend(session_chunks)
+            scored_chunks.extend(_search_chunks_with_scores(question, top_k=5))
         except Exception as e:
             print(f'Error in session specific search: {e}')
 
-    permanent_chunks=await persistent_index.get_permanent_chunks(question, top_k=3)
-    all_context_chunks.extend(permanent_chunks)
+    scored_chunks.extend(await persistent_index.get_permanent_chunks_with_scores(question, top_k=3))
 
-    combined_unique_context=list(dict.fromkeys(all_context_chunks))
-
-    final_context_str = "\n\n".join(combined_unique_context)
+    # chunks can be retrieved from both indexes, keep the best score for each
+    unique_chunks: Dict[str, Tuple[str, float, Optional[int]]]={}
+    for text, distance, tokens in scored_chunks:
+        if text not in unique_chunks or distance<unique_chunks[text][1]:
+            unique_chunks[text]=(text, distance, tokens)
+    combined_unique_context=list(unique_chunks.values())
 
     relevant_images_metadata=await image_indexing_service.search_image_semantic(question, top_k=3)
     FASTAPI_BASE_URL = os.getenv("FASTAPI_URL")
@@ -134,15 +268,21 @@ async def ask_model(question: str, history: list[tuple[str, str]], max_tokens: i
         else:
             print(f"Warning: Image metadata incomplete, missing image_name: {img_meta}")
 
-    if not final_context_str.strip():
+    if not any(text.strip() for text, _, _ in combined_unique_context):
         if not image_urls:
-            return RAGResponse(answer="Sorry, I couldn't find any relevant information.", image_urls=[])
+            return RAGResponse(answer=_no_answer_message("no_information", output_language), image_urls=[])
         else:
-            return RAGResponse(answer="Sorry, I couldn't find any relevant text.", image_urls=image_name)
+            return RAGResponse(answer=_no_answer_message("no_text", output_language), image_urls=image_urls)
+
+    await wait_for_llm_model()
+    budget=context_packer.prompt_budget(max_tokens)
+    fixed_tokens=context_packer.count_tokens(_build_prompt("", "", question, output_language))
+    packed=context_packer.pack_context(budget, fixed_tokens, combined_unique_context, history)
+    if packed["dropped_tokens"]:
+        print(f"RAG Chat - Dropped {packed['dropped_chunks']} chunks and {packed['dropped_history_turns']} history turns to fit {budget} prompt tokens")
 
-    chat_history=""
-    for q,a in history:
-        chat_history+="Q: "+q+"\nA: "+a+"\n\n"
+    final_context_str="\n\n".join(packed["chunks"])
+    chat_history="".join(context_packer.format_history_turn(q, a) for q, a in packed["history"])
     #previous system prompt 
     '''
     final_prompt=f"""<|im_start|>system
@@ -162,42 +302,20 @@ async def ask_model(question: str, history: list[tuple[str, str]], max_tokens: i
     temp=0.7
     max_tokens=512
     '''
-    final_prompt=f"""<|im_start|>system
-    ###instruction###
-    Act as a helpful assistant in a document Q&A app.
-    Assume the reader is college-educated, but not an expert.
-    Answer the question with a clear and concise response. The question will be enclosed in ("").
-    Use only the given context to answer the question. The context will be enclosed in (''').
-    The output should be a structured response in markdown, using bullet points or headings if appropriate, and should answer the question.
-    Be concise in your responses.
-    If the answer is not present in the context, print "Insufficient context" and nothing else.
-    If the user is not asking a question, but telling you their opinion or is giving feedback, acknowledge it, and prompt them to ask their next question. 
-    Answer only questions relevant to the context.
-    {chat_history}
-    <|im_end|>
-    <|im_start|>user
-
-    ###user question details###
-    Use the following context to answer the question.
-
-    Context:
-    '''{final_context_str}'''
-
-    Question:
-    ""{question}""<|im_end|>
-    <|im_start|>assistant
-
-    ###response###
-    """
+    final_prompt=_build_prompt(final_context_str, chat_history, question, output_language)
+    usage=context_packer.usage_report(final_prompt, packed, budget)
 
     temp=0.7
 
-    response=model.create_completion(
+    response=await generate_completion(
         prompt=final_prompt,
         temperature=temp,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        endpoint="rag"
     )
 
     assistant_reply=response['choices'][0]['text']
     assistant_reply=assistant_reply.replace("[/INST]", "")
-    return RAGResponse(answer=assistant_reply, image_urls=image_urls)
+    assistant_reply=await _ensure_language(assistant_reply, output_language)
+    answer_cache.store(question, history, generations, max_tokens, assistant_reply, image_urls, embedding=question_vec, output_language=output_language)
+    return RAGResponse(answer=assistant_reply, image_urls=image_urls, usage=usage)
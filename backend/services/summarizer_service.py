@@ -1,13 +1,21 @@
 import pymupdf
-from sentence_transformers import SentenceTransformer
 import numpy as np
 import os
-from sklearn.cluster import KMeans
-from typing import List, Tuple, Dict, Optional
-from models.llm_model import llm_model
-
-_embedder=SentenceTransformer('all-MiniLM-L6-v2')
-model=llm_model
+import re
+import asyncio
+import time
+import faiss
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from typing import List, Tuple, Dict, Any, Optional, Callable
+from models.llm_model import generate_completion, wait_for_llm_model
+from models.batch_engine import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from core.config import (
+    SUMMARIZER_MAX_CONCURRENCY, SUMMARIZER_CLUSTER_BACKEND, SUMMARIZER_LARGE_DOC_THRESHOLD,
+    SUMMARIZER_REDUCE_TOKEN_BUDGET, SUMMARIZER_REDUCE_MAX_TOKENS,
+)
+from models.embedder_model import get_embedder
+from services import context_packer, summary_cache
+from services.summary_checkpoint import SummaryCheckpoint, run_key
 
 def _split_into_chunks(text, chunk_size=500, overlap=50):
     '''
@@ -28,7 +36,7 @@ def _embed_text(text:str)-> Tuple[List[str], np.ndarray]:
     '''
 
     chunks=_split_into_chunks(text)
-    vectors=_embedder.encode(chunks)
+    vectors=get_embedder().encode(chunks)
     return chunks, vectors
 
 def _extract_text_from_pdf(filepath: str)-> str:
@@ -42,64 +50,105 @@ def _extract_text_from_pdf(filepath: str)-> str:
         full_text+=page.get_text()
     return full_text
 
-async def _process_files_for_summarization(filepaths: list[str])-> tuple[list[str], np.ndarray]:
+async def _process_files_for_summarization(filepaths: list[str], timings: Optional[Dict[str, float]]=None)-> tuple[list[str], np.ndarray]:
     '''
-    input: list of filepaths
+    input: list of filepaths, optional dict collecting stage timings
     processes files for text extraction and embedding
     output: extracted chunks and embeddings
     '''
     all_chunks=[]
     all_vectors=[]
+    extraction_seconds=0.0
+    embedding_seconds=0.0
     for path in filepaths:
+        start=time.perf_counter()
         if path.endswith('.pdf'):
-            text=_extract_text_from_pdf(path)
+            text=await asyncio.to_thread(_extract_text_from_pdf, path)
 
         else:
             continue
-        chunks, vectors=_embed_text(text)
+        extraction_seconds+=time.perf_counter()-start
+        start=time.perf_counter()
+        chunks, vectors=await asyncio.to_thread(_embed_text, text)
+        embedding_seconds+=time.perf_counter()-start
         all_chunks.extend(chunks)
         all_vectors.append(vectors)
 
+    if timings is not None:
+        timings["text_extraction"]=extraction_seconds
+        timings["embedding"]=embedding_seconds
+
     if all_vectors:
         print("Vectorisation succesful")
         return all_chunks, np.vstack(all_vectors)
 
     else:
         raise ValueError('No text extracted')
-def _clustering(vectors, num_clusters):
+def _fit_centroids(vectors: np.ndarray, num_clusters: int)->Tuple[np.ndarray, str]:
+    """
+    input: chunk embeddings and number of clusters
+    output: cluster centroids and the name of the backend that produced them
+    Small documents use scikit-learn KMeans, large ones switch to FAISS k-means (or MiniBatchKMeans)
+    """
+    backend=SUMMARIZER_CLUSTER_BACKEND
+    if backend=="auto":
+        backend="kmeans" if len(vectors)<=SUMMARIZER_LARGE_DOC_THRESHOLD else "faiss"
+
+    if backend=="faiss":
+        kmeans=faiss.Kmeans(vectors.shape[1], num_clusters, niter=20, seed=42)
+        kmeans.train(vectors)
+        return kmeans.centroids, backend
+    if backend=="minibatch":
+        kmeans=MiniBatchKMeans(n_clusters=num_clusters, random_state=42, n_init=3, batch_size=1024).fit(vectors)
+        return kmeans.cluster_centers_.astype('float32'), backend
+    if backend=="kmeans":
+        kmeans=KMeans(n_clusters=num_clusters, random_state=42, n_init=10).fit(vectors)
+        return kmeans.cluster_centers_.astype('float32'), backend
+    raise ValueError(f"Unknown clustering backend '{backend}', expected auto, kmeans, minibatch or faiss")
+
+def _clustering(vectors, num_clusters, timings: Optional[Dict[str, float]]=None):
     """
-    input: embeddings from given pdf text as vectors
-    output: clusters of similar vectors
+    input: embeddings from given pdf text as vectors, optional dict collecting stage timings
+    output: indices of the chunks closest to each cluster centroid, sorted
     """
     if len(vectors)<num_clusters:
         return list(range(len(vectors)))
-    
-    k=num_clusters
-    kmeans=KMeans(n_clusters=k, random_state=42, n_init=10).fit(vectors)
-    labels=kmeans.labels_
-    closest_indices=[]
 
-    for i in range(num_clusters):
-        cluster_indices=np.where(labels==i)[0]
-        if len(cluster_indices)>0:
-            distances=np.linalg.norm(vectors[cluster_indices]-kmeans.cluster_centers_[i], axis=1)
+    vectors=np.ascontiguousarray(vectors, dtype='float32')
+
+    start=time.perf_counter()
+    centroids, backend=_fit_centroids(vectors, num_clusters)
+    fit_seconds=time.perf_counter()-start
 
-            closest_index=np.argmin(distances)
+    # one vectorised search for the chunk nearest to every centroid
+    start=time.perf_counter()
+    index=faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    _, nearest=index.search(np.ascontiguousarray(centroids, dtype='float32'), 1)
+    selection_seconds=time.perf_counter()-start
 
-            closest_indices.append(cluster_indices[closest_index])
+    if timings is not None:
+        timings[f"clustering_fit_{backend}"]=fit_seconds
+        timings["centroid_selection"]=selection_seconds
 
-    selected_indices=sorted(list(set(closest_indices)))
+    selected_indices=sorted(set(int(i) for i in nearest[:, 0] if i!=-1))
     return selected_indices
 
-async def _summary_creater(selected_indices, chunks):
+# shared by every summarization request so the map and reduce phases never take more than their share of the LLM
+_map_semaphore=asyncio.Semaphore(SUMMARIZER_MAX_CONCURRENCY)
+
+ProgressCallback=Callable[[Dict[str, Any]], None]
+
+def _emit(progress_callback: Optional[ProgressCallback], event: Dict[str, Any])->None:
+    if progress_callback is not None:
+        progress_callback(event)
+
+async def _summarise_section(section: str)->str:
     """
-    input: indices of selected chunks and chunks themselves
-    output: summary list of selected chunks
+    input: a single chunk of text
+    output: 2-3 line summary of the chunk
     """
-    summary_list=[]
-    for i in selected_indices:
-        section=chunks[i]
-        map_prompt=f"""
+    map_prompt=f"""
         Act as a concise summariser.
         Summarise the given text into 2-3 lines, no more. Ensure you completely cover the content of the text. This text will be enclosed in triple backticks (```)
         The output should be the summary of the user supplied text.
@@ -108,31 +157,57 @@ async def _summary_creater(selected_indices, chunks):
         ```{section}```
         SUMMARY: 
         """
-        temp=0.7
-        max_tokens=150
+    temp=0.7
+    max_tokens=150
 
-        response=model.create_completion(
+    async with _map_semaphore:
+        response=await generate_completion(
         prompt=map_prompt,
         temperature=temp,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        endpoint="summarizer",
+        priority=PRIORITY_BACKGROUND
         )
 
-        summary=response['choices'][0]['text']
-        summary=summary.replace("[/INST]", "")
-        print(summary)
-        print(i)
-        summary_list.append(summary)
-        print(f"Summary for chunk{i} is ready")
+    summary=response['choices'][0]['text']
+    return summary.replace("[/INST]", "")
 
-    return summary_list
+async def _summary_creater(selected_indices, chunks, progress_callback: Optional[ProgressCallback]=None, checkpoint: Optional[SummaryCheckpoint]=None):
+    """
+    input: indices of selected chunks and chunks themselves, optional progress callback and checkpoint
+    output: summary list of selected chunks, in the order of selected_indices
+    Chunks are summarised concurrently, up to SUMMARIZER_MAX_CONCURRENCY at a time.
+    Chunks already summarised in the checkpoint or the summary cache are not sent to the LLM again,
+    summaries taken from the cache are checkpointed too so a resumed run sees the same map text.
+    """
+    total=len(selected_indices)
+    completed=0
 
-async def _collate_summaries(individual_summaries: list[str], max_tokens: int)->str:
-    '''
-    input: list of individual summaries and max_tokens to decide output length
-    output: summary as a string
-    '''
-    summaries="\n".join(individual_summaries)
-    final_prompt = f"""<|im_start|>system
+    async def summarise(i):
+        nonlocal completed
+        summary=checkpoint.get_map(i) if checkpoint is not None else None
+        if summary is None:
+            summary=summary_cache.get_partial(chunks[i])
+            if summary is not None and checkpoint is not None:
+                # saved once all chunks are done, cache hits arrive too fast to write the file for each
+                checkpoint.set_map(i, summary, save=False)
+        if summary is None:
+            summary=await _summarise_section(chunks[i])
+            summary_cache.store_partial(chunks[i], summary)
+            if checkpoint is not None:
+                checkpoint.set_map(i, summary)
+        completed+=1
+        print(f"Summary for chunk{i} is ready ({completed}/{total})")
+        _emit(progress_callback, {"stage": "map", "completed": completed, "total": total, "chunk": i, "summary": summary})
+        return summary
+
+    summaries=list(await asyncio.gather(*[summarise(i) for i in selected_indices]))
+    if checkpoint is not None:
+        checkpoint.save()
+    return summaries
+
+def _collate_prompt(summaries: str)->str:
+    return f"""<|im_start|>system
     You are a precise and concise summariser.
     You will be given a series of summaries from a book. The summaries will be enclosed in triple backticks (```).
     Your task is to write a verbose summary of what was covered in the book.
@@ -154,30 +229,285 @@ async def _collate_summaries(individual_summaries: list[str], max_tokens: int)->
     Here is the detailed summary of the book:
     """
 
+def _reduce_prompt(summaries: str)->str:
+    return f"""<|im_start|>system
+    You are a precise and concise summariser.
+    You will be given summaries of consecutive parts of a book, in order. The summaries will be enclosed in triple backticks (```).
+    Combine them into a single summary of that part of the book that keeps every key point, event and name.
+    Do not add any external information. Base your answer only on what is provided. Write plain text, no headings.
+    <|im_end|>
+    <|im_start|>user
+    ```{summaries}```
+    <|im_end|>
+    <|im_start|>assistant
+    SUMMARY:
+    """
+
+async def _reduce_group(summaries: List[str])->str:
+    '''
+    input: partial summaries of consecutive parts of the document
+    output: one summary covering all of them
+    '''
+    async with _map_semaphore:
+        response=await generate_completion(
+            prompt=_reduce_prompt("\n".join(summaries)),
+            temperature=0.7,
+            max_tokens=SUMMARIZER_REDUCE_MAX_TOKENS,
+            endpoint="summarizer",
+            priority=PRIORITY_BACKGROUND
+        )
+    return response['choices'][0]['text'].replace("[/INST]", "").strip()
+
+def _group_by_token_budget(summaries: List[str], budget: int)->List[List[str]]:
+    '''
+    input: partial summaries in document order and the token budget of one group
+    output: consecutive groups of summaries whose joined length fits the budget
+    Every group but possibly the last holds at least two summaries so each level shrinks the list,
+    summaries too long to pair up are truncated to half the budget.
+    '''
+    item_budget=budget//2-context_packer.SEPARATOR_TOKENS
+    groups: List[List[str]]=[]
+    current: List[str]=[]
+    used=0
+    for summary in summaries:
+        tokens=context_packer.count_tokens(summary)
+        if tokens>item_budget:
+            summary=context_packer.truncate_to_tokens(summary, item_budget)
+            tokens=item_budget
+        tokens+=context_packer.SEPARATOR_TOKENS
+        if current and used+tokens>budget:
+            groups.append(current)
+            current, used=[], 0
+        current.append(summary)
+        used+=tokens
+    if current:
+        groups.append(current)
+    return groups
+
+async def _reduce_summaries(summaries: List[str], max_tokens: int, progress_callback: Optional[ProgressCallback]=None, checkpoint: Optional[SummaryCheckpoint]=None)->List[str]:
+    '''
+    input: map phase summaries in document order, max_tokens of the final summary
+    output: summaries that together fit the final collation prompt
+    Builds the reduce tree level by level: groups that fit SUMMARIZER_REDUCE_TOKEN_BUDGET are summarised
+    concurrently, and their outputs become the next level, until the final prompt fits its budget.
+    Only the current level is held in memory, every group result is checkpointed.
+    '''
+    await wait_for_llm_model()
+    final_budget=context_packer.prompt_budget(max_tokens)-context_packer.count_tokens(_collate_prompt(""))
+    group_budget=min(SUMMARIZER_REDUCE_TOKEN_BUDGET, context_packer.prompt_budget(SUMMARIZER_REDUCE_MAX_TOKENS))-context_packer.count_tokens(_reduce_prompt(""))
+
+    level=0
+    while len(summaries)>1:
+        total_tokens=sum(context_packer.count_tokens(s)+context_packer.SEPARATOR_TOKENS for s in summaries)
+        if total_tokens<=final_budget:
+            break
+
+        groups=_group_by_token_budget(summaries, group_budget)
+        completed=0
+
+        async def reduce(group_index: int, group: List[str])->str:
+            nonlocal completed
+            summary=checkpoint.get_reduce(level, group) if checkpoint is not None else None
+            if summary is None:
+                summary=await _reduce_group(group)
+                if checkpoint is not None:
+                    checkpoint.set_reduce(level, group, summary)
+            completed+=1
+            print(f"Reduce level {level}: group {group_index} is ready ({completed}/{len(groups)})")
+            _emit(progress_callback, {"stage": "reduce", "level": level, "completed": completed, "total": len(groups), "group": group_index, "summary": summary})
+            return summary
+
+        print(f"Reduce level {level}: {len(summaries)} summaries ({total_tokens} tokens) in {len(groups)} groups")
+        summaries=list(await asyncio.gather(*[reduce(i, group) for i, group in enumerate(groups)]))
+        level+=1
+
+    if len(summaries)==1 and context_packer.count_tokens(summaries[0])>final_budget:
+        summaries=[context_packer.truncate_to_tokens(summaries[0], final_budget)]
+    return summaries
+
+async def _collate_summaries(individual_summaries: list[str], max_tokens: int, priority: int=PRIORITY_INTERACTIVE)->str:
+    '''
+    input: list of individual summaries, max_tokens to decide output length and the generation priority
+    output: summary as a string
+    '''
+    summaries="\n".join(individual_summaries)
+    final_prompt=_collate_prompt(summaries)
+
     temp=0.7
 
-    response=model.create_completion(
+    response=await generate_completion(
         prompt=final_prompt,
         temperature=temp,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        endpoint="summarizer",
+        priority=priority
     )
     assistant_reply=response['choices'][0]['text']
     collated_summary=assistant_reply.replace("[/INST]", "")
     return collated_summary
 
-async def generate_document_summary(filepaths: List[str], num_clusters: int, max_tokens: int) -> str:
+SUMMARY_MODES=("abstractive", "extractive")
+
+def _split_into_sentences(chunk: str)->List[str]:
+    '''
+    input: a chunk of text
+    output: its complete-looking sentences, chunk boundaries cut sentences so very short fragments are dropped
+    '''
+    sentences=re.split(r"(?<=[.!?])\s+", re.sub(r"\s+", " ", chunk).strip())
+    return [sentence for sentence in sentences if len(sentence.split())>=5]
+
+def _textrank_scores(similarity: np.ndarray, damping: float=0.85, iterations: int=30)->np.ndarray:
+    '''
+    input: sentence cosine similarity matrix
+    output: TextRank score per sentence, by power iteration over the row normalised similarity graph
+    '''
+    n=len(similarity)
+    weights=np.clip(similarity, 0, None)
+    np.fill_diagonal(weights, 0)
+    row_sums=weights.sum(axis=1, keepdims=True)
+    transition=np.divide(weights, row_sums, out=np.full_like(weights, 1.0/n), where=row_sums>0)
+    scores=np.full(n, 1.0/n, dtype=np.float32)
+    for _ in range(iterations):
+        scores=(1-damping)/n+damping*(transition.T@scores)
+    return scores
+
+def _select_sentences(selected_indices: List[int], chunks: List[str], all_vectors: np.ndarray, max_chars: int)->List[str]:
+    '''
+    input: representative chunk indices from _clustering, all chunks and their embeddings, output length in characters
+    output: the highest scoring sentences of the representative chunks, in document order
+    Sentences are scored by similarity to the document centroid plus TextRank centrality, the best sentence
+    of every representative chunk is kept first for coverage, and near duplicates are skipped.
+    '''
+    sentences: List[str]=[]
+    positions: List[Tuple[int, int]]=[]
+    seen=set()
+    for chunk_index in selected_indices:
+        for position, sentence in enumerate(_split_into_sentences(chunks[chunk_index])):
+            # neighbouring chunks overlap, the same sentence can appear twice
+            if sentence in seen:
+                continue
+            seen.add(sentence)
+            sentences.append(sentence)
+            positions.append((chunk_index, position))
+    if not sentences:
+        return [chunks[i].strip() for i in selected_indices][:1]
+
+    embeddings=np.asarray(get_embedder().encode(sentences, normalize_embeddings=True), dtype='float32')
+    document_vectors=np.asarray(all_vectors, dtype='float32')
+    centroid=(document_vectors/np.maximum(np.linalg.norm(document_vectors, axis=1, keepdims=True), 1e-12)).mean(axis=0)
+    centroid/=max(np.linalg.norm(centroid), 1e-12)
+
+    similarity=embeddings@embeddings.T
+    centroid_scores=embeddings@centroid
+    textrank=_textrank_scores(similarity)
+    scores=0.5*(centroid_scores-centroid_scores.min())/max(np.ptp(centroid_scores), 1e-12)+0.5*(textrank-textrank.min())/max(np.ptp(textrank), 1e-12)
+
+    chunk_of=np.array([chunk_index for chunk_index, _ in positions])
+    best_per_chunk=[int(np.flatnonzero(chunk_of==i)[np.argmax(scores[chunk_of==i])]) for i in selected_indices if np.any(chunk_of==i)]
+    ranked=best_per_chunk+[int(j) for j in np.argsort(-scores) if int(j) not in best_per_chunk]
+
+    picked: List[int]=[]
+    used_chars=0
+    for j in ranked:
+        if used_chars+len(sentences[j])>max_chars and picked:
+            continue
+        if picked and float(np.max(similarity[j, picked]))>0.9:
+            continue
+        picked.append(j)
+        used_chars+=len(sentences[j])
+    return [sentences[j] for j in sorted(picked, key=lambda j: positions[j])]
+
+async def _polish_extract(extract: str, max_tokens: int, priority: int=PRIORITY_INTERACTIVE)->str:
+    '''
+    input: extracted sentences joined as text
+    output: the same content rewritten as a fluent summary by the LLM
+    '''
+    polish_prompt=f"""<|im_start|>system
+    You are a precise and concise summariser.
+    You will be given key sentences extracted from a document, in order. They will be enclosed in triple backticks (```).
+    Rewrite them into a short, coherent summary. Do not add any external information.
+    <|im_end|>
+    <|im_start|>user
+    ```{extract}```
+    <|im_end|>
+    <|im_start|>assistant
+    SUMMARY:
+    """
+    response=await generate_completion(
+        prompt=polish_prompt,
+        temperature=0.3,
+        max_tokens=max_tokens,
+        endpoint="summarizer",
+        priority=priority
+    )
+    return response['choices'][0]['text'].replace("[/INST]", "").strip()
+
+async def _extractive_summary(filepaths: List[str], num_clusters: int, max_tokens: int, polish: bool, timings: Dict[str, float], priority: int=PRIORITY_INTERACTIVE)->str:
+    '''
+    input: filepaths, number of clusters, max_tokens of the summary, whether to polish with the LLM
+    output: summary made of representative sentences of the document, no LLM calls unless polish is set
+    '''
+    all_chunks, all_vectors=await _process_files_for_summarization(filepaths, timings)
+    selected_indices=await asyncio.to_thread(_clustering, all_vectors, num_clusters, timings)
+
+    start=time.perf_counter()
+    # roughly four characters per token, keeps the extract the length the caller asked for without tokenizing
+    sentences=await asyncio.to_thread(_select_sentences, selected_indices, all_chunks, all_vectors, max_tokens*4)
+    timings["sentence_selection"]=time.perf_counter()-start
+
+    extract=" ".join(sentences)
+    if polish:
+        start=time.perf_counter()
+        extract=await _polish_extract(extract, max_tokens, priority)
+        timings["polish"]=time.perf_counter()-start
+    return extract
+
+async def generate_document_summary(filepaths: List[str], num_clusters: int, max_tokens: int, progress_callback: Optional[ProgressCallback]=None, mode: str="abstractive", polish: bool=False, priority: int=PRIORITY_INTERACTIVE) -> str:
     """
     main public output function for document summarization
-    returns summary as string
+    mode is abstractive (map-reduce with the LLM) or extractive (representative sentences, polish optionally rewrites them with the LLM)
+    priority applies to the final generation, map and reduce generations always run at PRIORITY_BACKGROUND
+    progress_callback receives an event dict for every map summary and every reduce group as it completes
+    returns summary as string, repeated requests for the same files and parameters are served from the summary cache
     """
-    all_chunks, all_vectors=await _process_files_for_summarization(filepaths)
+    if mode not in SUMMARY_MODES:
+        raise ValueError(f"Unknown summary mode '{mode}', expected one of {SUMMARY_MODES}")
+    cache_mode="extractive_polished" if mode=="extractive" and polish else mode
+
+    doc_hash=summary_cache.document_hash(filepaths)
+    cached=summary_cache.get_summary(doc_hash, num_clusters, max_tokens, cache_mode)
+    if cached is not None:
+        print("Summary cache: hit")
+        _emit(progress_callback, {"stage": "cached"})
+        return cached["summary"]
 
-    selected_indices=_clustering(all_vectors, num_clusters)
+    timings: Dict[str, float]={}
+    if mode=="extractive":
+        summary=await _extractive_summary(filepaths, num_clusters, max_tokens, polish, timings, priority)
+        summary_cache.store_summary(doc_hash, num_clusters, max_tokens, summary, [], cache_mode)
+        print("Extractive summarizer timings: " + ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items()))
+        return summary
 
-    individual_summaries=await _summary_creater(selected_indices, all_chunks)
+    all_chunks, all_vectors=await _process_files_for_summarization(filepaths, timings)
+
+    selected_indices=await asyncio.to_thread(_clustering, all_vectors, num_clusters, timings)
+    checkpoint=SummaryCheckpoint(run_key(all_chunks, num_clusters, max_tokens))
+
+    start=time.perf_counter()
+    individual_summaries=await _summary_creater(selected_indices, all_chunks, progress_callback, checkpoint)
+    timings["map_summaries"]=time.perf_counter()-start
+
+    start=time.perf_counter()
+    reduced_summaries=await _reduce_summaries(individual_summaries, max_tokens, progress_callback, checkpoint)
+    timings["reduce"]=time.perf_counter()-start
 
     # Step 4: Collate individual summaries into a single, comprehensive summary
-    collated_summary=await _collate_summaries(individual_summaries, max_tokens)
+    start=time.perf_counter()
+    collated_summary=await _collate_summaries(reduced_summaries, max_tokens, priority)
+    timings["collate"]=time.perf_counter()-start
+    summary_cache.store_summary(doc_hash, num_clusters, max_tokens, collated_summary, individual_summaries)
+    checkpoint.delete()
 
-    return collated_summary
+    print(f"Summarizer timings for {len(all_chunks)} chunks: " + ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items()))
 
+    return collated_summary
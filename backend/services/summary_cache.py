@@ -0,0 +1,84 @@
+import hashlib
+from typing import List, Dict, Any, Optional
+
+from core.config import (
+    SUMMARY_CACHE_ENABLED,
+    SUMMARY_CACHE_MAX_ENTRIES,
+    SUMMARY_PARTIALS_MAX_ENTRIES,
+    SUMMARY_CACHE_PATH,
+    SUMMARY_PARTIALS_PATH,
+)
+from core.persistent_cache import PersistentLRUCache
+from models.llm_model import model_filename
+
+# summaries are only valid for the model that wrote them
+MODEL_ID=model_filename
+
+_summaries=PersistentLRUCache(SUMMARY_CACHE_PATH, max_entries=SUMMARY_CACHE_MAX_ENTRIES)
+_partials=PersistentLRUCache(SUMMARY_PARTIALS_PATH, max_entries=SUMMARY_PARTIALS_MAX_ENTRIES)
+
+def _hash(value: str)->str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+def document_hash(filepaths: List[str])->str:
+    '''
+    Content hash of the uploaded files, in order, read in blocks so large files are not loaded at once
+    '''
+    digest=hashlib.sha256()
+    for path in filepaths:
+        file_digest=hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1<<20), b""):
+                file_digest.update(block)
+        digest.update(file_digest.digest())
+    return digest.hexdigest()
+
+def _summary_key(doc_hash: str, num_clusters: int, max_tokens: int, mode: str)->str:
+    return f"{doc_hash}:{mode}:{num_clusters}:{max_tokens}:{MODEL_ID}"
+
+def _partial_key(chunk: str)->str:
+    return f"{MODEL_ID}:{_hash(chunk)}"
+
+def get_summary(doc_hash: str, num_clusters: int, max_tokens: int, mode: str="abstractive")->Optional[Dict[str, Any]]:
+    '''
+    Returns the cached {"summary", "partial_summaries"} of a document summarised with these parameters, or None
+    '''
+    if not SUMMARY_CACHE_ENABLED:
+        return None
+    return _summaries.get(_summary_key(doc_hash, num_clusters, max_tokens, mode))
+
+def store_summary(doc_hash: str, num_clusters: int, max_tokens: int, summary: str, partial_summaries: List[str], mode: str="abstractive")->None:
+    if not SUMMARY_CACHE_ENABLED:
+        return
+    _summaries.set(_summary_key(doc_hash, num_clusters, max_tokens, mode), {
+        "summary": summary,
+        "partial_summaries": list(partial_summaries),
+        "num_clusters": num_clusters,
+        "max_tokens": max_tokens,
+        "mode": mode,
+        "model": MODEL_ID,
+    })
+
+def get_partial(chunk: str)->Optional[str]:
+    '''
+    Map summary of a chunk from any earlier run, whatever its num_clusters/max_tokens were
+    '''
+    if not SUMMARY_CACHE_ENABLED:
+        return None
+    return _partials.get(_partial_key(chunk))
+
+def store_partial(chunk: str, summary: str)->None:
+    if not SUMMARY_CACHE_ENABLED:
+        return
+    _partials.set(_partial_key(chunk), summary)
+
+def clear()->None:
+    _summaries.clear()
+    _partials.clear()
+
+def save()->None:
+    _summaries.save()
+    _partials.save()
+
+def get_status()->Dict[str, Any]:
+    return {"enabled": SUMMARY_CACHE_ENABLED, "summaries": _summaries.stats(), "partials": _partials.stats()}
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import threading
+from typing import List, Dict, Any, Optional
+
+from core.config import SUMMARIZER_CHECKPOINT_DIR
+
+def run_key(chunks: List[str], num_clusters: int, max_tokens: int)->str:
+    '''
+    Identifies a summarization run by the extracted document text and its parameters
+    '''
+    digest=hashlib.sha256()
+    for chunk in chunks:
+        digest.update(hashlib.sha256(chunk.encode('utf-8')).digest())
+    digest.update(json.dumps([num_clusters, max_tokens]).encode('utf-8'))
+    return digest.hexdigest()
+
+def group_key(summaries: List[str])->str:
+    '''
+    Identifies a reduce group by its input summaries, so a resumed run only reuses outputs built from the same inputs
+    '''
+    digest=hashlib.sha256()
+    for summary in summaries:
+        digest.update(hashlib.sha256(summary.encode('utf-8')).digest())
+    return digest.hexdigest()
+
+class SummaryCheckpoint:
+    """
+    Map summaries (by chunk index) and reduce outputs (by level and group_key of their inputs) of one
+    summarization run, written to disk as they complete so an interrupted run can resume instead of starting over.
+    """
+    def __init__(self, key: str, directory: str=SUMMARIZER_CHECKPOINT_DIR):
+        self.key=key
+        self.path=os.path.join(directory, f"{key}.json")
+        self._lock=threading.Lock()
+        self._data: Dict[str, Any]={"map": {}, "levels": []}
+        self._load()
+
+    def _load(self)->None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data=json.load(f)
+            self._data={"map": dict(data.get("map", {})), "levels": [dict(level) for level in data.get("levels", [])]}
+            print(f"Resuming summarization from checkpoint {self.path}")
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"Ignoring unreadable summary checkpoint {self.path}: {e}")
+
+    def get_map(self, chunk_index: int)->Optional[str]:
+        with self._lock:
+            return self._data["map"].get(str(chunk_index))
+
+    def set_map(self, chunk_index: int, summary: str, save: bool=True)->None:
+        with self._lock:
+            self._data["map"][str(chunk_index)]=summary
+        if save:
+            self.save()
+
+    def get_reduce(self, level: int, group: List[str])->Optional[str]:
+        with self._lock:
+            levels=self._data["levels"]
+            return levels[level].get(group_key(group)) if level<len(levels) else None
+
+    def set_reduce(self, level: int, group: List[str], summary: str)->None:
+        with self._lock:
+            levels=self._data["levels"]
+            while len(levels)<=level:
+                levels.append({})
+            levels[level][group_key(group)]=summary
+        self.save()
+
+    def save(self)->None:
+        '''
+        Writes the checkpoint atomically
+        '''
+        with self._lock:
+            payload=json.dumps(self._data, ensure_ascii=False, separators=(',', ':'))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path=f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Error saving summary checkpoint {self.path}: {e}")
+
+    def delete(self)->None:
+        '''
+        Removes the checkpoint once the run has produced its final summary
+        '''
+        with self._lock:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error removing summary checkpoint {self.path}: {e}")
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import deque
+from typing import List, Dict, Any, Optional, AsyncIterator
+
+from core.config import SUMMARY_JOBS_DIR, SUMMARY_JOB_WORKERS, SUMMARY_JOB_MAX_EVENTS
+from models.batch_engine import PRIORITY_BACKGROUND
+from services import summarizer_service
+
+QUEUED="queued"
+RUNNING="running"
+DONE="done"
+FAILED="failed"
+TERMINAL_STATES=(DONE, FAILED)
+# sent to event streams when the workers stop before the job finished, it resumes on the next start
+INTERRUPTED_EVENT={"stage": "interrupted", "status": RUNNING, "detail": "The server is shutting down, the job resumes when it restarts"}
+# sent to event streams of a queued job that was deleted
+DELETED_EVENT={"stage": "deleted", "status": "deleted", "detail": "The job was deleted"}
+
+# job records by id, the fields without a leading underscore are what job.json and the API expose
+_jobs: Dict[str, Dict[str, Any]]={}
+_subscribers: Dict[str, List[asyncio.Queue]]={}
+_queue: Optional[asyncio.Queue]=None
+_workers: List[asyncio.Task]=[]
+
+def _job_dir(job_id: str)->str:
+    return os.path.join(SUMMARY_JOBS_DIR, job_id)
+
+def _public(job: Dict[str, Any])->Dict[str, Any]:
+    return {k: v for k, v in job.items() if not k.startswith("_")}
+
+def _save(job: Dict[str, Any])->None:
+    '''
+    Writes job.json atomically
+    '''
+    path=os.path.join(_job_dir(job["job_id"]), "job.json")
+    tmp_path=f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_public(job), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error saving summary job {job['job_id']}: {e}")
+
+def _new_events()->deque:
+    return deque(maxlen=max(1, SUMMARY_JOB_MAX_EVENTS))
+
+def _publish(job: Dict[str, Any], event: Dict[str, Any])->None:
+    job["_events"].append(event)
+    for subscriber in _subscribers.get(job["job_id"], []):
+        subscriber.put_nowait(event)
+
+def _set_state(job: Dict[str, Any], state: str, **fields: Any)->None:
+    job.update(fields, status=state, updated_at=time.time())
+    _save(job)
+    event={"stage": "status", "status": state, **fields}
+    _publish(job, event)
+    if state in TERMINAL_STATES:
+        # the progress of a finished job is of no use to later streams, only its final status is kept
+        job["_events"]=_new_events()
+        job["_events"].append(event)
+
+def _on_progress(job: Dict[str, Any], event: Dict[str, Any])->None:
+    job["progress"]=event
+    job["updated_at"]=time.time()
+    _save(job)
+    _publish(job, event)
+
+async def _run(job: Dict[str, Any])->None:
+    _set_state(job, RUNNING)
+    filepaths=[os.path.join(_job_dir(job["job_id"]), name) for name in job["files"]]
+    try:
+        # map outputs are checkpointed by summarizer_service, a job resumed after a restart skips finished chunks
+        summary=await summarizer_service.generate_document_summary(
+            filepaths, job["num_clusters"], job["max_tokens"],
+            progress_callback=lambda event: _on_progress(job, event),
+            mode=job["mode"], polish=job["polish"], priority=PRIORITY_BACKGROUND,
+        )
+        _set_state(job, DONE, result=summary)
+    except asyncio.CancelledError:
+        # shutting down, the job stays running on disk and is picked up again on the next start
+        raise
+    except Exception as e:
+        print(f"Summary job {job['job_id']} failed: {e}")
+        _set_state(job, FAILED, error=str(e))
+
+async def _worker()->None:
+    while True:
+        job_id=await _queue.get()
+        job=_jobs.get(job_id)
+        try:
+            if job is not None and job["status"]==QUEUED:
+                await _run(job)
+        finally:
+            _queue.task_done()
+
+def _resume()->int:
+    '''
+    Loads jobs persisted by earlier runs and queues again the ones that never finished
+    '''
+    if not os.path.isdir(SUMMARY_JOBS_DIR):
+        return 0
+    pending=[]
+    for job_id in os.listdir(SUMMARY_JOBS_DIR):
+        path=os.path.join(_job_dir(job_id), "job.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                job=json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping unreadable summary job {job_id}: {e}")
+            continue
+        job["_events"]=_new_events()
+        _jobs[job_id]=job
+        if job["status"] not in TERMINAL_STATES:
+            job["status"]=QUEUED
+            pending.append(job)
+    for job in sorted(pending, key=lambda j: j["created_at"]):
+        _queue.put_nowait(job["job_id"])
+    return len(pending)
+
+def start()->None:
+    '''
+    Starts the job workers and resumes unfinished jobs, called from the app lifespan
+    '''
+    global _queue
+    if _queue is not None:
+        return
+    _queue=asyncio.Queue()
+    resumed=_resume()
+    if resumed:
+        print(f"Resuming {resumed} unfinished summary jobs")
+    for _ in range(max(1, SUMMARY_JOB_WORKERS)):
+        _workers.append(asyncio.create_task(_worker()))
+
+async def stop()->None:
+    global _queue
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue=None
+    # unfinished jobs stay on disk, their event streams are ended instead of waiting forever
+    for job_id, subscribers in _subscribers.items():
+        job=_jobs.get(job_id)
+        if job is not None and job["status"] not in TERMINAL_STATES:
+            for subscriber in subscribers:
+                subscriber.put_nowait(INTERRUPTED_EVENT)
+
+def _copy_uploads(directory: str, files: List[Any])->List[str]:
+    '''
+    Runs on a worker thread, writes the uploads into the job directory
+    '''
+    os.makedirs(directory, exist_ok=True)
+    names=[]
+    for position, (filename, fileobj) in enumerate(files):
+        # prefixing the position keeps the document order and tells apart uploads with the same name
+        name=f"{position:04d}_{os.path.basename(filename)}"
+        with open(os.path.join(directory, name), "wb") as buffer:
+            shutil.copyfileobj(fileobj, buffer)
+        names.append(name)
+    return names
+
+async def create_job(files: List[Any], num_clusters: int, max_tokens: int, mode: str="abstractive", polish: bool=False)->Dict[str, Any]:
+    '''
+    input: (filename, binary file object) pairs and summary parameters
+    output: the queued job, its files are copied into the job directory so it survives a restart
+    '''
+    if _queue is None:
+        raise RuntimeError("Summary job workers are not running")
+    if mode not in summarizer_service.SUMMARY_MODES:
+        raise ValueError(f"Unknown summary mode '{mode}', expected one of {summarizer_service.SUMMARY_MODES}")
+
+    job_id=uuid.uuid4().hex
+    directory=_job_dir(job_id)
+    try:
+        names=await asyncio.to_thread(_copy_uploads, directory, files)
+    except OSError:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    now=time.time()
+    job={
+        "job_id": job_id,
+        "status": QUEUED,
+        "files": names,
+        "num_clusters": num_clusters,
+        "max_tokens": max_tokens,
+        "mode": mode,
+        "polish": polish,
+        "created_at": now,
+        "updated_at": now,
+        "progress": None,
+        "result": None,
+        "error": None,
+        "_events": _new_events(),
+    }
+    _jobs[job_id]=job
+    _save(job)
+    _queue.put_nowait(job_id)
+    return _public(job)
+
+def get_job(job_id: str)->Optional[Dict[str, Any]]:
+    job=_jobs.get(job_id)
+    return _public(job) if job is not None else None
+
+def list_jobs()->List[Dict[str, Any]]:
+    return [{k: v for k, v in _public(job).items() if k!="result"} for job in sorted(_jobs.values(), key=lambda j: j["created_at"])]
+
+def delete_job(job_id: str)->bool:
+    '''
+    Forgets a finished or queued job and removes its files, its open event streams end with DELETED_EVENT.
+    Running jobs can't be deleted.
+    '''
+    job=_jobs.get(job_id)
+    if job is None:
+        return False
+    if job["status"]==RUNNING:
+        raise ValueError("Job is running, wait for it to finish before deleting it")
+    del _jobs[job_id]
+    for subscriber in _subscribers.get(job_id, []):
+        subscriber.put_nowait(DELETED_EVENT)
+    shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+    return True
+
+async def stream_events(job_id: str)->AsyncIterator[Dict[str, Any]]:
+    '''
+    Yields the events the job produced so far, then new ones as they happen, until the job finishes
+    or the workers stop (INTERRUPTED_EVENT) or it is deleted (DELETED_EVENT)
+    '''
+    job=_jobs[job_id]
+    subscriber: asyncio.Queue=asyncio.Queue()
+    # no await between the snapshot and subscribing, so no event is missed or repeated
+    backlog=list(job["_events"])
+    _subscribers.setdefault(job_id, []).append(subscriber)
+    try:
+        yield {"stage": "status", "status": job["status"]}
+        for event in backlog:
+            yield event
+        while job["status"] not in TERMINAL_STATES:
+            if _queue is None and subscriber.empty():
+                yield INTERRUPTED_EVENT
+                return
+            event=await subscriber.get()
+            yield event
+            if event is INTERRUPTED_EVENT or event is DELETED_EVENT:
+                return
+        while not subscriber.empty():
+            yield subscriber.get_nowait()
+    finally:
+        _subscribers[job_id].remove(subscriber)
+        if not _subscribers[job_id]:
+            del _subscribers[job_id]
@@ -0,0 +1,33 @@
+import hashlib
+from typing import Dict, Any, Optional
+
+from core.config import TRANSLATION_CACHE_ENABLED, TRANSLATION_CACHE_MAX_ENTRIES, TRANSLATION_CACHE_PATH
+from core.persistent_cache import PersistentLRUCache
+from models.llm_model import model_filename
+
+# translations are only valid for the model that wrote them
+MODEL_ID=model_filename
+
+_cache=PersistentLRUCache(TRANSLATION_CACHE_PATH, max_entries=TRANSLATION_CACHE_MAX_ENTRIES)
+
+def _key(text: str, target_language: str)->str:
+    return f"{MODEL_ID}:{target_language.strip().lower()}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+def get(text: str, target_language: str)->Optional[str]:
+    if not TRANSLATION_CACHE_ENABLED:
+        return None
+    return _cache.get(_key(text, target_language))
+
+def store(text: str, target_language: str, translated_text: str)->None:
+    if not TRANSLATION_CACHE_ENABLED:
+        return
+    _cache.set(_key(text, target_language), translated_text)
+
+def clear()->None:
+    _cache.clear()
+
+def save()->None:
+    _cache.save()
+
+def get_status()->Dict[str, Any]:
+    return {"enabled": TRANSLATION_CACHE_ENABLED, **_cache.stats()}
@@ -1,39 +1,172 @@
 # services/translator_service.py
-from models.llm_model import llm_model # Assuming your LLM is initialized here
-from typing import Dict, Any
+import asyncio
+import re
+from models.llm_model import generate_completion, wait_for_llm_model
+from services import context_packer, language_id, translation_cache
+from core.config import TRANSLATION_SEGMENT_TOKENS, TRANSLATION_OUTPUT_TOKEN_RATIO, TRANSLATION_MAX_CONCURRENCY
+from typing import Dict, Any, List, Tuple, AsyncIterator
 
-model=llm_model
+# texts returned untouched because they were already in the target language
+_language_id_skips=0
+_translate_semaphore=asyncio.Semaphore(TRANSLATION_MAX_CONCURRENCY)
 
-async def translate_text(text: str, target_language: str) -> str:
+_CODE_BLOCK=re.compile(r"(^```.*?^```[^\n]*$)", re.M | re.S)
+_BLOCK_BREAK=re.compile(r"(\n[ \t]*\n\s*)")
+_SENTENCE_BREAK=re.compile(r"(?<=[.!?।])(\s+)")
+
+def _translation_prompt(text: str, target_language: str) -> str:
+    # everything before the text is the same for every segment, so llama.cpp reuses it from the KV cache
+    return (
+        "<|im_start|>system\n"
+        "You are a highly skilled and accurate language translator.\n"
+        f"Your task is to translate the provided text into {target_language}.\n"
+        "Do not add any additional commentary, conversational filler, or explanations.\n"
+        "Only provide the translated text, keeping its markdown formatting.\n"
+        f"If the text is already in {target_language}, return it as is.\n"
+        "<|im_end|>\n"
+        "<|im_start|>user\n"
+        f"Translate the following text into {target_language}:\n"
+        f"{text}<|im_end|>\n"
+        "<|im_start|>assistant\n"
+    )
+
+def _pack_sentences(block: str) -> List[Tuple[str, bool]]:
     """
-    Translates the given text into the target language using the LLM.
+    Splits a block longer than TRANSLATION_SEGMENT_TOKENS at sentence ends and packs consecutive sentences
+    back together up to that budget. The whitespace between segments is kept as an untranslated piece.
     """
-    # Construct a prompt for the LLM to perform translation
-    # It's important to be explicit and clear in the prompt.
-    prompt = f"""<|im_start|>system
-    You are a highly skilled and accurate language translator.
-    Your task is to translate the provided text into {target_language}.
-    Do not add any additional commentary, conversational filler, or explanations.
-    Only provide the translated text.
-    If the text is already in {target_language}, return it as is.
-    <|im_end|>
-    <|im_start|>user
-    Translate the following text into {target_language}:
-    "{text}"<|im_end|>
-    <|im_start|>assistant
+    parts = _SENTENCE_BREAK.split(block)
+    pieces: List[Tuple[str, bool]] = []
+    current, current_tokens = "", 0
+    for i in range(0, len(parts), 2):
+        sentence, gap = parts[i], parts[i+1] if i+1 < len(parts) else ""
+        tokens = context_packer.count_tokens(sentence)
+        if current and current_tokens + tokens > TRANSLATION_SEGMENT_TOKENS:
+            stripped = current.rstrip()
+            pieces.append((stripped, True))
+            pieces.append((current[len(stripped):], False))
+            current, current_tokens = "", 0
+        current += sentence + gap
+        current_tokens += tokens
+    if current:
+        stripped = current.rstrip()
+        pieces.append((stripped, True))
+        if len(stripped) < len(current):
+            pieces.append((current[len(stripped):], False))
+    return pieces
+
+def _split_segments(text: str) -> List[Tuple[str, bool]]:
     """
-    try:
-        # Call the LLM to get the translation
-        response = model.create_completion(
-            prompt=prompt,
+    input: text to translate
+    output: (piece, translate) pairs that join back into text. Code blocks and the whitespace between
+    markdown blocks are kept as they are, blocks are translated whole when they fit TRANSLATION_SEGMENT_TOKENS.
+    """
+    pieces: List[Tuple[str, bool]] = []
+    for i, part in enumerate(_CODE_BLOCK.split(text)):
+        if i % 2 == 1:
+            pieces.append((part, False))
+            continue
+        for j, block in enumerate(_BLOCK_BREAK.split(part)):
+            if j % 2 == 1 or not block.strip():
+                if block:
+                    pieces.append((block, False))
+            elif context_packer.count_tokens(block) > TRANSLATION_SEGMENT_TOKENS:
+                pieces.extend(_pack_sentences(block))
+            else:
+                pieces.append((block, True))
+    return pieces
+
+def _clean_output(text: str) -> str:
+    text = text.strip()
+    # the model sometimes echoes the quotes of older prompts
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        text = text[1:-1].strip()
+    return text
+
+async def _translate_segment(segment: str, target_language: str) -> str:
+    if language_id.is_in_language(segment, target_language):
+        return segment
+    cached = translation_cache.get(segment, target_language)
+    if cached is not None:
+        return cached
+    # output budget from the tokenizer count of the segment, not its character count
+    max_tokens = int(context_packer.count_tokens(segment) * TRANSLATION_OUTPUT_TOKEN_RATIO) + 16
+    async with _translate_semaphore:
+        response = await generate_completion(
+            prompt=_translation_prompt(segment, target_language),
             temperature=0.1, # Keep temperature low for deterministic translation
-            max_tokens=len(text) * 2 # Allow enough tokens for translation, roughly double the input length
+            max_tokens=max_tokens,
+            endpoint="translator"
         )
-        
-        translated_text = response['choices'][0]['text'].strip()
-        return translated_text
-    except Exception as e:
-        print(f"Error during translation in translator_service: {e}")
-        # Fallback to original text or an error message if translation fails
-        return f"Translation failed: {e}. Original text: {text}"
+    translated_text = _clean_output(response['choices'][0]['text'])
+    translation_cache.store(segment, target_language, translated_text)
+    return translated_text
+
+async def translate_text_stream(text: str, target_language: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Translates text segment by segment, all segments are generated concurrently (up to TRANSLATION_MAX_CONCURRENCY).
+    Yields {"index", "total", "text"} for every piece in order as soon as it and the ones before it are done,
+    their texts joined give the translation, then {"done": True, "translated_text", "segments", "failed_segments"}.
+    A segment that fails to translate is kept in the original language and its piece carries an "error".
+    """
+    global _language_id_skips
+    if not text.strip() or language_id.is_in_language(text, target_language):
+        _language_id_skips += 1
+        yield {"index": 0, "total": 1, "text": text}
+        yield {"done": True, "translated_text": text, "segments": 0}
+        return
+    cached = translation_cache.get(text, target_language)
+    if cached is not None:
+        yield {"index": 0, "total": 1, "text": cached}
+        yield {"done": True, "translated_text": cached, "segments": 0}
+        return
+
+    await wait_for_llm_model()
+    pieces = _split_segments(text)
+    tasks = [asyncio.create_task(_translate_segment(piece, target_language)) if translate else None for piece, translate in pieces]
+    outputs: List[str] = []
+    failed = 0
+    try:
+        for index, ((piece, _), task) in enumerate(zip(pieces, tasks)):
+            event = {"index": index, "total": len(pieces), "text": piece}
+            if task is not None:
+                try:
+                    event["text"] = await task
+                except Exception as e:
+                    print(f"Error during translation in translator_service: {e}")
+                    event["error"] = str(e)
+                    failed += 1
+            outputs.append(event["text"])
+            yield event
+    finally:
+        for task in tasks:
+            if task is not None and not task.done():
+                task.cancel()
+
+    translated_text = "".join(outputs)
+    if not failed:
+        translation_cache.store(text, target_language, translated_text)
+    yield {"done": True, "translated_text": translated_text, "segments": sum(task is not None for task in tasks), "failed_segments": failed}
+
+async def translate_text(text: str, target_language: str) -> str:
+    """
+    Translates the given text into the target language using the LLM.
+    Text already in the target language is returned as is and earlier translations come from the cache,
+    neither reaches the LLM. Long texts are split and their segments translated concurrently.
+    Raises RuntimeError when a segment fails, rather than returning a partly translated text.
+    """
+    translated_text = text
+    stream = translate_text_stream(text, target_language)
+    try:
+        async for event in stream:
+            if "error" in event:
+                raise RuntimeError(f"Segment {event['index'] + 1} of {event['total']} failed to translate: {event['error']}")
+            if event.get("done"):
+                translated_text = event["translated_text"]
+    finally:
+        # cancels the segments still being translated after a failure
+        await stream.aclose()
+    return translated_text
 
+def get_status() -> Dict[str, Any]:
+    return {"cache": translation_cache.get_status(), "language_id_skips": _language_id_skips}
@@ -0,0 +1,91 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from core.config import (
+    ASR_VAD_FRAME_MS,
+    ASR_VAD_THRESHOLD_DB,
+    ASR_VAD_SILENCE_DBFS,
+    ASR_VAD_MIN_SILENCE_MS,
+    ASR_VAD_MIN_SPEECH_MS,
+    ASR_VAD_PADDING_MS,
+)
+
+def _frame_energy_db(samples: np.ndarray, frame: int)->np.ndarray:
+    count=len(samples)//frame
+    frames=samples[:count*frame].reshape(count, frame).astype('float64')
+    return 10*np.log10(np.mean(frames**2, axis=1)+1e-10)
+
+def _speech_frames(energy_db: np.ndarray)->np.ndarray:
+    '''
+    Frames louder than the noise floor (the 10th percentile of frame energy) by ASR_VAD_THRESHOLD_DB.
+    A recording without that much dynamic range is all speech, or all silence when it is quieter than ASR_VAD_SILENCE_DBFS
+    '''
+    noise_floor=float(np.percentile(energy_db, 10))
+    loud=energy_db>ASR_VAD_SILENCE_DBFS
+    if float(np.percentile(energy_db, 90))-noise_floor<ASR_VAD_THRESHOLD_DB:
+        return loud
+    return loud & (energy_db>noise_floor+ASR_VAD_THRESHOLD_DB)
+
+def _split_at_quietest(start: int, end: int, max_frames: int, energy_db: np.ndarray)->List[Tuple[int, int]]:
+    '''
+    Splits a region of frames longer than max_frames at the quietest frame in the second half of each window
+    '''
+    pieces=[]
+    while end-start>max_frames:
+        window=energy_db[start+max_frames//2:start+max_frames]
+        cut=start+max_frames//2+int(np.argmin(window))
+        pieces.append((start, cut))
+        start=cut
+    pieces.append((start, end))
+    return pieces
+
+def speech_regions(samples: np.ndarray, sample_rate: int, max_region_seconds: float)->List[Tuple[int, int]]:
+    '''
+    input: mono float samples, their sample rate and the longest region to return
+    output: (start, end) sample offsets of the speech in the recording, padded by ASR_VAD_PADDING_MS, in order.
+    Empty when the recording is silent.
+    '''
+    frame=max(1, sample_rate*ASR_VAD_FRAME_MS//1000)
+    if len(samples)<frame:
+        return []
+    energy_db=_frame_energy_db(samples, frame)
+    speech=_speech_frames(energy_db)
+
+    edges=np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    runs=[(int(s), int(e)) for s, e in edges.reshape(-1, 2)]
+    min_silence=ASR_VAD_MIN_SILENCE_MS//ASR_VAD_FRAME_MS
+    merged: List[Tuple[int, int]]=[]
+    for start, end in runs:
+        if merged and start-merged[-1][1]<min_silence:
+            merged[-1]=(merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    min_speech=max(1, ASR_VAD_MIN_SPEECH_MS//ASR_VAD_FRAME_MS)
+    padding=ASR_VAD_PADDING_MS//ASR_VAD_FRAME_MS
+    max_frames=max(2, int(max_region_seconds*1000)//ASR_VAD_FRAME_MS)
+    regions: List[Tuple[int, int]]=[]
+    for start, end in merged:
+        if end-start<min_speech:
+            continue
+        start, end=max(0, start-padding), min(len(energy_db), end+padding)
+        for piece_start, piece_end in _split_at_quietest(start, end, max_frames, energy_db):
+            # the samples after the last whole frame belong to the last region that reaches it
+            regions.append((piece_start*frame, len(samples) if piece_end==len(energy_db) else piece_end*frame))
+    return regions
+
+def pack_regions(regions: List[Tuple[int, int]], max_samples: int)->List[List[Tuple[int, int]]]:
+    '''
+    Groups consecutive regions into segments of at most max_samples of audio, each segment is one Whisper call
+    '''
+    segments: List[List[Tuple[int, int]]]=[]
+    length=0
+    for start, end in regions:
+        if segments and length+end-start<=max_samples:
+            segments[-1].append((start, end))
+            length+=end-start
+        else:
+            segments.append([(start, end)])
+            length=end-start
+    return segments
@@ -0,0 +1,112 @@
+import itertools
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("llama_cpp")
+
+from models import batch_engine
+from models.batch_engine import BatchedGenerationEngine
+
+
+def _engine(monkeypatch, statuses, max_sequences=2, n_ctx=64):
+    """
+    An engine without a llama context, llama_decode returns the given statuses and then 0
+    """
+    engine = BatchedGenerationEngine.__new__(BatchedGenerationEngine)
+    engine.max_sequences = max_sequences
+    engine.n_ctx = n_ctx
+    engine.seq_ctx = n_ctx // max_sequences
+    engine.n_batch = 32
+    engine._ctx = None
+    engine._batch = SimpleNamespace(
+        token=[0] * 32, pos=[0] * 32, n_seq_id=[0] * 32, seq_id=[[0] for _ in range(32)], logits=[False] * 32, n_tokens=0,
+    )
+    engine._incoming, engine._queue, engine._active = [], [], {}
+    engine._counter = itertools.count()
+    engine._free_seq_ids = list(range(max_sequences))
+    engine._admit_limit = max_sequences
+    engine._cond = threading.Condition()
+    engine.total_generated_tokens = engine.total_decode_calls = engine.completed_requests = engine.kv_evictions = 0
+    engine._eos = -1
+    engine.llm = SimpleNamespace(detokenize=lambda tokens: b"x")
+
+    statuses = iter(statuses)
+    removed = []
+    monkeypatch.setattr(batch_engine.llama_cpp, "llama_decode", lambda ctx, batch: next(statuses, 0), raising=False)
+    monkeypatch.setattr(batch_engine, "_kv_seq_rm", lambda ctx, seq_id, start, end: removed.append(seq_id))
+    monkeypatch.setattr(engine, "_sample", lambda batch_index, request: 7)
+    monkeypatch.setattr(engine, "_is_end_of_generation", lambda token: False)
+    engine.removed = removed
+    return engine
+
+
+def _queue(engine, name, prompt_tokens=4, max_tokens=2):
+    request = {"name": name, "tokens": list(range(prompt_tokens)), "max_tokens": max_tokens, "temperature": 0.0,
+               "stop": [], "future": Future(), "submitted_at": 0.0}
+    engine._queue.append((0, next(engine._counter), request))
+    return request
+
+
+def test_no_kv_slot_requeues_the_newest_sequence_and_retries(monkeypatch):
+    engine = _engine(monkeypatch, statuses=[1])
+    first = _queue(engine, "first")
+    second = _queue(engine, "second")
+    engine._admit()
+    newest = max(engine._active.values(), key=lambda s: s.admitted_at)
+    older = min(engine._active.values(), key=lambda s: s.admitted_at)
+
+    engine._step()
+
+    assert list(engine._active.values()) == [older]
+    assert (older.n_past, older.pending) == (0, older.prompt_tokens)
+    assert [entry[2] for entry in engine._queue] == [newest.request]
+    assert engine.removed == [newest.seq_id]
+    assert not first["future"].done() and not second["future"].done()
+
+    # the evicted request waits until the remaining one finishes, then both complete
+    engine._admit()
+    assert len(engine._active) == 1
+    while engine._active or engine._queue:
+        engine._admit()
+        engine._step()
+    assert first["future"].result()["usage"]["completion_tokens"] == 2
+    assert second["future"].result()["usage"]["completion_tokens"] == 2
+    assert engine.kv_evictions == 1
+
+
+def test_negative_status_fails_every_sequence(monkeypatch):
+    engine = _engine(monkeypatch, statuses=[-1])
+    requests = [_queue(engine, "a"), _queue(engine, "b")]
+    engine._admit()
+
+    engine._step()
+
+    assert not engine._active
+    for request in requests:
+        with pytest.raises(RuntimeError, match="status -1"):
+            request["future"].result()
+
+
+def test_single_sequence_without_kv_space_fails(monkeypatch):
+    engine = _engine(monkeypatch, statuses=[1])
+    request = _queue(engine, "alone")
+    engine._admit()
+
+    engine._step()
+
+    assert not engine._active and not engine._queue
+    with pytest.raises(RuntimeError, match="no KV space"):
+        request["future"].result()
+
+
+def test_prompts_are_limited_to_the_per_sequence_context(monkeypatch):
+    engine = _engine(monkeypatch, statuses=[])
+    engine.llm = SimpleNamespace(tokenize=lambda text, add_bos, special: list(range(30)))
+    request = {"prompt": "long", "max_tokens": 8, "future": Future()}
+
+    assert not engine._tokenize(request)
+    with pytest.raises(ValueError, match="32 tokens of context"):
+        request["future"].result()
@@ -0,0 +1,36 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+# metrics_index imports the llama tokenizer through context_packer
+pytest.importorskip("llama_cpp")
+
+from services import eval_workspaces as workspaces
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(workspaces, "EVAL_WORKSPACES_DIR", str(tmp_path))
+    monkeypatch.setattr(workspaces, "_loaded", OrderedDict())
+    return workspaces
+
+
+def test_find_by_hash_does_not_unload_the_workspace_being_uploaded_to(store, monkeypatch):
+    source = store.get_workspace("source", create=True)
+    source.set_context(["chunk"] * 4, np.ones((4, 256), dtype="float32"), {}, "hash")
+    store.save_workspace(source)
+    store._loaded.pop("source")
+
+    target = store.get_workspace("target", create=True)
+    target.set_context(["chunk"] * 4, np.zeros((4, 256), dtype="float32"), {}, "other")
+    # room for one of the two workspaces only
+    monkeypatch.setattr(store, "EVAL_WORKSPACE_MEMORY_MB", target.memory_bytes() * 1.5 / (1024 * 1024))
+
+    found = store.find_by_hash("context_hash", "hash")
+
+    assert found.name == "source"
+    assert list(store._loaded) == ["target", "source"]
+    target.copy_context_from(found)
+    store.save_workspace(target)
+    assert list(store._loaded) == ["target"]
@@ -0,0 +1,272 @@
+import asyncio
+import threading
+import zlib
+
+import numpy as np
+import pytest
+
+from services import image_indexing_service as sync
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = iter(list(docs))
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.docs)
+
+    def batch_size(self, size):
+        return self
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCollection:
+    """
+    Stand-in for the pymongo collection, supports the queries the image index sync makes
+    """
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: dict(doc) for doc in docs}
+        self.events = []
+
+    def find(self, query, projection):
+        ids = query.get("_id", {}).get("$in")
+        docs = [doc for _id, doc in self.docs.items() if ids is None or _id in ids]
+        return FakeCursor({"_id": doc["_id"], **{k: doc[k] for k in projection if k in doc}} for doc in docs)
+
+    def watch(self, **kwargs):
+        return FakeStream(self.events)
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = list(events)
+        self.drained = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if self.events:
+            return self.events.pop(0)
+        self.drained.set()
+        return None
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.encoded = []
+        self.calls = []
+
+    def encode(self, texts, batch_size=None):
+        self.encoded.extend(texts)
+        self.calls.append(len(texts))
+        return np.array([[zlib.crc32(text.encode()) % 997, len(text), 1.0] for text in texts], dtype="float32")
+
+
+@pytest.fixture
+def embedder(monkeypatch, tmp_path):
+    fake = FakeEmbedder()
+    monkeypatch.setattr(sync, "get_embedder", lambda: fake)
+    monkeypatch.setattr(sync, "IMAGE_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(sync, "IMAGE_INDEX_PATH", str(tmp_path / "index.faiss"))
+    monkeypatch.setattr(sync, "IMAGE_STATE_PATH", str(tmp_path / "state.json"))
+    monkeypatch.setattr(sync.answer_cache, "invalidate_index", lambda name, generation: 0)
+    monkeypatch.setattr(sync, "_generation", None)
+    sync._reset_index()
+    yield fake
+    sync._reset_index()
+
+
+def _labels_by_name():
+    return {m["image_name"]: m["labels"] for m in sync._image_id_to_metadata.values()}
+
+
+def test_full_sync_finds_inserts_updates_without_updated_at_and_deletes(embedder):
+    collection = FakeCollection([
+        {"_id": 1, "image_name": "a.png", "image_path": "/img/a.png", "labels": ["cat"]},
+        {"_id": 2, "image_name": "b.png", "image_path": "/img/b.png", "labels": ["dog"]},
+        {"_id": 3, "image_name": "c.png", "image_path": "/img/c.png", "labels": ["bird"]},
+    ])
+    first = asyncio.run(sync.sync_image_index(collection))
+    assert (first["added"], first["updated"], first["removed"]) == (3, 0, 0)
+    assert len(embedder.encoded) == 3
+
+    embedder.encoded.clear()
+    collection.docs[1]["labels"] = ["lion"]
+    del collection.docs[2]
+    collection.docs[4] = {"_id": 4, "image_name": "d.png", "image_path": "/img/d.png", "labels": ["fish"]}
+    second = asyncio.run(sync.sync_image_index(collection))
+
+    assert (second["added"], second["updated"], second["removed"]) == (1, 1, 1)
+    assert len(embedder.encoded) == 2
+    assert sync._image_index.ntotal == 3
+    assert _labels_by_name() == {"a.png": ["lion"], "c.png": ["bird"], "d.png": ["fish"]}
+
+    embedder.encoded.clear()
+    unchanged = asyncio.run(sync.sync_image_index(collection))
+    assert (unchanged["added"], unchanged["updated"], unchanged["removed"]) == (0, 0, 0)
+    assert embedder.encoded == []
+
+
+def test_sync_of_reported_ids_reads_only_those_documents(embedder):
+    collection = FakeCollection([
+        {"_id": i, "image_name": f"{i}.png", "image_path": f"/img/{i}.png", "labels": [f"label {i}"]} for i in range(5)
+    ])
+    asyncio.run(sync.sync_image_index(collection))
+    embedder.encoded.clear()
+
+    collection.docs[1]["labels"] = ["changed"]
+    del collection.docs[3]
+    collection.docs[7] = {"_id": 7, "image_name": "7.png", "image_path": "/img/7.png", "labels": ["new"]}
+    result = asyncio.run(sync.sync_image_index(collection, ids=[1, 3, 7]))
+
+    assert result["mode"] == "changes"
+    assert result["documents_read"] == 2
+    assert (result["added"], result["updated"], result["removed"]) == (1, 1, 1)
+    assert len(embedder.encoded) == 2
+    assert _labels_by_name()["1.png"] == ["changed"]
+    assert "3.png" not in _labels_by_name()
+
+
+def test_metadata_change_without_new_text_is_applied_without_embedding(embedder):
+    collection = FakeCollection([{"_id": 1, "image_name": "a.png", "image_path": "/old/a.png", "labels": ["cat"]}])
+    asyncio.run(sync.sync_image_index(collection))
+    embedder.encoded.clear()
+
+    collection.docs[1]["image_path"] = "/new/a.png"
+    result = asyncio.run(sync.sync_image_index(collection, ids=[1]))
+
+    assert result["updated"] == 1
+    assert embedder.encoded == []
+    assert [m["image_path"] for m in sync._image_id_to_metadata.values()] == ["/new/a.png"]
+
+
+class FakeDatabase:
+    def __init__(self, collection):
+        self.collection = collection
+        self.hashed = 0
+
+    def command(self, name, collections):
+        self.hashed += 1
+        return {"collections": {"images": str(zlib.crc32(repr(sorted(self.collection.docs.items())).encode()))}}
+
+
+def test_full_sync_reads_and_applies_one_batch_at_a_time(embedder, monkeypatch):
+    monkeypatch.setattr(sync, "IMAGE_SYNC_BATCH_SIZE", 2)
+    collection = FakeCollection([
+        {"_id": i, "image_name": f"{i}.png", "image_path": f"/img/{i}.png", "labels": [f"label {i}"]} for i in range(5)
+    ])
+    applied = []
+    apply_changes = sync._apply_changes
+    monkeypatch.setattr(sync, "_apply_changes", lambda upserts, removed: applied.append(len(upserts)) or apply_changes(upserts, removed))
+
+    asyncio.run(sync.sync_image_index(collection))
+    assert embedder.calls == [2, 2, 1]
+    assert applied == [2, 2, 1, 0]
+
+    del collection.docs[0]
+    result = asyncio.run(sync.sync_image_index(collection))
+    assert result["removed"] == 1
+    assert sync._image_index.ntotal == 4
+
+
+def test_full_sync_is_skipped_while_the_fingerprint_is_unchanged(embedder, monkeypatch):
+    monkeypatch.setattr(sync, "_dbhash_supported", True)
+    collection = FakeCollection([{"_id": 1, "image_name": "a.png", "image_path": "/img/a.png", "labels": ["cat"]}])
+    collection.name = "images"
+    collection.database = FakeDatabase(collection)
+    asyncio.run(sync.sync_image_index(collection, skip_unchanged=True))
+
+    read = []
+    find = collection.find
+    collection.find = lambda query, projection: read.append(query) or find(query, projection)
+    unchanged = asyncio.run(sync.sync_image_index(collection, skip_unchanged=True))
+    assert unchanged["mode"] == "unchanged"
+    assert read == []
+
+    # the state saved with the index carries the fingerprint, a warm start finds it unchanged too
+    state = sync._load_state()
+    sync._reset_index()
+    sync._restore(state)
+    assert asyncio.run(sync.sync_image_index(collection, skip_unchanged=True))["mode"] == "unchanged"
+
+    collection.docs[1]["labels"] = ["lion"]
+    changed = asyncio.run(sync.sync_image_index(collection, skip_unchanged=True))
+    assert changed["mode"] == "full"
+    assert changed["updated"] == 1
+
+
+def test_change_stream_records_document_keys():
+    collection = FakeCollection([])
+    collection.events = [
+        {"operationType": "insert", "documentKey": {"_id": 1}},
+        {"operationType": "update", "documentKey": {"_id": 2}},
+        {"operationType": "delete", "documentKey": {"_id": 3}},
+    ]
+    stream = FakeStream(collection.events)
+    collection.watch = lambda **kwargs: stream
+    changes = {"ids": {}, "full": False, "active": False}
+    stop = threading.Event()
+    loop = asyncio.new_event_loop()
+    try:
+        watcher = threading.Thread(target=sync._watch_changes, args=(collection, loop, asyncio.Event(), stop, changes, threading.Lock()))
+        watcher.start()
+        assert stream.drained.wait(5)
+        assert changes["active"]
+        stop.set()
+        watcher.join(5)
+    finally:
+        loop.close()
+
+    assert changes["ids"] == {"1": 1, "2": 2, "3": 3}
+    # the stream closing asks for a full sync, changes made while it is down aren't reported
+    assert changes["full"] and not changes["active"]
+
+
+def test_failed_sync_closes_the_cursor_and_publishes_applied_batches(embedder, monkeypatch):
+    monkeypatch.setattr(sync, "IMAGE_SYNC_BATCH_SIZE", 1)
+    collection = FakeCollection([
+        {"_id": i, "image_name": f"{i}.png", "image_path": f"/img/{i}.png", "labels": [f"label {i}"]} for i in range(3)
+    ])
+    cursors = []
+    find = collection.find
+    collection.find = lambda query, projection: cursors.append(find(query, projection)) or cursors[-1]
+    encode = embedder.encode
+
+    def fail_on_second_batch(texts, batch_size=None):
+        if embedder.calls:
+            raise RuntimeError("embedder failed")
+        return encode(texts, batch_size)
+
+    monkeypatch.setattr(embedder, "encode", fail_on_second_batch)
+    with pytest.raises(RuntimeError):
+        asyncio.run(sync.sync_image_index(collection))
+
+    assert cursors[0].closed
+    assert sync._image_index.ntotal == 1
+    assert sync.get_generation() is not None
+
+
+def test_cancelled_sync_loop_stops_the_change_stream_watcher(embedder, monkeypatch):
+    monkeypatch.setattr(sync, "IMAGE_SYNC_USE_CHANGE_STREAM", True)
+    collection = FakeCollection([])
+    stream = FakeStream([])
+    collection.watch = lambda **kwargs: stream
+
+    async def scenario():
+        loop_task = asyncio.create_task(sync.run_image_sync_loop(collection))
+        assert await asyncio.to_thread(stream.drained.wait, 5)
+        loop_task.cancel()
+        await asyncio.gather(loop_task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert not [t for t in threading.enumerate() if t.name == "image-change-stream"]
@@ -0,0 +1,106 @@
+import asyncio
+import io
+import itertools
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from services import image_ingestion_service as ingestion
+
+
+class FakeCursor(list):
+    pass
+
+
+class FakeCollection:
+    """
+    Stand-in for the pymongo collection, enforces the unique name and content hash indexes on insert
+    """
+    def __init__(self):
+        self.docs = {}
+        self.ids = itertools.count(1)
+        self.indexes = []
+
+    def create_index(self, key, **kwargs):
+        self.indexes.append((key, kwargs))
+
+    def find(self, query, projection):
+        (field, condition), = query.items()
+        return FakeCursor(
+            {"image_name": doc["image_name"]} for doc in self.docs.values() if doc.get(field) in condition["$in"]
+        )
+
+    def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            doc.setdefault("_id", next(self.ids))
+        for index, doc in enumerate(docs):
+            for key in ("image_name", "content_hash"):
+                if any(other.get(key) == doc[key] for other in self.docs.values()):
+                    raise BulkWriteError({"writeErrors": [{"index": index, "code": 11000}]})
+            self.docs[doc["_id"]] = dict(doc)
+
+    def delete_many(self, query):
+        for _id in query["_id"]["$in"]:
+            self.docs.pop(_id, None)
+
+
+@pytest.fixture
+def collection(monkeypatch, tmp_path):
+    fake = FakeCollection()
+    added = []
+
+    async def add_documents(collection, docs):
+        added.extend(docs)
+        return {"embed_seconds": 0.0, "index_seconds": 0.0}
+
+    monkeypatch.setattr(ingestion, "IMAGE_UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(ingestion, "_indexes_ready", False)
+    monkeypatch.setattr(ingestion.mongodb_client, "get_image_collection", lambda: fake)
+    monkeypatch.setattr(ingestion.image_indexing_service, "add_documents", add_documents)
+    fake.added = added
+    return fake
+
+
+def _ingest(*files):
+    uploads = [(name, io.BytesIO(content)) for name, content in files]
+    return asyncio.run(ingestion.ingest_images(uploads, [["label"]] * len(uploads)))
+
+
+def test_ingest_never_overwrites_a_file_with_the_same_name(collection, tmp_path):
+    existing = tmp_path / "cat.png"
+    existing.write_bytes(b"old")
+
+    result = _ingest(("cat.png", b"new"))
+
+    assert result["ingested"] == ["cat.png"]
+    assert existing.read_bytes() == b"old"
+    doc, = collection.docs.values()
+    assert doc["image_path"] != str(existing)
+    with open(doc["image_path"], "rb") as f:
+        assert f.read() == b"new"
+    assert [key for key, _ in collection.indexes] == ["content_hash", "image_name"]
+
+
+def test_ingest_rejects_content_already_in_the_collection(collection, tmp_path):
+    _ingest(("cat.png", b"same"))
+
+    with pytest.raises(ValueError, match="same content already exist"):
+        _ingest(("copy.png", b"same"))
+    with pytest.raises(ValueError, match="more than once"):
+        _ingest(("a.png", b"twice"), ("b.png", b"twice"))
+
+    assert [doc["image_name"] for doc in collection.docs.values()] == ["cat.png"]
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_concurrent_duplicate_is_rolled_back(collection, tmp_path, monkeypatch):
+    # the checks pass but another ingest inserts the same content before this insert_many
+    monkeypatch.setattr(collection, "find", lambda query, projection: FakeCursor())
+    collection.docs[100] = {"_id": 100, "image_name": "other.png", "content_hash": ingestion.hashlib.sha256(b"dog").hexdigest()}
+
+    with pytest.raises(ValueError, match="at the same time"):
+        _ingest(("cat.png", b"cat"), ("dog.png", b"dog"))
+
+    assert list(collection.docs) == [100]
+    assert list(tmp_path.iterdir()) == []
+    assert collection.added == []
@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+import pytest
+
+from services import image_metadata_cache as cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(cache, "_files", {})
+    monkeypatch.setattr(cache, "_checked_at", {})
+    monkeypatch.setattr(cache, "_missing", {})
+    monkeypatch.setattr(cache, "_stats", {"hits": 0, "misses": 0, "negative_hits": 0, "stale": 0})
+
+
+def test_file_replaced_at_the_same_path_is_stat_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "IMAGE_FILE_REVALIDATE_SECONDS", 0)
+    path = tmp_path / "cat.png"
+    path.write_bytes(b"old")
+    cache.set_known_images({"cat.png": str(path)})
+
+    first = asyncio.run(cache.get_image_file("cat.png"))
+    assert asyncio.run(cache.get_image_file("cat.png")) is first
+
+    path.write_bytes(b"replaced")
+    os.utime(path, (first["mtime"] + 10, first["mtime"] + 10))
+    second = asyncio.run(cache.get_image_file("cat.png"))
+
+    assert second["size"] == len(b"replaced")
+    assert second["mtime"] == first["mtime"] + 10
+    assert cache.get_status()["stale"] == 1
+
+
+def test_deleted_file_is_not_served_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "IMAGE_FILE_REVALIDATE_SECONDS", 0)
+    path = tmp_path / "cat.png"
+    path.write_bytes(b"cat")
+    cache.set_known_images({"cat.png": str(path)})
+    asyncio.run(cache.get_image_file("cat.png"))
+
+    path.unlink()
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(cache.get_image_file("cat.png"))
+
+
+def test_hits_within_the_revalidate_window_skip_the_filesystem(tmp_path, monkeypatch):
+    path = tmp_path / "cat.png"
+    path.write_bytes(b"cat")
+    cache.set_known_images({"cat.png": str(path)})
+    first = asyncio.run(cache.get_image_file("cat.png"))
+
+    def fail(info):
+        raise AssertionError("file checked within the revalidate window")
+
+    monkeypatch.setattr(cache, "_is_current", fail)
+    for _ in range(3):
+        assert asyncio.run(cache.get_image_file("cat.png")) is first
+    assert cache.get_status()["hits"] == 3
+
+    # an ingest or sync that changes the image drops the entry without waiting for the window
+    cache.invalidate("cat.png")
+    path.write_bytes(b"replaced")
+    assert asyncio.run(cache.get_image_file("cat.png"))["size"] == len(b"replaced")
+
+
+def test_negative_hits_raise_a_new_exception(tmp_path):
+    cache.set_known_images({"gone.png": str(tmp_path / "gone.png")})
+    errors = []
+    for _ in range(3):
+        with pytest.raises(FileNotFoundError, match="not found on server") as info:
+            asyncio.run(cache.get_image_file("gone.png"))
+        errors.append(info.value)
+
+    assert cache.get_status()["negative_hits"] == 2
+    assert len({id(error) for error in errors}) == 3
+    assert all(len(list(_frames(error))) == len(list(_frames(errors[1]))) for error in errors[1:])
+
+
+def _frames(error):
+    tb = error.__traceback__
+    while tb is not None:
+        yield tb
+        tb = tb.tb_next
@@ -0,0 +1,33 @@
+import json
+import threading
+
+from core import persistent_cache
+from core.persistent_cache import PersistentLRUCache
+
+
+def test_throttled_save_runs_off_the_calling_thread(tmp_path, monkeypatch):
+    path = tmp_path / "cache.json"
+    cache = PersistentLRUCache(str(path), save_interval=0)
+    writing = threading.Event()
+    release = threading.Event()
+    writers = []
+    dump = json.dump
+
+    def slow_dump(payload, f, **kwargs):
+        writers.append(threading.current_thread())
+        writing.set()
+        assert release.wait(5)
+        dump(payload, f, **kwargs)
+
+    monkeypatch.setattr(persistent_cache.json, "dump", slow_dump)
+
+    # returns while the background save is still writing
+    cache.set("a", 1)
+    assert writing.wait(5)
+    assert writers[0] is not threading.current_thread()
+    cache.set("b", 2)
+
+    release.set()
+    cache.save()
+    assert [key for key, _, _ in json.loads(path.read_text())] == ["a", "b"]
+    assert PersistentLRUCache(str(path)).get("b") == 2
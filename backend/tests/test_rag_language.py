@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+# rag_service imports the llama model helpers and pymupdf
+pytest.importorskip("llama_cpp")
+pytest.importorskip("pymupdf")
+
+from services import rag_service
+
+
+@pytest.fixture
+def translations(monkeypatch):
+    calls = []
+
+    async def translate_text(text, language):
+        calls.append((text, language))
+        return "अनुवादित उत्तर"
+
+    monkeypatch.setattr(rag_service, "RAG_LANGUAGE_FALLBACK_ENABLED", True)
+    monkeypatch.setattr(rag_service.translator_service, "translate_text", translate_text)
+    return calls
+
+
+def test_out_of_script_answer_is_translated_once(translations):
+    answer = asyncio.run(rag_service._ensure_language("The report covers the third quarter.", "Hindi"))
+
+    assert answer == "अनुवादित उत्तर"
+    assert translations == [("The report covers the third quarter.", "Hindi")]
+
+
+def test_in_script_answer_is_not_translated(translations):
+    answer = asyncio.run(rag_service._ensure_language("रिपोर्ट तीसरी तिमाही को कवर करती है।", "Hindi"))
+
+    assert answer == "रिपोर्ट तीसरी तिमाही को कवर करती है।"
+    assert translations == []
+
+
+def test_no_answer_sentinel_is_localised_without_translation(translations):
+    assert "पर्याप्त संदर्भ नहीं है" in rag_service._build_prompt("", "", "question", "Hindi")
+
+    answer = asyncio.run(rag_service._ensure_language(' "Insufficient context" ', "Tamil"))
+
+    assert answer == rag_service._no_answer_message("insufficient_context", "Tamil")
+    assert translations == []
@@ -0,0 +1,58 @@
+import asyncio
+import io
+import os
+
+import pytest
+
+# summarizer_service loads the llama model helpers and pymupdf
+pytest.importorskip("llama_cpp")
+pytest.importorskip("pymupdf")
+
+from services import summary_jobs as jobs
+
+
+@pytest.fixture
+def workers(monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs, "SUMMARY_JOBS_DIR", str(tmp_path))
+    monkeypatch.setattr(jobs, "_jobs", {})
+    monkeypatch.setattr(jobs, "_subscribers", {})
+    monkeypatch.setattr(jobs, "_workers", [])
+    monkeypatch.setattr(jobs, "_queue", None)
+    return jobs
+
+
+def test_deleting_a_queued_job_ends_its_stream_and_stop_still_runs(workers):
+    async def scenario():
+        # no workers take the job from the queue, it stays queued
+        workers._queue = asyncio.Queue()
+        job = await workers.create_job([("a.pdf", io.BytesIO(b"pdf"))], 2, 100)
+        events = []
+
+        async def listen():
+            async for event in workers.stream_events(job["job_id"]):
+                events.append(event)
+
+        listener = asyncio.create_task(listen())
+        await asyncio.sleep(0)
+        assert workers.delete_job(job["job_id"])
+        await asyncio.wait_for(listener, 1)
+        await workers.stop()
+        return events
+
+    events = asyncio.run(scenario())
+
+    assert events[-1] is workers.DELETED_EVENT
+    assert workers._subscribers == {}
+
+
+def test_finished_job_keeps_only_its_final_event(workers, monkeypatch):
+    monkeypatch.setattr(workers, "SUMMARY_JOB_MAX_EVENTS", 3)
+    job = {"job_id": "j", "_events": workers._new_events()}
+    os.makedirs(workers._job_dir("j"), exist_ok=True)
+
+    for index in range(10):
+        workers._on_progress(job, {"stage": "map", "index": index})
+    assert [event["index"] for event in job["_events"]] == [7, 8, 9]
+
+    workers._set_state(job, workers.DONE, result="summary")
+    assert list(job["_events"]) == [{"stage": "status", "status": workers.DONE, "result": "summary"}]
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+# translator_service imports the llama model helpers
+pytest.importorskip("llama_cpp")
+
+from services import translator_service
+
+
+@pytest.fixture
+def one_failing_segment(monkeypatch):
+    async def ready():
+        return None
+
+    async def translate_segment(segment, target_language):
+        if segment == "second":
+            raise RuntimeError("model unavailable")
+        return segment.upper()
+
+    monkeypatch.setattr(translator_service, "wait_for_llm_model", ready)
+    monkeypatch.setattr(translator_service, "_split_segments", lambda text: [("first", True), ("\n\n", False), ("second", True)])
+    monkeypatch.setattr(translator_service, "_translate_segment", translate_segment)
+    monkeypatch.setattr(translator_service.translation_cache, "get", lambda text, language: None)
+    stored = []
+    monkeypatch.setattr(translator_service.translation_cache, "store", lambda *args: stored.append(args))
+    return stored
+
+
+def test_translate_text_raises_when_a_segment_fails(one_failing_segment):
+    with pytest.raises(RuntimeError, match="Segment 3 of 3 failed to translate"):
+        asyncio.run(translator_service.translate_text("first\n\nsecond", "Tamil"))
+    assert one_failing_segment == []
+
+
+def test_stream_reports_the_failed_segment(one_failing_segment):
+    async def collect():
+        return [event async for event in translator_service.translate_text_stream("first\n\nsecond", "Tamil")]
+
+    events = asyncio.run(collect())
+
+    assert [event.get("error") for event in events[:3]] == [None, None, "model unavailable"]
+    assert events[2]["text"] == "second"
+    assert events[-1]["done"] and events[-1]["failed_segments"] == 1
+    assert events[-1]["translated_text"] == "FIRST\n\nsecond"
@@ -9,43 +9,12 @@ import osmnx as ox
 import pickle
 from datetime import datetime
 from typing import Optional, Dict, Any, Tuple
-import whisper
 import tempfile
 from gtts import gTTS
 
-model_audio=whisper.load_model("base")
-
 # --- Configuration ---
 FASTAPI_URL = "http://127.0.0.1:8000" # Ensure your FastAPI backend is running on this host and port.
 
-def translate_text_if_needed(text: str, target_language: str) -> str:
-    """
-    Translates text to the target language if it's not English.
-    Returns the original text if target language is English or translation fails.
-    """
-    if target_language.lower() == "english" or not text.strip():
-        return text
-    
-    try:
-        # Call the translation endpoint
-        payload = {
-            "text": text,
-            "target_language": target_language
-        }
-        
-        response = requests.post(f"{FASTAPI_URL}/translator/translate_text/", json=payload)
-        response.raise_for_status()
-        
-        translation_result = response.json()
-        return translation_result.get("translated_text", text)
-        
-    except requests.exceptions.RequestException as e:
-        st.warning(f"Translation failed: {e}. Showing original text.")
-        return text
-    except Exception as e:
-        st.warning(f"Translation error: {e}. Showing original text.")
-        return text
-
 class SimpleMapGenerator:
     """
     Generates a basic interactive map of a given city using Folium and OSMnx.
@@ -452,12 +421,11 @@ elif st.session_state.page == "RAG Chatbot":
                                 try:
                                     # Extract image name for display
                                     image_name_from_url = os.path.basename(image_url)
-                                    # Create an expander for each image
-                                    with st.expander(f"View {image_name_from_url}", expanded=False):
-                                        # Display full-size image inside the expander
-                                        st.image(image_url, caption=f"Full Size: {image_name_from_url}", use_container_width=True)
-                                        # Optionally, fetch and display more metadata here if the backend provided it
-                                        # (e.g., if image_urls also included dicts with 'image_name', 'labels' etc.)
+                                    # Show the backend's thumbnail in the grid, the full size file is only fetched when opened
+                                    st.image(f"{image_url}?size=thumb", caption=image_name_from_url, use_container_width=True)
+                                    st.markdown(f"[View full size]({image_url})")
+                                    # Optionally, fetch and display more metadata here if the backend provided it
+                                    # (e.g., if image_urls also included dicts with 'image_name', 'labels' etc.)
                                 except Exception as img_e:
                                     st.warning(f"Could not display image from {image_url}: {img_e}")
                     
@@ -648,13 +616,26 @@ elif st.session_state.page == "RAG Chatbot":
         if audio_hash != st.session_state.last_processed_audio:
             with st.spinner("Transcribing audio..."):
                 try:
-                    # Create temporary file for audio processing
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-                        tmp_file.write(audio_bytes)
-                        tmp_file_path = tmp_file.name
-                    
-                    # Transcribe audio
-                    result = model_audio.transcribe(tmp_file_path)
+                    # Transcribed by the backend ASR worker: silence is trimmed and partial transcripts stream in per segment
+                    response = requests.post(
+                        f"{FASTAPI_URL}/asr/transcribe_stream/",
+                        files={"file": (audio_input.name or "recording.wav", audio_bytes, audio_input.type or "audio/wav")},
+                        stream=True
+                    )
+                    response.raise_for_status()
+                    partial_placeholder = st.empty()
+                    result = {}
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        event = json.loads(line)
+                        if event.get("stage") == "partial" and event.get("transcript"):
+                            partial_placeholder.caption(f"Transcribing ({event.get('index', 0) + 1}/{event.get('total', '?')}): {event.get('transcript')}")
+                        elif event.get("done"):
+                            if event.get("error"):
+                                raise requests.exceptions.RequestException(event["error"])
+                            result = event
+                    partial_placeholder.empty()
                     
                     if result and result.get("text") and result["text"].strip():
                         transcribed_text = result["text"].strip()
@@ -672,16 +653,10 @@ elif st.session_state.page == "RAG Chatbot":
                         st.error("Audio not clearly transcribable. Please try again.")
                         st.session_state.last_processed_audio = audio_hash  # Mark as processed to avoid retry
                         
-                except Exception as e:
-                    st.error(f"Error processing audio: {e}")
+                except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                    # ValueError covers truncated NDJSON lines (json.JSONDecodeError)
+                    st.error(f"Error transcribing audio: {e}")
                     st.session_state.last_processed_audio = audio_hash  # Mark as processed to avoid retry
-                finally:
-                    # Clean up temporary file
-                    try:
-                        if 'tmp_file_path' in locals():
-                            os.unlink(tmp_file_path)
-                    except Exception:
-                        pass
 
     # Use pending transcription if available
     if st.session_state.pending_transcription and not chat_input:
@@ -717,7 +692,8 @@ elif st.session_state.page == "RAG Chatbot":
                 payload = {
                     "question": chat_input,
                     "history": formatted_history_for_backend,
-                    "max_tokens": max_tokens
+                    "max_tokens": max_tokens,
+                    "output_language": st.session_state.output_language
                 }
                 
                 response = requests.post(f"{FASTAPI_URL}/rag/chat/", json=payload)
@@ -729,10 +705,7 @@ elif st.session_state.page == "RAG Chatbot":
                 # Check if 'answer' key exists, provide default if not
                 ai_response_text = backend_response_data.get("answer", "Error: No answer from AI.")
 
-            # TRANSLATION LOGIC - Translate the AI response if needed
-                if st.session_state.output_language != "English":
-                    with st.spinner(f"Translating to {st.session_state.output_language}..."):
-                        ai_response_text = translate_text_if_needed(ai_response_text, st.session_state.output_language)
+                # The answer is generated in the output language, the backend translates it itself if the model didn't comply
 
                 # Get image URLs, provide empty list if not present
                 returned_image_urls = backend_response_data.get("image_urls", [])
@@ -833,6 +806,7 @@ elif st.session_state.page == "Evaluation Assistant":
     st.markdown("---")
 
     st.write("Upload your **context file** (PDF/JSON) and **metrics JSON file** together to begin evaluation.")
+    eval_workspace = st.text_input("Workspace", value="default", key="eval_workspace", help="Evaluations in different workspaces don't overwrite each other, files already processed in a workspace can be reused by name.")
 
     col1, col2 = st.columns(2)
     with col1:
@@ -862,7 +836,7 @@ elif st.session_state.page == "Evaluation Assistant":
                         'metrics_file': st.session_state.eval_metrics_file_data
                     }
                     
-                    response = requests.post(f"{FASTAPI_URL}/evaluator/upload_eval_files/", files=files)
+                    response = requests.post(f"{FASTAPI_URL}/evaluator/upload_eval_files/", files=files, params={"workspace": eval_workspace})
                     response.raise_for_status()
 
                     st.success(f"Context and Metrics files processed successfully! You can now ask questions.")
@@ -918,7 +892,8 @@ elif st.session_state.page == "Evaluation Assistant":
                     payload_data = {
                         "question": eval_chat_input,
                         "history": history_payload,
-                        "max_tokens": max_tokens
+                        "max_tokens": max_tokens,
+                        "workspace": eval_workspace
                     }
 
                     response = requests.post(f"{FASTAPI_URL}/evaluator/ask_evaluation/", json=payload_data)